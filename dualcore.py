@@ -0,0 +1,142 @@
+"""Display, and optionally logging, on the second core of the RP2040.
+
+Core 0 keeps polling the BMS and switching relays. Once per cycle it
+publishes its Telemetry into a shared snapshot; core 1 copies the newest
+snapshot into its own record, renders the LCD from it and sends the frame
+over SPI, and optionally runs the log and config writes. Both copies are
+done under one lock, which is held only for copying the attributes, so
+rendering never delays control on core 0. With logging on core 1, records
+core 0 logs itself (profiler and idle statistics) are queued in the handoff
+and written by core 1, the DataLogger is never touched from both cores.
+"""
+import _thread
+import time
+import models
+
+
+class Handoff:
+    """Latest telemetry of core 0 with a sequence number, lock protected."""
+
+    def __init__(self, queue_size: int = 16) -> None:
+        self.lock = _thread.allocate_lock()
+        self.shared = models.Telemetry()
+        self.sequence = 0
+        self.records = []
+        self.queue_size = queue_size
+        self.dropped = 0
+
+    def publish(self, telemetry: models.Telemetry) -> None:
+        self.lock.acquire()
+        self.shared.copy_from(telemetry)
+        self.sequence += 1
+        self.lock.release()
+
+    def take(self, telemetry: models.Telemetry, seen: int) -> int:
+        """Copy the snapshot into telemetry if it is newer than seen, returns its sequence."""
+        if self.sequence == seen:
+            return seen
+        self.lock.acquire()
+        telemetry.copy_from(self.shared)
+        sequence = self.sequence
+        self.lock.release()
+        return sequence
+
+    def log(self, values) -> None:
+        """Queue a record for core 1 to log, DataLogger.log signature.
+
+        The values are copied, so values may be reset right after.
+        """
+        record = dict(values.items())
+        self.lock.acquire()
+        if len(self.records) < self.queue_size:
+            self.records.append(record)
+        else:
+            self.dropped += 1
+        self.lock.release()
+
+    def drain(self, logger: models.DataLogger) -> None:
+        """Log the queued records, on core 1 or after it stopped."""
+        if not self.records:
+            return
+        self.lock.acquire()
+        records = self.records
+        self.records = []
+        self.lock.release()
+        for record in records:
+            logger.log(record)
+
+
+class Core1:
+    """Loop of core 1: take snapshots, run log on every new one, render every period_ms.
+
+    render is called with None like a timer callback, log with the snapshot.
+    The snapshot is the Telemetry the LCD was created with.
+    """
+
+    def __init__(
+        self,
+        lcd: models.LCD,
+        handoff: Handoff,
+        render=None,
+        log=None,
+        period_ms: int = 1000,
+        poll_ms: int = 20,
+    ) -> None:
+        self.lcd = lcd
+        self.handoff = handoff
+        self.render = lcd._update_screen if render is None else render
+        self.log = log
+        self.period_ms = period_ms
+        self.poll_ms = poll_ms
+        self.running = False
+        self.stopped = True
+        self.seen = 0
+        self.snapshots = 0
+        self.renders = 0
+        self.render_max_us = 0
+
+    def start(self) -> None:
+        self.running = True
+        self.stopped = False
+        _thread.start_new_thread(self._run, ())
+
+    def stop(self, timeout_ms: int = 5000) -> bool:
+        """Ask the loop to end and wait for it, False on timeout."""
+        self.running = False
+        start = time.ticks_ms()
+        while not self.stopped:
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                return False
+            time.sleep_ms(self.poll_ms)
+        return True
+
+    def _run(self) -> None:
+        due = time.ticks_ms()
+        try:
+            while self.running:
+                sequence = self.handoff.take(self.lcd.telemetry, self.seen)
+                if sequence != self.seen:
+                    self.seen = sequence
+                    self.snapshots += 1
+                    if self.log is not None:
+                        self.log(self.lcd.telemetry)
+                now = time.ticks_ms()
+                if time.ticks_diff(now, due) >= 0:
+                    start = time.ticks_us()
+                    self.render(None)
+                    elapsed = time.ticks_diff(time.ticks_us(), start)
+                    if elapsed > self.render_max_us:
+                        self.render_max_us = elapsed
+                    self.renders += 1
+                    due = time.ticks_add(due, self.period_ms)
+                    if time.ticks_diff(now, due) > 0:
+                        due = time.ticks_add(now, self.period_ms)
+                time.sleep_ms(self.poll_ms)
+        finally:
+            self.stopped = True
+
+    def __str__(self) -> str:
+        return (
+            f"core1    snapshots {self.snapshots:6d} renders {self.renders:6d} render max {self.render_max_us:7d} us"
+            f" log dropped {self.handoff.dropped}"
+        )
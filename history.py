@@ -0,0 +1,303 @@
+"""Telemetry history: every cycle in a RAM ring, per-minute statistics and daily archives.
+
+Samples are integers: unix time [s], SOC [0.1 %], current [0.01 A],
+voltage [0.01 V], meter pulse counts of L1 and L2 rescaled to the nominal
+2 s cycle (as ControlLogic sees them, whatever the poll interval) and relay
+bitmask.
+
+Archive file ``history/YYYYMMDD.tlm`` holds one day of samples encoded as
+deltas. Every record starts with a byte: bit 7 clear means a mask of fields
+that changed (bit n for field n), followed by zigzag varints of their deltas;
+bit 7 set means the previous sample repeats (low 7 bits + 1) times and a zero
+byte restarts deltas from zero (reboot during the day). Field 0 is
+the change of the time step, so a steady 2 s cycle costs nothing. Stable
+readings take a bit over one byte per 2 s sample, ~40 kB a day.
+"""
+import os
+import time
+from array import array
+
+MAGIC = b"TLM\x01"
+FIELDS = 7  # time, soc, current, voltage, count_L1, count_L2, relays
+TYPECODES = "LHiHHHB"  # Current is 32 bit, summed over several packs it exceeds 327.67 A
+DIRECTORY = "history"
+REPEAT = 0x80
+RESET = 0x00  # Never a mask, unchanged sample is a repeat
+MAX_REPEAT = 0x80
+
+
+def zigzag(value: int) -> int:
+    """Map signed int to unsigned so small magnitudes encode short."""
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class TelemetryRing:
+    """Last capacity samples in preallocated arrays, oldest overwritten."""
+
+    def __init__(self, capacity: int = 900) -> None:
+        self.capacity = capacity
+        self.columns = [array(code, [0] * capacity) for code in TYPECODES]
+        self.count = 0
+        self.head = 0
+
+    def append(self, sample) -> None:
+        head = self.head
+        for index in range(FIELDS):
+            self.columns[index][head] = sample[index]
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def get(self, age: int, field: int) -> int:
+        """Field of sample age cycles old, 0 is the newest."""
+        if age >= self.count:
+            raise IndexError(age)
+        return self.columns[field][(self.head - 1 - age) % self.capacity]
+
+
+class MinuteStats:
+    """Min/max/average per minute of SOC, current and voltage.
+
+    Keeps the last capacity minutes; pulse counts per 2 s cycle are
+    averaged and relay bitmasks or-ed over the minute.
+    """
+
+    def __init__(self, capacity: int = 120) -> None:
+        self.capacity = capacity
+        self.minute = array("L", [0] * capacity)
+        self.minimum = [array(code, [0] * capacity) for code in "HiH"]
+        self.maximum = [array(code, [0] * capacity) for code in "HiH"]
+        self.average = [array(code, [0] * capacity) for code in "HiH"]
+        self.pulses = [array("L", [0] * capacity) for _ in range(2)]
+        self.relays = array("B", [0] * capacity)
+        self.count = 0
+        self.head = 0
+        self.current_minute = -1
+        self.samples = 0
+        self.low = [0, 0, 0]
+        self.high = [0, 0, 0]
+        self.total = [0, 0, 0]
+        self.pulse_total = [0, 0]
+        self.relays_on = 0
+
+    def add(self, sample) -> None:
+        minute = sample[0] // 60
+        if minute != self.current_minute:
+            self.close()
+            self.current_minute = minute
+        if not self.samples:
+            for index in range(3):
+                self.low[index] = self.high[index] = sample[index + 1]
+        for index in range(3):
+            value = sample[index + 1]
+            if value < self.low[index]:
+                self.low[index] = value
+            if value > self.high[index]:
+                self.high[index] = value
+            self.total[index] += value
+        self.pulse_total[0] += sample[4]
+        self.pulse_total[1] += sample[5]
+        self.relays_on |= sample[6]
+        self.samples += 1
+
+    def close(self) -> None:
+        """Store statistics of the running minute."""
+        if not self.samples:
+            return
+        head = self.head
+        self.minute[head] = self.current_minute
+        for index in range(3):
+            self.minimum[index][head] = self.low[index]
+            self.maximum[index][head] = self.high[index]
+            self.average[index][head] = self.total[index] // self.samples
+            self.total[index] = 0
+        for index in range(2):
+            self.pulses[index][head] = self.pulse_total[index] // self.samples
+            self.pulse_total[index] = 0
+        self.relays[head] = self.relays_on
+        self.relays_on = 0
+        self.samples = 0
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+
+class Archive:
+    """Delta and varint encoded daily archive files, written in blocks.
+
+    Only the newest days files are kept, older ones are deleted when a new
+    day starts. When a write fails the buffered bytes are dropped and the
+    file continues with a reset, so a full flash loses samples, not the
+    archive format.
+    """
+
+    def __init__(self, directory: str = DIRECTORY, block_size: int = 512, days: int = 14) -> None:
+        self.directory = directory
+        self.block_size = block_size
+        self.days = days
+        # Room for one more sample past block_size, samples are only encoded below it
+        self.buffer = bytearray(block_size + 8 * FIELDS + 8)
+        self.used = 0
+        self.dropped = 0
+        self.previous = [0] * FIELDS
+        self.step = 0
+        self.repeat = 0
+        self.day = -1
+        self.filename = None
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass
+
+    def _byte(self, value: int) -> None:
+        self.buffer[self.used] = value
+        self.used += 1
+
+    def _varint(self, value: int) -> None:
+        while value > 0x7F:
+            self._byte((value & 0x7F) | 0x80)
+            value >>= 7
+        self._byte(value)
+
+    def _repeats(self) -> None:
+        if self.repeat:
+            self._byte(REPEAT | (self.repeat - 1))
+            self.repeat = 0
+
+    def _start_day(self, timestamp: int, day: int) -> None:
+        self.close()
+        tt = time.localtime(timestamp)
+        self.filename = f"{self.directory}/{tt[0]:04d}{tt[1]:02d}{tt[2]:02d}.tlm"
+        self.day = day
+        self._prune()
+        self._restart()
+
+    def _restart(self) -> None:
+        """Start deltas from zero, with MAGIC for a new file."""
+        self.previous = [0] * FIELDS
+        self.step = 0
+        self.repeat = 0
+        self.used = 0
+        try:
+            new = os.stat(self.filename)[6] == 0
+        except OSError:
+            new = True
+        if new:
+            self.buffer[0 : len(MAGIC)] = MAGIC
+            self.used = len(MAGIC)
+        else:
+            # Reboot in the middle of a day or lost block, continue file from zero base.
+            self._byte(RESET)
+
+    def _prune(self) -> None:
+        """Delete the oldest day files so that with the new one days are kept."""
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(".tlm"))
+        except OSError:
+            return
+        current = self.filename[len(self.directory) + 1 :]
+        if current in names:
+            names.remove(current)
+        for name in names[: max(len(names) - self.days + 1, 0)]:
+            try:
+                os.remove(f"{self.directory}/{name}")
+            except OSError:
+                pass
+
+    def add(self, sample) -> None:
+        """Encode sample, a new file is started when the day changes."""
+        day = sample[0] // 86400
+        if day != self.day:
+            self._start_day(sample[0], day)
+        elif self.used > self.block_size:
+            self._restart()  # Never reached while flush empties the buffer, keeps _byte in bounds
+        previous = self.previous
+        step = sample[0] - previous[0]
+        mask = 0
+        if step != self.step:
+            mask = 1
+        for index in range(1, FIELDS):
+            if sample[index] != previous[index]:
+                mask |= 1 << index
+        if not mask:
+            self.repeat += 1
+            if self.repeat == MAX_REPEAT:
+                self._repeats()
+        else:
+            self._repeats()
+            self._byte(mask)
+            if mask & 1:
+                self._varint(zigzag(step - self.step))
+            for index in range(1, FIELDS):
+                if mask & (1 << index):
+                    self._varint(zigzag(sample[index] - previous[index]))
+        self.step = step
+        for index in range(FIELDS):
+            previous[index] = sample[index]
+        if self.used >= self.block_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write encoded bytes to the day file, pending repeats stay buffered."""
+        if self.used and self.filename is not None:
+            try:
+                with open(self.filename, "ab") as f:
+                    f.write(memoryview(self.buffer)[: self.used])
+            except OSError:
+                self.dropped += 1
+                self._restart()
+                raise
+            self.used = 0
+
+    def close(self) -> None:
+        """Finish the day file."""
+        self._repeats()
+        self.flush()
+
+
+class History:
+    """Feeds every cycle into the ring, minute statistics and archive."""
+
+    def __init__(self, capacity: int = 900, minutes: int = 120, directory: str = DIRECTORY, days: int = 14) -> None:
+        self.ring = TelemetryRing(capacity)
+        self.minutes = MinuteStats(minutes)
+        self.archive = Archive(directory, days=days)
+        self.sample = [0] * FIELDS
+
+    def record(
+        self,
+        timestamp: int,
+        soc: int,
+        current: int,
+        voltage: int,
+        count_L1: int,
+        count_L2: int,
+        relays: int,
+    ) -> None:
+        """Add one cycle, values in protocol units as kept in Telemetry."""
+        sample = self.sample
+        sample[0] = timestamp
+        sample[1] = soc
+        sample[2] = current
+        sample[3] = voltage
+        sample[4] = count_L1
+        sample[5] = count_L2
+        sample[6] = relays
+        self.ring.append(sample)
+        self.minutes.add(sample)
+        try:
+            self.archive.add(sample)
+        except OSError as e:
+            print("Error writing history:", e)
+
+    def flush(self) -> None:
+        """Write everything buffered, used on shutdown."""
+        self.minutes.close()
+        try:
+            self.archive.close()
+        except OSError as e:
+            print("Error writing history:", e)
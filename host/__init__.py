@@ -0,0 +1,41 @@
+"""Host-side stand-ins for running the Pico firmware on CPython."""
+import builtins
+import gc
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(ROOT, "host", "stubs")
+LIB = os.path.join(ROOT, "lib")
+
+HEAP_SIZE = 192 * 1024  # Roughly what MicroPython leaves for the heap on RP2040.
+
+
+def _mem_alloc() -> int:
+    """Bytes allocated as seen by tracemalloc (0 when not tracing)."""
+    import tracemalloc
+
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def install() -> None:
+    """Make firmware modules importable on CPython.
+
+    Puts the stand-in ``machine``, ``framebuf``, ``ubinascii``, ``ujson`` and
+    ``micropython`` modules and ``lib/`` on ``sys.path``, provides the ``const``
+    builtin and the MicroPython extensions of ``time`` and ``gc``.
+    """
+    for path in (ROOT, LIB, STUBS):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    if not hasattr(builtins, "const"):
+        builtins.const = lambda value: value
+    if not hasattr(gc, "mem_free"):
+        gc.mem_alloc = _mem_alloc
+        gc.mem_free = lambda: HEAP_SIZE - _mem_alloc()
+    if not hasattr(time, "ticks_ms"):
+        import machine
+        from host.clock import HostClock
+
+        HostClock().install().pollers.append(machine.Timer.service)
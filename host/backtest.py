@@ -0,0 +1,284 @@
+"""Backtest ControlLogic thresholds against recorded telemetry with NumPy.
+
+Usage::
+
+    python -m host.backtest history/*.tlm --verify \\
+        --sweep heaters_on=88,90,92 heaters_off=80,83 charge_current=15,22
+
+Decisions of ``heaters_logic`` and ``off_grid_logic`` are evaluated for all
+samples at once. Relay states follow from a parallel prefix composition of
+per-sample transition tables which are generated by running the real
+``OutputHeaters.set_pins``, so the result is identical to replaying the
+scalar firmware code cycle by cycle (``--verify`` checks that). With fixed
+2 s polling the minimum time between switching heaters on
+(``main.MIN_SWITCH_MS``) never holds one back; samples recorded closer
+together by adaptive polling are replayed without it.
+
+Energy model, per sample held until the next one: heater load is the sum of
+powers of active heaters, PV surplus is the battery charging power
+(current * voltage when positive) and the part of heater load not covered by
+surplus is taken from the grid, or from the battery while off grid.
+"""
+import argparse
+import dataclasses
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import host
+
+host.install()
+
+import machine  # noqa: E402
+import models  # noqa: E402
+from host.history import read_archive  # noqa: E402
+
+PIN_INDEXES_L1 = (0, 2)  # As in main.init_heaters
+PIN_INDEXES_L2 = (1,)
+HEATERS = 3
+HEATER_WATTS = (2000.0, 2000.0, 2000.0)
+NONE = 1  # Code of ``None`` overpower state, -1 and 0 keep their value
+
+
+@dataclasses.dataclass(frozen=True)
+class Thresholds:
+    """Keyword arguments of ``models.ControlLogic``."""
+
+    heaters_on: float = 90
+    heaters_off: float = 83
+    off_grid_on: float = 40
+    off_grid_off: float = 30
+    charge_current: float = 22
+    discharge_current: float = -35
+    idle_current: float = 6
+    full_soc: float = 97
+    overpower_warning: int = 12
+    overpower_limit: int = 26
+
+
+@dataclasses.dataclass
+class Telemetry:
+    """Recorded samples in units of the firmware log (%, A, V)."""
+
+    time: np.ndarray
+    soc: np.ndarray
+    current: np.ndarray
+    voltage: np.ndarray
+    count_L1: np.ndarray
+    count_L2: np.ndarray
+
+    @classmethod
+    def from_archives(cls, paths: list[str]) -> "Telemetry":
+        samples = np.array([sample for path in sorted(paths) for sample in read_archive(path)], dtype=np.int64)
+        if not len(samples):
+            raise ValueError("No samples in archives")
+        return cls(
+            time=samples[:, 0],
+            soc=samples[:, 1] / 10,
+            current=samples[:, 2] / 100,
+            voltage=samples[:, 3] / 100,
+            count_L1=samples[:, 4],
+            count_L2=samples[:, 5],
+        )
+
+    def durations(self) -> np.ndarray:
+        """Seconds every sample is held, the last one as the median step."""
+        steps = np.diff(self.time)
+        last = np.median(steps) if len(steps) else 2
+        return np.append(steps, last).astype(float)
+
+
+def hysteresis(values: np.ndarray, enable_above: float, disable_below: float) -> np.ndarray:
+    """Vectorised ``ControlLogic.soc_enabled`` starting disabled."""
+    if disable_below > enable_above:
+        raise ValueError("Disable threshold above enable threshold", disable_below, enable_above)
+    events = np.full(len(values), -1, dtype=np.int8)
+    events[values > enable_above] = 1
+    events[values < disable_below] = 0
+    last = np.where(events >= 0, np.arange(len(values)), -1)
+    np.maximum.accumulate(last, out=last)
+    return np.where(last >= 0, events[np.maximum(last, 0)], 0).astype(bool)
+
+
+def overpower(counts: np.ndarray, thresholds: Thresholds) -> np.ndarray:
+    """Vectorised ``ControlLogic.overpower_logic`` with None coded as NONE."""
+    return np.where(
+        counts > thresholds.overpower_limit, -1, np.where(counts >= thresholds.overpower_warning, 0, NONE)
+    ).astype(np.int8)
+
+
+def decisions(telemetry: Telemetry, thresholds: Thresholds) -> tuple[np.ndarray, ...]:
+    """Arguments ``heaters_logic`` returns for every sample."""
+    enabled = hysteresis(telemetry.soc, thresholds.heaters_on, thresholds.heaters_off)
+    overpower_L1 = np.where(enabled, overpower(telemetry.count_L1, thresholds), NONE)
+    overpower_L2 = np.where(enabled, overpower(telemetry.count_L2, thresholds), NONE)
+    allowed = enabled & (overpower_L1 != -1) & (overpower_L2 != -1)
+    current = telemetry.current
+    idle = (-thresholds.idle_current <= current) & (current <= thresholds.idle_current)
+    up = (current > thresholds.charge_current) | (idle & (telemetry.soc > thresholds.full_soc))
+    down = current < thresholds.discharge_current
+    control = np.where(allowed & up, 1, np.where(allowed & down, -1, 0)).astype(np.int8)
+    return enabled, overpower_L1, overpower_L2, control
+
+
+def decision_code(enabled, overpower_L1, overpower_L2, control):
+    """Index of a set_pins argument combination (54 in total)."""
+    return enabled * 27 + (overpower_L1 + 1) * 9 + (overpower_L2 + 1) * 3 + (control + 1)
+
+
+def _argument(code: int) -> int | None:
+    return None if code == NONE else code
+
+
+def transition_table() -> np.ndarray:
+    """Next relay bitmask for every decision code and relay bitmask.
+
+    Generated by the firmware ``OutputHeaters.set_pins`` on stand-in pins.
+    """
+    pins = [machine.Pin(100 + index, machine.Pin.OUT, value=0) for index in range(HEATERS)]
+    heaters = models.OutputHeaters(pins, list(PIN_INDEXES_L1), list(PIN_INDEXES_L2))
+    table = np.zeros((54, 1 << HEATERS), dtype=np.int8)
+    for enabled, over_L1, over_L2, control in itertools.product((0, 1), (-1, 0, 1), (-1, 0, 1), (-1, 0, 1)):
+        code = decision_code(enabled, over_L1, over_L2, control)
+        for state in range(1 << HEATERS):
+            heaters.set_mask(state)
+            heaters.set_pins(bool(enabled), _argument(over_L1), _argument(over_L2), control)
+            table[code, state] = heaters.state()
+    return table
+
+
+TABLE = None
+
+
+def relay_states(codes: np.ndarray, initial: int = 0) -> np.ndarray:
+    """Relay bitmask after every sample by prefix composition of transitions."""
+    global TABLE
+    if TABLE is None:
+        TABLE = transition_table()
+    prefix = TABLE[codes]
+    step = 1
+    while step < len(prefix):
+        composed = prefix.copy()
+        composed[step:] = np.take_along_axis(prefix[step:], prefix[:-step].astype(np.intp), axis=1)
+        prefix = composed
+        step <<= 1
+    return prefix[:, initial]
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    return np.unpackbits(values.astype(np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def evaluate(telemetry: Telemetry, thresholds: Thresholds) -> dict[str, float]:
+    """Relay states and energy metrics of one parameter set."""
+    codes = decision_code(*(array.astype(np.int64) for array in decisions(telemetry, thresholds)))
+    states = relay_states(codes)
+    off_grid = hysteresis(telemetry.soc, thresholds.off_grid_on, thresholds.off_grid_off)
+    durations = telemetry.durations()
+    bits = (states[:, None] >> np.arange(HEATERS)) & 1
+    load = bits @ np.array(HEATER_WATTS)
+    surplus = np.maximum(telemetry.current * telemetry.voltage, 0)
+    deficit = np.maximum(load - surplus, 0) * durations
+    previous = np.concatenate(([0], states[:-1])).astype(np.uint8)
+    result = dataclasses.asdict(thresholds)
+    result.update(
+        diverted_kwh=float(load @ durations) / 3.6e6,
+        grid_import_kwh=float(deficit[~off_grid].sum()) / 3.6e6,
+        battery_kwh=float(deficit[off_grid].sum()) / 3.6e6,
+        relay_switches=int(popcount(states.astype(np.uint8) ^ previous).sum()),
+        off_grid_switches=int(np.count_nonzero(np.diff(off_grid.astype(np.int8)))),
+        off_grid_hours=float(durations[off_grid].sum()) / 3600,
+    )
+    return result
+
+
+def replay_scalar(telemetry: Telemetry, thresholds: Thresholds) -> tuple[np.ndarray, np.ndarray]:
+    """Relay bitmask and off grid state by running the firmware logic cycle by cycle."""
+    control = models.ControlLogic(**dataclasses.asdict(thresholds))
+    pins = [machine.Pin(100 + index, machine.Pin.OUT, value=0) for index in range(HEATERS)]
+    heaters = models.OutputHeaters(pins, list(PIN_INDEXES_L1), list(PIN_INDEXES_L2))
+    states = np.zeros(len(telemetry.time), dtype=np.int8)
+    off_grid = np.zeros(len(telemetry.time), dtype=bool)
+    for index in range(len(states)):
+        soc = float(telemetry.soc[index])
+        heaters.set_pins(
+            *control.heaters_logic(
+                soc, float(telemetry.current[index]), int(telemetry.count_L1[index]), int(telemetry.count_L2[index])
+            )
+        )
+        states[index] = heaters.state()
+        off_grid[index] = control.off_grid_logic(soc)
+    return states, off_grid
+
+
+def verify(telemetry: Telemetry, thresholds: Thresholds) -> bool:
+    """Vectorised engine matches the scalar firmware code."""
+    states, off_grid = replay_scalar(telemetry, thresholds)
+    codes = decision_code(*(array.astype(np.int64) for array in decisions(telemetry, thresholds)))
+    return bool(
+        np.array_equal(relay_states(codes), states)
+        and np.array_equal(hysteresis(telemetry.soc, thresholds.off_grid_on, thresholds.off_grid_off), off_grid)
+    )
+
+
+_TELEMETRY = None
+
+
+def _init_worker(telemetry: Telemetry) -> None:
+    global _TELEMETRY
+    _TELEMETRY = telemetry
+
+
+def _evaluate_worker(thresholds: Thresholds) -> dict[str, float]:
+    return evaluate(_TELEMETRY, thresholds)
+
+
+def sweep(telemetry: Telemetry, grid: dict[str, list[float]], workers: int | None = None) -> list[dict[str, float]]:
+    """Evaluate every combination of grid values in a process pool."""
+    names = list(grid)
+    candidates = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        thresholds = Thresholds(**dict(zip(names, values)))
+        if thresholds.heaters_off <= thresholds.heaters_on and thresholds.off_grid_off <= thresholds.off_grid_on:
+            candidates.append(thresholds)
+    chunksize = max(1, len(candidates) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(telemetry,)) as pool:
+        return list(pool.map(_evaluate_worker, candidates, chunksize=chunksize))
+
+
+def _parse_sweep(items: list[str]) -> dict[str, list[float]]:
+    fields = {field.name: field.type for field in dataclasses.fields(Thresholds)}
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        if name not in fields:
+            raise SystemExit(f"Unknown threshold {name}, use one of {', '.join(fields)}")
+        convert = int if fields[name] in (int, "int") else float
+        grid[name] = [convert(value) for value in values.split(",")]
+    return grid
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("archives", nargs="+", help="history/*.tlm files")
+    parser.add_argument("--sweep", nargs="*", default=[], metavar="NAME=V1,V2")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--verify", action="store_true", help="compare with scalar firmware replay first")
+    parser.add_argument("--sort", default="diverted_kwh")
+    args = parser.parse_args()
+    telemetry = Telemetry.from_archives(args.archives)
+    if args.verify:
+        print("verify:", "identical" if verify(telemetry, Thresholds()) else "MISMATCH")
+    rows = sweep(telemetry, _parse_sweep(args.sweep), args.workers)
+    rows.sort(key=lambda row: row[args.sort], reverse=True)
+    names = list(_parse_sweep(args.sweep)) or ["heaters_on"]
+    metrics = ["diverted_kwh", "grid_import_kwh", "battery_kwh", "relay_switches", "off_grid_hours"]
+    print("  ".join(f"{name:>16}" for name in names + metrics))
+    for row in rows:
+        print("  ".join(f"{row[name]:>16.6g}" for name in names + metrics))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""Benchmarks of the firmware hot path with allocation regression checks.
+
+Usage::
+
+    python -m host.bench                 # compare with host/bench_baseline.json
+    python -m host.bench --save          # store new baseline
+    python -m host.bench set_pins lcd_update --tolerance 0.3
+
+Every benchmark runs firmware code against the stand-in hardware and reports
+ns/op (median of several timed rounds, garbage collector off) and bytes per
+op from tracemalloc: the transient peak of one op and the memory it retains.
+Compared with the stored baseline, an op slower by more than the tolerance
+or allocating more than the byte tolerance fails with exit code 1.
+
+Timings are compared as multiples of a fixed reference loop timed next to
+every round, so a different or changing CPU clock does not count as a
+regression. The baseline file keeps one baseline per Python major.minor
+version, as allocations differ between versions. Without a baseline for the
+running version nothing is compared; on a different machine only
+allocations are.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import host
+
+host.install()
+
+import lcd_1inch14  # noqa: E402
+import machine  # noqa: E402
+import models  # noqa: E402
+from host.devices import SeplosBMS  # noqa: E402
+from host.harness import World, run_main, scratch_dir  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+BENCHMARKS = {}
+
+
+class Result:
+    """Time and allocation per op of one benchmark.
+
+    relative is ns/op divided by ns of the reference loop timed right before
+    (median over rounds), it is what is compared with the baseline.
+    """
+
+    def __init__(
+        self, name: str, ns: float, relative: float, peak_bytes: float, retained_bytes: float, ops: int
+    ) -> None:
+        self.name = name
+        self.ns = ns
+        self.relative = relative
+        self.peak_bytes = peak_bytes
+        self.retained_bytes = retained_bytes
+        self.ops = ops
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "ns": round(self.ns, 1),
+            "relative": round(self.relative, 4),
+            "peak_bytes": round(self.peak_bytes, 1),
+            "retained_bytes": round(self.retained_bytes, 1),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:16}{self.ns:12.0f}{self.relative:10.2f}"
+            f"{self.peak_bytes:12.1f}{self.retained_bytes:12.1f}{self.ops:10d}"
+        )
+
+
+def benchmark(name: str):
+    """Register a setup function returning the op to measure."""
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def _reference_op() -> int:
+    total = 0
+    for index in range(100):
+        total += index * index
+    return total
+
+
+def _loops(op, round_ns: int) -> int:
+    """Loop count taking about round_ns."""
+    op()
+    loops = 1
+    while True:
+        elapsed = _time(op, loops) * loops
+        if elapsed >= round_ns // 4 or loops >= 1 << 20:
+            return loops * 4
+        loops *= 2
+
+
+def _time(op, loops: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(loops):
+        op()
+    return (time.perf_counter_ns() - start) / loops
+
+
+def reference_ns(round_ns: int = 5_000_000) -> float:
+    """ns of one fixed pure Python loop, the unit timings are compared in.
+
+    It is timed next to every round of every benchmark, so the ratio holds
+    when the CPU clock changes between or during runs.
+    """
+    return _time(_reference_op, _loops(_reference_op, round_ns))
+
+
+def _median(values: list[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def measure(name: str, op, rounds: int = 9, round_ns: int = 20_000_000, traced_ops: int = 200) -> Result:
+    """Median ns/op and reference ratio over rounds, then mean tracemalloc bytes per op."""
+    loops = _loops(op, round_ns)
+    reference_loops = _loops(_reference_op, round_ns // 4)
+    times = []
+    ratios = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            reference = _time(_reference_op, reference_loops)
+            elapsed = _time(op, loops)
+            times.append(elapsed)
+            ratios.append(elapsed / reference)
+        traced_ops = min(traced_ops, loops)
+        tracemalloc.start()
+        op()
+        gc.collect()
+        peak_total = 0
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(traced_ops):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            op()
+            peak_total += tracemalloc.get_traced_memory()[1] - current
+        gc.collect()  # Cyclic garbage is not retained memory
+        retained = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    finally:
+        if enabled:
+            gc.enable()
+    return Result(name, _median(times), _median(ratios), peak_total / traced_ops, retained / traced_ops, rounds * loops)
+
+
+def _telemetry() -> models.Telemetry:
+    telemetry = models.Telemetry()
+    telemetry.enabled = True
+    telemetry.soc = 915
+    telemetry.current = 1234
+    telemetry.voltage = 5320
+    telemetry.cycles = 123
+    return telemetry
+
+
+def _pins(count: int) -> list[machine.Pin]:
+    return [machine.Pin(200 + index, machine.Pin.OUT, value=0) for index in range(count)]
+
+
+@benchmark("battery_parse")
+def _battery_parse():
+    battery = models.Battery(machine.UART(7, baudrate=19200))
+    frame = SeplosBMS().frame()
+    battery.frame.buf[:] = frame
+    battery.frame.size = len(frame)
+    telemetry = models.Telemetry()
+
+    def op():
+        battery.frame.decode()
+        battery._response(telemetry)
+
+    return op
+
+
+@benchmark("heaters_logic")
+def _heaters_logic():
+    control = models.ControlLogic()
+    telemetry = models.Telemetry()
+    inputs = [
+        (soc, current, count, count // 2)
+        for soc in (800, 920, 980)
+        for current in (-4000, 0, 3000)
+        for count in (5, 20, 30)
+    ]
+    state = [0]
+
+    def op():
+        index = state[0]
+        telemetry.soc, telemetry.current, count_L1, count_L2 = inputs[index]
+        control.update(telemetry, count_L1, count_L2)
+        state[0] = (index + 1) % len(inputs)
+
+    return op
+
+
+@benchmark("set_pins")
+def _set_pins():
+    heaters = models.OutputHeaters(_pins(3), [0, 2], [1])
+    arguments = [
+        (True, None, None, 1),
+        (True, None, None, 1),
+        (True, 0, None, 0),
+        (True, -1, None, 0),
+        (True, None, -1, -1),
+        (False, None, None, 0),
+    ]
+    state = [0]
+
+    def op():
+        index = state[0]
+        heaters.set_pins(*arguments[index])
+        state[0] = (index + 1) % len(arguments)
+
+    return op
+
+
+@benchmark("lcd_update")
+def _lcd_update():
+    telemetry = _telemetry()
+    lcd = models.LCD(lcd_1inch14.LCD_1inch14(), None, telemetry)
+    lcd.refresh()
+    state = [0]
+
+    def op():
+        # Current and seconds change every update like in operation.
+        state[0] += 1
+        telemetry.current = 1234 + (state[0] & 7)
+        lcd._update_screen(None)
+
+    return op
+
+
+@benchmark("logger_log")
+def _logger_log():
+    logger = models.DataLogger("bench.csv", max_size=256 * 1024)
+    telemetry = _telemetry()
+    return lambda: logger.log(telemetry)
+
+
+@benchmark("config_set")
+def _config_set():
+    config = models.Config("bench.json")
+    state = [0]
+
+    def op():
+        state[0] += 1
+        config.set("cycles", state[0] & 15)
+
+    return op
+
+
+def main_cycle(cycles: int = 100, rounds: int = 3) -> Result:
+    """One full main loop iteration, from battery step to LCD update.
+
+    Median over rounds of the median cycle time of a run, each run next to
+    a reference timing.
+    """
+    times = []
+    ratios = []
+    peak = []
+    net = []
+    for _ in range(rounds):
+        gc.collect()
+        reference = reference_ns()
+        recorder = run_main(cycles, world=World())
+        median = _median(recorder.latency_ns)
+        times.append(median)
+        ratios.append(median / reference)
+        peak += recorder.peak_bytes
+        net += recorder.net_bytes
+    return Result("main_cycle", _median(times), _median(ratios), sum(peak) / len(peak), sum(net) / len(net), len(peak))
+
+
+def run(names: list[str]) -> list[Result]:
+    World()  # Fresh clock and pin registry
+    results = []
+    with scratch_dir():
+        for name in names:
+            if name == "main_cycle":
+                results.append(main_cycle())
+            else:
+                results.append(measure(name, BENCHMARKS[name]()))
+    return results
+
+
+def environment() -> dict[str, str]:
+    return {"python": platform.python_version(), "machine": platform.machine()}
+
+
+def version() -> str:
+    """Key of the baseline for the running Python, major.minor."""
+    return ".".join(platform.python_version_tuple()[:2])
+
+
+def load_baseline(path: str = BASELINE) -> dict | None:
+    """Baseline of the running Python version, None if there is none."""
+    try:
+        with open(path) as f:
+            baselines = json.load(f).get("baselines", {})
+    except OSError:
+        return None
+    return baselines.get(version())
+
+
+def save_baseline(results: list[Result], path: str = BASELINE, merge: bool = False) -> None:
+    """Store results as the baseline of the running Python version."""
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except OSError:
+        stored = {}
+    baselines = stored.get("baselines", {})
+    entry = {"environment": environment(), "results": {result.name: result.as_dict() for result in results}}
+    if merge and version() in baselines:
+        baselines[version()]["results"].update(entry["results"])
+        entry["results"] = baselines[version()]["results"]
+    baselines[version()] = entry
+    with open(path, "w") as f:
+        json.dump({"baselines": baselines}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(
+    results: list[Result], baseline: dict, tolerance: float, byte_tolerance: float, timings: bool = True
+) -> list[str]:
+    """Regressions of results against baseline, empty when there are none.
+
+    With timings False only allocations are compared.
+    """
+    failures = []
+    for result in results:
+        reference = baseline.get("results", {}).get(result.name)
+        if reference is None:
+            print("No baseline for", result.name, file=sys.stderr)
+            continue
+        if timings and result.relative > reference["relative"] * (1 + tolerance):
+            failures.append(
+                f"{result.name}: {result.relative:.2f} reference loops/op, baseline {reference['relative']:.2f}"
+            )
+        for key in ("peak_bytes", "retained_bytes"):
+            value = getattr(result, key)
+            if value > reference[key] + byte_tolerance:
+                failures.append(f"{result.name}: {value:.1f} {key}/op, baseline {reference[key]:.1f}")
+    return failures
+
+
+def main() -> None:
+    names = ["main_cycle", *BENCHMARKS]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", metavar="NAME", help=", ".join(names))
+    parser.add_argument("--save", action="store_true", help="store results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--bytes", type=float, default=32, help="allowed allocation growth per op")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(names)
+    if unknown:
+        parser.error(f"unknown benchmark {', '.join(sorted(unknown))}")
+    results = run(args.names or names)
+    print(f"{'':16}{'ns/op':>12}{'rel':>10}{'peak B/op':>12}{'kept B/op':>12}{'ops':>10}")
+    for result in results:
+        print(result)
+    if args.save:
+        save_baseline(results, args.baseline, merge=bool(args.names))
+        print(f"Baseline for Python {version()} saved to", args.baseline)
+        return
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline for Python {version()} in {args.baseline}, run with --save first", file=sys.stderr)
+        return
+    timings = baseline["environment"].get("machine") == platform.machine()
+    if not timings:
+        print(f"Baseline taken on {baseline['environment']}, comparing allocations only", file=sys.stderr)
+    failures = compare(results, baseline, args.tolerance, args.bytes, timings)
+    if failures:
+        print("\nPERFORMANCE REGRESSION", file=sys.stderr)
+        for failure in failures:
+            print("  " + failure, file=sys.stderr)
+        raise SystemExit(1)
+    print("No regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
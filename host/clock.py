@@ -0,0 +1,205 @@
+"""Host clock driving the MicroPython flavoured ``time`` functions."""
+import heapq
+import threading
+import time
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+_monotonic = time.monotonic
+_real_time = time.time
+_real_sleep = time.sleep
+_real_localtime = time.localtime
+_real_mktime = time.mktime
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    """Offset ticks value by delta, wrapping like MicroPython."""
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1: int, ticks2: int) -> int:
+    """Signed difference of two ticks values, wrapping like MicroPython."""
+    return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+class HostClock:
+    """Patches ``time`` so the firmware sees MicroPython semantics.
+
+    In real mode ``sleep`` really sleeps, in fast mode it only advances the
+    clock. Either way registered pollers (timers, meter pulse generators) are
+    serviced while the firmware sleeps, which is where the Pico would run them.
+
+    The thread that installed the clock is core 0 and drives it. Other threads
+    (core 1 started by ``_thread``) sleeping in fast mode wait for core 0 to
+    reach their deadline instead of skipping ahead themselves.
+    """
+
+    def __init__(self, fast: bool = False, epoch: float | None = None) -> None:
+        self.fast = fast
+        self.epoch = _real_time() if epoch is None else epoch
+        self.start = _monotonic()
+        self.offset = 0.0
+        self.pollers = []
+        self.slept = 0.0
+        self.owner = threading.get_ident()
+
+    def now(self) -> float:
+        """Seconds elapsed since the clock was created."""
+        return _monotonic() - self.start + self.offset
+
+    def time(self) -> int:
+        """Whole seconds since epoch, as ``time.time`` on the Pico."""
+        return int(self.epoch + self.now())
+
+    def localtime(self, secs: float | None = None) -> tuple:
+        """Eight item tuple as returned by MicroPython ``time.localtime``."""
+        return tuple(_real_localtime(self.epoch + self.now() if secs is None else secs))[:8]
+
+    def ticks_ms(self) -> int:
+        return int(self.now() * 1000) & TICKS_MAX
+
+    def ticks_us(self) -> int:
+        return int(self.now() * 1_000_000) & TICKS_MAX
+
+    def poll(self) -> None:
+        """Service everything that would run asynchronously on the Pico."""
+        now_ms = self.now() * 1000
+        for poller in self.pollers:
+            poller(now_ms)
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep (or skip ahead) while servicing pollers."""
+        deadline = self.now() + seconds
+        if threading.get_ident() != self.owner:
+            while self.now() < deadline:
+                _real_sleep(0.001 if self.fast else min(deadline - self.now(), 0.01))
+            return
+        self.slept += seconds
+        while True:
+            remaining = deadline - self.now()
+            if remaining <= 0:
+                break
+            step = min(remaining, 0.01)
+            if self.fast:
+                self.offset += step
+            else:
+                _real_sleep(step)
+            self.poll()
+
+    def reschedule(self) -> None:
+        """Event times of a poller changed, only the virtual clock cares."""
+
+    def sleep_ms(self, ms: int) -> None:
+        self.sleep(ms / 1000)
+
+    def sleep_us(self, us: int) -> None:
+        self.sleep(us / 1_000_000)
+
+    def install(self) -> "HostClock":
+        """Patch the ``time`` module with this clock."""
+        time.time = self.time
+        time.sleep = self.sleep
+        time.sleep_ms = self.sleep_ms
+        time.sleep_us = self.sleep_us
+        time.localtime = self.localtime
+        time.mktime = lambda tt: int(_real_mktime(tuple(tt[:8]) + (-1,)))
+        time.ticks_ms = self.ticks_ms
+        time.ticks_us = self.ticks_us
+        time.ticks_cpu = self.ticks_us
+        time.ticks_add = ticks_add
+        time.ticks_diff = ticks_diff
+        time.host_clock = self
+        self.owner = threading.get_ident()
+        return self
+
+
+class VirtualClock(HostClock):
+    """Discrete-event clock: time only moves in sleep, straight to the next event.
+
+    Pollers that have ``next_ms(now_ms)`` returning when they are next due
+    (or None) are serviced only at those times; for a bound method such as
+    ``machine.Timer.service`` the ``next_ms`` of its class or instance is
+    used. Pollers without it are serviced every ``step`` seconds. Nothing
+    depends on real time, so a run is reproducible and as fast as the
+    firmware code allows. Time is kept in milliseconds, so a poller sees
+    exactly the due time it asked for.
+
+    Due times are kept in a heap and a poller is asked again only after it
+    was serviced. Stand-ins whose next event changes otherwise (a timer
+    started, a UART request answered, a meter load changed) call
+    ``reschedule``, which makes the clock ask all pollers again.
+    """
+
+    def __init__(self, epoch: float | None = None, step: float = 0.01) -> None:
+        super().__init__(fast=True, epoch=epoch)
+        self.step_ms = step * 1000
+        self.now_ms = 0.0
+        self.events = 0
+        self.stale = True
+        self._sources = []  # (poller, next_ms or None) in pollers order
+        self._due = []  # Due time per source, None when idle
+        self._heap = []  # (due, source index), entries not matching _due are dropped
+
+    def now(self) -> float:
+        return self.now_ms / 1000
+
+    def ticks_ms(self) -> int:
+        return int(self.now_ms) & TICKS_MAX
+
+    def ticks_us(self) -> int:
+        return int(self.now_ms * 1000) & TICKS_MAX
+
+    def poll(self) -> None:
+        now_ms = self.now_ms
+        for poller in self.pollers:
+            poller(now_ms)
+
+    def reschedule(self) -> None:
+        self.stale = True
+
+    def _next(self, next_ms, now_ms: float) -> float | None:
+        return now_ms + self.step_ms if next_ms is None else next_ms(now_ms)
+
+    def _schedule(self) -> None:
+        """Look up next_ms of new pollers and ask every poller when it is due."""
+        if len(self._sources) != len(self.pollers):
+            self._sources = []
+            for poller in self.pollers:
+                next_ms = getattr(poller, "next_ms", None)
+                if next_ms is None:
+                    next_ms = getattr(getattr(poller, "__self__", None), "next_ms", None)
+                self._sources.append((poller, next_ms))
+        now_ms = self.now_ms
+        self._due = [self._next(next_ms, now_ms) for _, next_ms in self._sources]
+        self._heap = [(due, index) for index, due in enumerate(self._due) if due is not None]
+        heapq.heapify(self._heap)
+        self.stale = False
+
+    def sleep(self, seconds: float) -> None:
+        """Jump from event to event until the deadline, servicing only due pollers."""
+        if threading.get_ident() != self.owner:
+            return super().sleep(seconds)
+        self.slept += seconds
+        deadline_ms = self.now_ms + seconds * 1000
+        heap = self._heap
+        while True:
+            if self.stale or len(self._sources) != len(self.pollers):
+                self._schedule()
+                heap = self._heap
+            if not heap or heap[0][0] > deadline_ms:
+                break
+            due, index = heapq.heappop(heap)
+            if due != self._due[index]:
+                continue
+            if due > self.now_ms:
+                self.now_ms = due
+            self.events += 1
+            poller, next_ms = self._sources[index]
+            poller(self.now_ms)
+            due = self._due[index] = self._next(next_ms, self.now_ms)
+            if due is not None:
+                heapq.heappush(heap, (due, index))
+        if deadline_ms > self.now_ms:
+            self.now_ms = deadline_ms
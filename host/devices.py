@@ -0,0 +1,243 @@
+"""Simulated peripherals attached to the stand-in ``machine`` buses."""
+import time
+
+import machine
+
+
+def seplos_checksum(frame: bytes) -> int:
+    """CHKSUM of a Seplos frame body (ASCII between SOI and CHKSUM)."""
+    return (~sum(frame) + 1) & 0xFFFF
+
+
+def seplos_length(info_len: int) -> int:
+    """LENGTH field (LCHKSUM + LENID) for INFO of info_len ASCII chars."""
+    lchksum = (~((info_len & 0xF) + ((info_len >> 4) & 0xF) + ((info_len >> 8) & 0xF)) + 1) & 0xF
+    return lchksum << 12 | info_len
+
+
+def seplos_frame(adr: int, cid1: int, cid2: int, info: bytes = b"", ver: int = 0x20) -> bytes:
+    """Complete Seplos frame ``~...CHKSUM\\r`` for hex-ASCII INFO."""
+    body = b"%02X%02X%02X%02X%04X" % (ver, adr, cid1, cid2, seplos_length(len(info))) + info
+    return b"~" + body + b"%04X\r" % seplos_checksum(body)
+
+
+class SeplosBMS:
+    """Scripted Seplos BMS answering 0x42 telemetry requests.
+
+    ``script`` is an optional list of replies consumed one per request:
+    ``"ok"``, ``"silent"`` (no answer), ``"garbage"``, ``"truncated"`` or
+    ``"badsum"``. Once it runs out every request is answered correctly.
+    """
+
+    def __init__(self, adr: int = 0, script: list[str] | None = None, latency_ms: int = 20) -> None:
+        self.adr = adr
+        self.script = list(script or [])
+        self.latency_ms = latency_ms
+        self.requests = 0
+        self.cells_mv = [3325] * 16
+        self.temperatures_c = [24.5, 24.0, 23.8, 24.1, 26.0, 25.0]
+        self.current = 0.0
+        self.voltage = 53.20
+        self.residual_capacity = 180.0
+        self.battery_capacity = 200.0
+        self.soc = 90.0
+        self.rated_capacity = 200.0
+        self.cycles = 123
+        self.soh = 100.0
+        self.port_voltage = 53.18
+
+    def info(self) -> bytes:
+        """INFO field laid out as ``pc_communication.chunks_status``."""
+        info = b"%02X%02X%02X" % (0, self.adr, len(self.cells_mv))
+        info += b"".join(b"%04X" % mv for mv in self.cells_mv)
+        info += b"%02X" % len(self.temperatures_c)
+        info += b"".join(b"%04X" % round(t * 10 + 2731) for t in self.temperatures_c)
+        info += b"%04X%04X%04X" % (round(self.current * 100) & 0xFFFF, round(self.voltage * 100), round(self.residual_capacity * 100))
+        info += b"%02X%04X%04X" % (10, round(self.battery_capacity * 100), round(self.soc * 10))
+        info += b"%04X%04X%04X%04X" % (round(self.rated_capacity * 100), self.cycles, round(self.soh * 10), round(self.port_voltage * 100))
+        return info + b"0000" * 4
+
+    def frame(self) -> bytes:
+        return seplos_frame(self.adr, 0x46, 0x00, self.info())
+
+    def handle(self, request: bytes) -> bytes | None:
+        if not request.startswith(b"~") or request[5:9] != b"4642" or int(request[3:5], 16) != self.adr:
+            return None
+        self.requests += 1
+        mode = self.script.pop(0) if self.script else "ok"
+        if mode == "silent":
+            return None
+        if mode == "garbage":
+            return b"~\x00\xff" + bytes(range(32, 96)) + b"\r"
+        frame = self.frame()
+        if mode == "truncated":
+            return frame[: len(frame) // 2]
+        if mode == "badsum":
+            return frame[:-5] + b"0000\r"
+        return frame
+
+
+class SeplosBus:
+    """Parallel packs on one RS485 bus, only the addressed pack answers."""
+
+    def __init__(self, packs: list[SeplosBMS]) -> None:
+        self.packs = packs
+        self.latency_ms = 0
+
+    def handle(self, request: bytes) -> bytes | None:
+        for pack in self.packs:
+            reply = pack.handle(request)
+            if reply is not None:
+                self.latency_ms = pack.latency_ms
+                return reply
+        return None
+
+
+class DS3231Chip:
+    """DS3231 register file; the time registers follow the host clock.
+
+    Called as a clock poller it also sets the alarm flags once their time
+    matches and, with INTCN set, drives the open drain INT output on pin
+    int_pin low while an enabled alarm flag is set.
+    """
+
+    ADDR = 0x68
+    ALARMS = ((1, 0x07, 0), (2, 0x0B, 1))  # Flag bit, first register, first time register compared
+
+    def __init__(self, offset: float = 0.0, int_pin: int | None = None) -> None:
+        self.regs = bytearray(0x13)
+        self.regs[0x0E] = 0x1C
+        self.offset = offset
+        self.int_pin = int_pin
+        self.reads = 0
+        self.writes = 0
+        self.alarms = 0
+        self._second = None
+
+    @staticmethod
+    def _bcd(value: int) -> int:
+        return (value // 10) << 4 | value % 10
+
+    @staticmethod
+    def _dec(bcd: int) -> int:
+        return ((bcd & 0x70) >> 4) * 10 + (bcd & 0x0F)
+
+    def _sync_time(self) -> None:
+        tt = time.localtime(time.time() + self.offset)
+        self.regs[0:7] = bytes(
+            (self._bcd(tt[5]), self._bcd(tt[4]), self._bcd(tt[3]), tt[6] + 1, self._bcd(tt[2]), self._bcd(tt[1]) | 0x80, self._bcd(tt[0] - 2000))
+        )
+
+    def read(self, reg: int, nbytes: int) -> bytes:
+        self.reads += 1
+        self._sync_time()
+        return bytes(self.regs[reg : reg + nbytes])
+
+    def write(self, reg: int, data: bytes) -> None:
+        self.writes += 1
+        time.host_clock.reschedule()  # Alarm interrupt may have been enabled
+        self._sync_time()
+        flags = self.regs[0x0F]
+        self.regs[reg : reg + len(data)] = data
+        if reg <= 0x0F < reg + len(data):
+            self.regs[0x0F] &= flags | 0x7C  # OSF and alarm flags can only be cleared
+        if reg < 7:
+            r = self.regs
+            chip = time.mktime(
+                (self._dec(r[6]) + 2000, self._dec(r[5] & 0x1F), self._dec(r[4]), self._dec(r[2] & 0x3F), self._dec(r[1]), self._dec(r[0]), 0, 0)
+            )
+            self.offset = chip - time.time()
+        self._drive_int()
+
+    def _alarm_matches(self, first: int, compared: int) -> bool:
+        r = self.regs
+        for index, register, mask in ((0, 0, 0x7F), (1, 1, 0x7F), (2, 2, 0x3F), (3, 4, 0x3F)):
+            if index < compared:
+                continue
+            value = r[first + index - compared]
+            if value & 0x80:
+                continue
+            if index == 3 and value & 0x40:
+                register, mask = 3, 0x0F  # Day of week instead of date
+            if value & mask != r[register] & mask:
+                return False
+        return compared == 0 or r[0] == 0
+
+    def _drive_int(self) -> None:
+        pin = machine.Pin.board.get(self.int_pin)
+        if pin is not None:
+            control = self.regs[0x0E]
+            pin.drive(0 if control & 0x04 and control & self.regs[0x0F] & 0x03 else 1)
+
+    def next_ms(self, now_ms: float) -> float | None:
+        """Next whole second while an alarm interrupt is enabled, else None."""
+        control = self.regs[0x0E]
+        if self.int_pin is None or not control & 0x04 or not control & 0x03:
+            return None
+        return (now_ms // 1000 + 1) * 1000
+
+    def __call__(self, now_ms: float) -> None:
+        self._sync_time()
+        second = bytes(self.regs[0:7])
+        if second == self._second:
+            return
+        self._second = second
+        for flag, first, compared in self.ALARMS:
+            if not self.regs[0x0F] & flag and self._alarm_matches(first, compared):
+                self.regs[0x0F] |= flag
+                self.alarms += 1
+        self._drive_int()
+
+
+class PulseMeter:
+    """Consumption meter switching output producing falling edges on a pin.
+
+    The pin is looked up in ``machine.Pin.board`` when pulses are due, so the
+    meter can be created before the firmware configures the input.
+    """
+
+    def __init__(self, pin_id: int, watts: float = 0.0, impulses_per_kwh: int = 10_000) -> None:
+        self.pin_id = pin_id
+        self.impulses_per_kwh = impulses_per_kwh
+        self.pulses = 0
+        self._next_ms = None
+        self.watts = watts
+
+    @property
+    def watts(self) -> float:
+        return self._watts
+
+    @watts.setter
+    def watts(self, watts: float) -> None:
+        self._watts = watts
+        self._interval = 3_600_000_000 / (watts * self.impulses_per_kwh) if watts > 0 else None
+        time.host_clock.reschedule()  # An idle meter starts pulsing
+
+    def interval_ms(self) -> float | None:
+        """Pulse period for the current load or None when idle."""
+        return self._interval
+
+    def next_ms(self, now_ms: float) -> float | None:
+        """Due time of the next pulse, None when idle."""
+        if self._next_ms is not None:
+            return self._next_ms
+        interval = self.interval_ms()
+        if interval is None or machine.Pin.board.get(self.pin_id) is None:
+            return None
+        return now_ms + interval
+
+    def __call__(self, now_ms: float) -> None:
+        pin = machine.Pin.board.get(self.pin_id)
+        if pin is None:
+            return
+        interval = self._interval
+        if interval is None:
+            self._next_ms = None
+            return
+        if self._next_ms is None:
+            self._next_ms = now_ms + interval
+        while now_ms >= self._next_ms:
+            pin.drive(1)
+            pin.drive(0)
+            self.pulses += 1
+            self._next_ms += interval
@@ -0,0 +1,204 @@
+"""Run the unmodified firmware ``main()`` on CPython against simulated hardware.
+
+Usage::
+
+    python -m host.harness --cycles 50 [--real-time]
+    python -m host.harness --runtime 30
+    python -m host.harness --cycles 50 --dual-core
+    python -m host.harness --cycles 50 --idle
+
+Every main loop cycle (battery step up to the LCD value update) is timed with
+``perf_counter_ns`` and traced with ``tracemalloc`` for the peak transient and
+net retained allocation. ``--runtime`` runs the asyncio runtime instead for
+a number of (real) seconds and prints its per-task statistics.
+``--dual-core`` renders the LCD on a second thread standing in for core 1;
+a cycle then ends with the telemetry handoff instead of the LCD update.
+``--idle`` sleeps with ``machine.lightsleep`` between cycles and syncs the
+RTC from the DS3231 alarm.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+import tracemalloc
+
+import host
+
+host.install()
+
+import machine  # noqa: E402
+from host.clock import HostClock  # noqa: E402
+from host.devices import DS3231Chip, PulseMeter, SeplosBMS, SeplosBus  # noqa: E402
+
+
+class World:
+    """Simulated installation: BMS on UART0, DS3231 on I2C0 with INT on pin 19, meters on pins 26/27."""
+
+    def __init__(self, fast: bool = True, bms: SeplosBMS | SeplosBus | None = None) -> None:
+        machine.Pin.board.clear()
+        machine.Timer.active.clear()
+        self.clock = HostClock(fast=fast).install()
+        self.bms = SeplosBMS() if bms is None else bms
+        self.rtc = DS3231Chip(int_pin=19)
+        self.meter_l1 = PulseMeter(26)
+        self.meter_l2 = PulseMeter(27)
+        machine.UART.attach(0, self.bms)
+        machine.I2C.attach(0, DS3231Chip.ADDR, self.rtc)
+        self.clock.pollers += [machine.Timer.service, self.meter_l1, self.meter_l2, self.rtc]
+
+    def pin(self, pin_id: int) -> machine.Pin:
+        return machine.Pin.board[pin_id]
+
+
+class _Done(Exception):
+    pass
+
+
+class CycleRecorder:
+    """Per-cycle latency and allocation samples of the firmware main loop."""
+
+    def __init__(self, cycles: int) -> None:
+        self.cycles = cycles
+        self.latency_ns = []
+        self.peak_bytes = []
+        self.net_bytes = []
+        self._start_ns = 0
+        self._start_mem = 0
+
+    def begin(self) -> None:
+        tracemalloc.reset_peak()
+        self._start_mem = tracemalloc.get_traced_memory()[0]
+        self._start_ns = time.perf_counter_ns()
+
+    def end(self) -> None:
+        elapsed = time.perf_counter_ns() - self._start_ns
+        current, peak = tracemalloc.get_traced_memory()
+        self.latency_ns.append(elapsed)
+        self.peak_bytes.append(peak - self._start_mem)
+        self.net_bytes.append(current - self._start_mem)
+        if len(self.latency_ns) >= self.cycles:
+            raise _Done
+
+    @staticmethod
+    def _stats(samples: list[int]) -> tuple[int, int, int, int]:
+        ordered = sorted(samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return ordered[0], sum(ordered) // len(ordered), p99, ordered[-1]
+
+    def report(self) -> str:
+        lines = [f"cycles: {len(self.latency_ns)}", f"{'':18}{'min':>10}{'avg':>10}{'p99':>10}{'max':>10}"]
+        for name, samples, scale in (
+            ("latency [us]", self.latency_ns, 1000),
+            ("peak alloc [B]", self.peak_bytes, 1),
+            ("net alloc [B]", self.net_bytes, 1),
+        ):
+            values = "".join(f"{value // scale:>10}" for value in self._stats(samples))
+            lines.append(f"{name:18}{values}")
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def scratch_dir():
+    """Temporary working directory so ``config.json`` and ``log.csv`` do not
+    land in the working tree."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+
+def run_main(
+    cycles: int = 30,
+    fast: bool = True,
+    world: World | None = None,
+    dual_core: bool = False,
+    idle: bool = False,
+) -> CycleRecorder:
+    """Run ``main.main()`` for a number of cycles and return the samples."""
+    world = World(fast=fast) if world is None else world
+    import dualcore
+    import main
+    import models
+
+    recorder = CycleRecorder(cycles)
+    step = models.Battery.step
+    update = models.LCD.update_values
+    publish = dualcore.Handoff.publish
+
+    def timed_step(self, *args, **kwargs):
+        recorder.begin()
+        return step(self, *args, **kwargs)
+
+    def timed_update(self, *args, **kwargs):
+        update(self, *args, **kwargs)
+        recorder.end()
+
+    def timed_publish(self, *args, **kwargs):
+        publish(self, *args, **kwargs)
+        recorder.end()
+
+    models.Battery.step = timed_step
+    models.LCD.update_values = timed_update
+    dualcore.Handoff.publish = timed_publish
+    dual, sleep = main.DUAL_CORE, main.IDLE_SLEEP
+    main.DUAL_CORE, main.IDLE_SLEEP = dual_core, idle
+    tracemalloc.start()
+    try:
+        with scratch_dir():
+            main.main()
+    except _Done:
+        pass
+    finally:
+        tracemalloc.stop()
+        models.Battery.step = step
+        models.LCD.update_values = update
+        dualcore.Handoff.publish = publish
+        main.DUAL_CORE, main.IDLE_SLEEP = dual, sleep
+    return recorder
+
+
+def run_runtime(seconds: float, world: World | None = None):
+    """Run ``runtime.Runtime`` in real time and return it for its statistics."""
+    world = World(fast=False) if world is None else world
+    import runtime
+
+    async def service() -> None:
+        while True:
+            world.clock.poll()
+            await asyncio.sleep(0.005)
+
+    async def session():
+        tasks = runtime.Runtime()
+        poller = asyncio.create_task(service())
+        try:
+            await asyncio.wait_for(tasks.run(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        poller.cancel()
+        return tasks
+
+    with scratch_dir():
+        return asyncio.run(session())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=30)
+    parser.add_argument("--real-time", action="store_true", help="really sleep instead of skipping ahead")
+    parser.add_argument("--dual-core", action="store_true", help="render the LCD on a thread as core 1")
+    parser.add_argument("--idle", action="store_true", help="lightsleep between cycles")
+    parser.add_argument("--runtime", type=float, metavar="SECONDS", help="run the asyncio runtime instead")
+    args = parser.parse_args()
+    if args.runtime:
+        print(run_runtime(args.runtime).report())
+    else:
+        print(run_main(args.cycles, fast=not args.real_time, dual_core=args.dual_core, idle=args.idle).report())
+
+
+if __name__ == "__main__":
+    main()
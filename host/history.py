@@ -0,0 +1,119 @@
+"""Decode daily telemetry archives (``history/YYYYMMDD.tlm``) written by the Pico.
+
+Usage::
+
+    python -m host.history history/20240522.tlm [--minutes] > day.csv
+
+Prints every 2 s sample, or with ``--minutes`` min/max/avg per minute.
+"""
+import argparse
+import csv
+import sys
+
+import host
+
+host.install()
+
+from history import FIELDS, MAGIC, REPEAT, RESET, unzigzag  # noqa: E402
+
+COLUMNS = ("time", "soc", "current", "voltage", "count_L1", "count_L2", "relays")
+SCALES = (1, 10, 100, 100, 1, 1, 1)
+
+
+def _varint(data: bytes, index: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, index
+        shift += 7
+
+
+def decode(data: bytes):
+    """Yield samples as tuples of raw integers (see ``history`` module)."""
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError("Not a telemetry archive")
+    index = len(MAGIC)
+    previous = [0] * FIELDS
+    step = 0
+    while index < len(data):
+        head = data[index]
+        index += 1
+        if head == RESET:
+            previous = [0] * FIELDS
+            step = 0
+            continue
+        if head & REPEAT:
+            for _ in range((head & 0x7F) + 1):
+                previous[0] += step
+                yield tuple(previous)
+            continue
+        if head & 1:
+            delta, index = _varint(data, index)
+            step += unzigzag(delta)
+        previous[0] += step
+        for field in range(1, FIELDS):
+            if head & (1 << field):
+                delta, index = _varint(data, index)
+                previous[field] += unzigzag(delta)
+        yield tuple(previous)
+
+
+def read_archive(path: str):
+    with open(path, "rb") as f:
+        yield from decode(f.read())
+
+
+def scaled(sample: tuple) -> dict[str, float]:
+    """Sample in units of the firmware log (%, A, V)."""
+    return {name: value / scale if scale != 1 else value for name, value, scale in zip(COLUMNS, sample, SCALES)}
+
+
+def downsample(samples, seconds: int = 60):
+    """Yield min/max/avg of SOC, current and voltage, average pulses per 2 s and or-ed relays per period."""
+    bucket = []
+    for sample in samples:
+        if bucket and sample[0] // seconds != bucket[0][0] // seconds:
+            yield _summary(bucket, seconds)
+            bucket = []
+        bucket.append(sample)
+    if bucket:
+        yield _summary(bucket, seconds)
+
+
+def _summary(bucket: list[tuple], seconds: int) -> dict[str, float]:
+    row = {"time": bucket[0][0] // seconds * seconds}
+    for field in (1, 2, 3):
+        values = [sample[field] for sample in bucket]
+        name, scale = COLUMNS[field], SCALES[field]
+        row[f"{name}_min"] = min(values) / scale
+        row[f"{name}_max"] = max(values) / scale
+        row[f"{name}_avg"] = sum(values) / len(values) / scale
+    row["count_L1"] = sum(sample[4] for sample in bucket) / len(bucket)
+    row["count_L2"] = sum(sample[5] for sample in bucket) / len(bucket)
+    relays = 0
+    for sample in bucket:
+        relays |= sample[6]
+    row["relays"] = relays
+    return row
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("archive")
+    parser.add_argument("--minutes", action="store_true", help="per-minute statistics")
+    args = parser.parse_args()
+    samples = read_archive(args.archive)
+    rows = downsample(samples) if args.minutes else (scaled(sample) for sample in samples)
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(sys.stdout, list(row))
+            writer.writeheader()
+        writer.writerow(row)
+
+
+if __name__ == "__main__":
+    main()
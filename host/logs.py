@@ -0,0 +1,65 @@
+"""Reassemble rotated ``log.csv`` files copied from the Pico.
+
+Usage::
+
+    python -m host.logs path/to/log.csv > merged.csv
+
+Reads ``log.csv.N`` .. ``log.csv.1`` and ``log.csv`` oldest first and prints
+one CSV with a column per logged key.
+"""
+import argparse
+import csv
+import glob
+import sys
+
+
+def log_files(filename: str) -> list[str]:
+    """Rotated files oldest first, current file last."""
+    rotated = []
+    for path in glob.glob(glob.escape(filename) + ".*"):
+        suffix = path[len(filename) + 1 :]
+        if suffix.isdigit():
+            rotated.append((int(suffix), path))
+    files = [path for _, path in sorted(rotated, reverse=True)]
+    return files + glob.glob(glob.escape(filename))
+
+
+def parse_line(line: str) -> dict[str, str] | None:
+    """Record of ``date;time;key=value;...`` line, None for damaged line."""
+    parts = line.rstrip("\n").split(";")
+    if len(parts) < 2 or "=" in parts[0] or "=" in parts[1]:
+        return None
+    record = {"date": parts[0], "time": parts[1]}
+    for part in parts[2:]:
+        key, sep, value = part.partition("=")
+        if not sep:
+            return None
+        record[key] = value
+    return record
+
+
+def read_log(filename: str):
+    """Yield records of all rotated files in order they were written."""
+    for path in log_files(filename):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                record = parse_line(line)
+                if record is not None:
+                    yield record
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("filename", nargs="?", default="log.csv")
+    args = parser.parse_args()
+    records = list(read_log(args.filename))
+    fields = []
+    for record in records:
+        fields += [key for key in record if key not in fields]
+    writer = csv.DictWriter(sys.stdout, fields)
+    writer.writeheader()
+    writer.writerows(records)
+
+
+if __name__ == "__main__":
+    main()
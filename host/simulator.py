@@ -0,0 +1,280 @@
+"""Run the unmodified firmware ``main()`` against a simulated PV installation.
+
+Usage::
+
+    python -m host.simulator --days 365 --start 2024-01-01 [--seed 1]
+    python -m host.simulator --days 7 --start 2024-06-01 --pv 12000 --battery 15000
+
+Time is virtual (``host.clock.VirtualClock``): every sleep of the firmware
+jumps to the next event (timer, meter pulse, UART reply, plant update), so a
+day passes in 7 to 12 s and a year in about an hour; every firmware cycle and
+meter pulse still runs as Python. The LCD is only rendered with
+``--display``. The plant model is updated every ``--step`` seconds:
+
+* PV: clear sky half sine between sunrise and sunset, day length and peak
+  following the season, times a cloud factor drawn every 15 minutes.
+* House: base load per phase plus random appliances, more in the morning
+  and evening. Heaters add their power to their phase while their relay
+  is on. The consumption meters pulse for house and heater load per phase.
+* Battery: PV covers the load first, surplus charges the battery up to
+  ``--charge-limit`` and the rest is exported (curtailed off grid). On grid
+  the deficit is imported; off grid (pin 22) the battery covers it up to
+  ``--discharge-limit``, the rest counts as unserved.
+  Current, SOC and voltage are answered by the simulated Seplos BMS.
+
+At the end energy totals, relay switches and off grid hours are printed.
+"""
+import argparse
+import contextlib
+import io
+import math
+import random
+import time
+
+import host
+
+host.install()
+
+import machine  # noqa: E402
+from host.clock import VirtualClock  # noqa: E402
+from host.devices import DS3231Chip, PulseMeter, SeplosBMS  # noqa: E402
+from host.harness import scratch_dir  # noqa: E402
+
+HEATERS = {6: (1, 2000), 7: (2, 2000), 14: (1, 2000)}  # Pin: phase, watts; as main.init_heaters
+GRID_PIN = 22
+OVERPOWER_W = 26 * 3_600_000 // (10_000 * 2)  # ControlLogic.overpower_limit pulses per 2 s cycle in W
+
+
+class _End(Exception):
+    pass
+
+
+def _on(pin_id: int) -> int:
+    """Output level of a pin, 0 until the firmware has configured it."""
+    pin = machine.Pin.board.get(pin_id)
+    return 0 if pin is None else pin.value()
+
+
+class Plant:
+    """Physical model of PV, house load, heaters and battery, energies in Wh."""
+
+    def __init__(
+        self,
+        bms: SeplosBMS,
+        meters: tuple[PulseMeter, PulseMeter],
+        end_s: float,
+        pv_peak: float = 10_000,
+        battery_wh: float = 10_240,
+        charge_limit: float = 5_000,
+        discharge_limit: float = 4_800,
+        base_load: float = 150,
+        step: float = 10.0,
+        seed: int = 1,
+    ) -> None:
+        self.bms = bms
+        self.meters = meters
+        self.end_s = end_s
+        self.pv_peak = pv_peak
+        self.battery_wh = battery_wh
+        self.charge_limit = charge_limit
+        self.discharge_limit = discharge_limit
+        self.base_load = base_load
+        self.step = step
+        self.random = random.Random(seed)
+        self.soc = bms.soc / 100
+        self.soc_min = self.soc
+        self.cloud = 1.0
+        self.cloud_until = 0.0
+        self.appliances = []  # (until [s], phase, watts)
+        self.last_s = None
+        self.next_s = 0.0
+        self.totals = dict.fromkeys(
+            ("pv", "house", "heaters", "import", "export", "curtailed", "charged", "discharged", "unserved"), 0.0
+        )
+        self.off_grid_s = 0.0
+        self.overpower_s = [0.0, 0.0]
+
+    def pv(self, seconds: float) -> float:
+        tt = time.localtime(seconds)
+        season = math.cos(2 * math.pi * (tt[7] - 172) / 365)  # 1 at the June solstice
+        day_hours = 12 + 4 * season
+        hour = tt[3] + tt[4] / 60 + tt[5] / 3600
+        sunrise = 12.5 - day_hours / 2
+        if not 0 < hour - sunrise < day_hours:
+            return 0.0
+        if seconds >= self.cloud_until:
+            self.cloud = min(1.0, max(0.05, self.random.gauss(0.7, 0.3)))
+            self.cloud_until = seconds + 900
+        peak = self.pv_peak * (0.65 + 0.35 * season)
+        return peak * math.sin(math.pi * (hour - sunrise) / day_hours) * self.cloud
+
+    def house(self, seconds: float) -> list[float]:
+        """Load of L1 and L2 without heaters, appliances start at random."""
+        hour = time.localtime(seconds)[3]
+        busy = 3.0 if hour in (6, 7, 11, 12, 17, 18, 19, 20) else 0.3 if hour < 6 else 1.0
+        if self.random.random() < busy * self.step / 3600:
+            duration = self.random.uniform(120, 1800)
+            self.appliances.append((seconds + duration, self.random.randint(0, 1), self.random.uniform(500, 2500)))
+        self.appliances = [appliance for appliance in self.appliances if appliance[0] > seconds]
+        load = [self.base_load, self.base_load]
+        for _, phase, watts in self.appliances:
+            load[phase] += watts
+        return load
+
+    def next_ms(self, now_ms: float) -> float:
+        return self.next_s * 1000
+
+    def __call__(self, now_ms: float) -> None:
+        seconds = now_ms / 1000
+        if seconds < self.next_s:
+            return
+        if self.last_s is not None:
+            self.integrate(seconds - self.last_s, _on(GRID_PIN))
+        if seconds >= self.end_s:
+            raise _End
+        self.last_s = seconds
+        self.next_s = seconds + self.step
+        self.update(time.time())
+
+    def update(self, seconds: float) -> None:
+        """Loads and battery state for the next step, fed to meters and BMS."""
+        self.pv_w = self.pv(seconds)
+        self.house_w = self.house(seconds)
+        phases = list(self.house_w)
+        self.heaters_w = 0.0
+        for pin, (phase, watts) in HEATERS.items():
+            if _on(pin):
+                phases[phase - 1] += watts
+                self.heaters_w += watts
+        self.phases_w = phases
+        for meter, watts in zip(self.meters, phases):
+            meter.watts = watts
+        surplus = self.pv_w - phases[0] - phases[1]
+        off_grid = _on(GRID_PIN)
+        if surplus > 0:
+            battery = min(surplus, self.charge_limit) if self.soc < 1 else 0.0
+        elif off_grid and self.soc > 0:
+            battery = max(surplus, -self.discharge_limit)
+        else:
+            battery = 0.0
+        self.battery_w = battery
+        self.surplus_w = surplus
+        voltage = 49.6 + 4.0 * self.soc
+        self.bms.soc = round(self.soc * 100, 1)
+        self.bms.current = max(-327.0, min(327.0, battery / voltage))
+        self.bms.voltage = voltage + self.bms.current * 0.005
+        self.bms.residual_capacity = self.bms.battery_capacity * self.soc
+
+    def integrate(self, seconds: float, off_grid: int) -> None:
+        hours = seconds / 3600
+        totals = self.totals
+        totals["pv"] += self.pv_w * hours
+        totals["house"] += (self.house_w[0] + self.house_w[1]) * hours
+        totals["heaters"] += self.heaters_w * hours
+        battery_wh = self.battery_w * hours
+        self.soc = min(1.0, max(0.0, self.soc + battery_wh / self.battery_wh))
+        self.soc_min = min(self.soc_min, self.soc)
+        if battery_wh > 0:
+            totals["charged"] += battery_wh
+        else:
+            totals["discharged"] -= battery_wh
+        rest = (self.surplus_w - self.battery_w) * hours
+        if rest > 0:
+            totals["curtailed" if off_grid else "export"] += rest
+        elif off_grid:
+            totals["unserved"] -= rest
+        else:
+            totals["import"] -= rest
+        if off_grid:
+            self.off_grid_s += seconds
+        for phase in range(2):
+            if self.phases_w[phase] > OVERPOWER_W:
+                self.overpower_s[phase] += seconds
+
+
+class Simulation:
+    """Virtual clock, simulated devices and plant for one firmware run."""
+
+    def __init__(self, start: float, days: float, seed: int = 1, step: float = 10.0, display: bool = False, **plant) -> None:
+        machine.Pin.board.clear()
+        machine.Timer.active.clear()
+        self.clock = VirtualClock(epoch=start).install()
+        self.bms = SeplosBMS(latency_ms=20)
+        self.bms.soc = 50.0
+        self.rtc = DS3231Chip(int_pin=19)
+        self.meters = (PulseMeter(26), PulseMeter(27))
+        machine.UART.attach(0, self.bms)
+        machine.I2C.attach(0, DS3231Chip.ADDR, self.rtc)
+        self.plant = Plant(self.bms, self.meters, days * 86400, step=step, seed=seed, **plant)
+        self.clock.pollers += [machine.Timer.service, machine.UART.service, *self.meters, self.rtc, self.plant]
+        self.display = display
+        self.wall_s = 0.0
+        self.switches = {}
+        self.completed = False
+
+    def run(self, quiet: bool = True) -> "Simulation":
+        import main
+        import models
+
+        render = models.LCD._update_screen
+        if not self.display:
+            models.LCD._update_screen = lambda lcd, timer: None
+        started = time.perf_counter()
+        output = io.StringIO() if quiet else None
+        with scratch_dir(), contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            try:
+                main.main()
+            except _End:
+                self.completed = True
+            finally:
+                models.LCD._update_screen = render
+        self.wall_s = time.perf_counter() - started
+        self.switches = {pin: machine.Pin.board[pin].changes for pin in (*HEATERS, GRID_PIN)}
+        return self
+
+    def report(self) -> str:
+        plant = self.plant
+        simulated = self.clock.now()
+        lines = [
+            f"simulated {simulated / 86400:.1f} days in {self.wall_s:.1f} s ({simulated / max(self.wall_s, 1e-9):.0f}x),"
+            f" {self.bms.requests} BMS requests, {self.clock.events} clock events",
+            *(f"{name:12}{value / 1000:10.1f} kWh" for name, value in plant.totals.items()),
+            f"{'soc':12}{plant.soc * 100:10.1f} % (min {plant.soc_min * 100:.1f} %)",
+            f"{'off grid':12}{plant.off_grid_s / 3600:10.1f} h",
+            f"{'overpower':12}{plant.overpower_s[0] / 3600:10.1f} h L1 {plant.overpower_s[1] / 3600:.1f} h L2",
+            *(() if self.completed else ("firmware main() returned early, see --verbose",)),
+            "relay switches " + " ".join(f"pin {pin}: {count}" for pin, count in self.switches.items()),
+        ]
+        return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--start", default="2024-06-01", help="local date YYYY-MM-DD")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--step", type=float, default=10.0, help="plant model step in seconds")
+    parser.add_argument("--pv", type=float, default=10_000, help="PV peak power in W")
+    parser.add_argument("--battery", type=float, default=10_240, help="battery capacity in Wh")
+    parser.add_argument("--charge-limit", type=float, default=5_000, help="battery charge power limit in W")
+    parser.add_argument("--discharge-limit", type=float, default=4_800, help="inverter power limit off grid in W")
+    parser.add_argument("--display", action="store_true", help="render the LCD every second, about a third slower")
+    parser.add_argument("--verbose", action="store_true", help="show what the firmware prints")
+    args = parser.parse_args()
+    start = time.mktime(time.strptime(args.start, "%Y-%m-%d"))
+    simulation = Simulation(
+        start,
+        args.days,
+        args.seed,
+        args.step,
+        pv_peak=args.pv,
+        battery_wh=args.battery,
+        charge_limit=args.charge_limit,
+        discharge_limit=args.discharge_limit,
+        display=args.display,
+    )
+    print(simulation.run(quiet=not args.verbose).report())
+
+
+if __name__ == "__main__":
+    main()
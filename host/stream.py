@@ -0,0 +1,196 @@
+"""Decode the binary telemetry stream of the Pico (``stream.py``) to CSV or SQLite.
+
+Usage::
+
+    python -m host.stream --port /dev/ttyACM0 --sqlite telemetry.db
+    python -m host.stream --file capture.bin > telemetry.csv
+
+Input is split at zero bytes. Every frame is COBS decoded and checked for
+length, version and checksum, then unpacked with one precompiled struct.
+Printed text is skipped, also when it runs into the next frame, and damaged
+frames are counted. Gaps in the sequence number count lost records. Rows
+are written in batches, CSV to stdout unless ``--csv`` or ``--sqlite`` is
+given. ``--port`` needs ``pyserial``.
+"""
+import argparse
+import csv
+import sqlite3
+import struct
+import sys
+import time
+
+import host
+
+host.install()
+
+from stream import ENABLED, ERROR, FORMAT, NONE, OFF_GRID, SIZE, VERSION, fletcher16  # noqa: E402
+
+RECORD = struct.Struct(FORMAT)
+COLUMNS = (
+    "sequence", "ticks_ms", "time", "soc", "current", "voltage", "cycles", "count_L1", "count_L2",
+    "relays", "control", "overpower_L1", "overpower_L2", "enabled", "off_grid", "error",
+    "poll_ms", "uart_us", "ctrl_us", "loop_us",
+)
+
+
+def cobs_decode(frame: bytes) -> bytes:
+    """Original bytes of a COBS frame without its zero delimiter."""
+    out = bytearray()
+    index = 0
+    while index < len(frame):
+        code = frame[index]
+        if not code or index + code > len(frame):
+            raise ValueError("COBS code", index, code)
+        out += frame[index + 1 : index + code]
+        index += code
+        if code < 0xFF and index < len(frame):
+            out.append(0)
+    return bytes(out)
+
+
+def row(values: tuple) -> tuple:
+    """Record values in units of the firmware log (%, A, V), flags split."""
+    (_, sequence, ticks_ms, seconds, soc, current, voltage, cycles, count_L1, count_L2, relays, control,
+     overpower_L1, overpower_L2, flags, poll_ms, uart_us, ctrl_us, loop_us) = values
+    return (
+        sequence, ticks_ms, seconds, soc / 10, current / 100, voltage / 100, cycles, count_L1, count_L2,
+        relays, control, None if overpower_L1 == NONE else overpower_L1,
+        None if overpower_L2 == NONE else overpower_L2, flags & ENABLED, flags & OFF_GRID and 1,
+        flags & ERROR and 1, poll_ms, uart_us, ctrl_us, loop_us,
+    )
+
+
+class StreamDecoder:
+    """Incremental decoder, feed() takes any chunking of the byte stream."""
+
+    def __init__(self) -> None:
+        self.pending = b""
+        self.records = 0
+        self.damaged = 0
+        self.skipped = 0  # Frames of other length, printed text
+        self.lost = 0
+        self.sequence = None
+
+    def feed(self, data: bytes) -> list[tuple]:
+        frames = (self.pending + data).split(b"\0")
+        self.pending = frames.pop()
+        rows = []
+        for frame in frames:
+            if len(frame) < SIZE + 1:
+                if frame:
+                    self.skipped += 1
+                continue
+            if len(frame) > SIZE + 1:
+                self.skipped += 1  # Text printed right before the frame
+                frame = frame[-SIZE - 1 :]
+            try:
+                record = cobs_decode(frame)
+            except ValueError:
+                self.damaged += 1
+                continue
+            if len(record) != SIZE or record[0] != VERSION or fletcher16(record, SIZE - 2) != int.from_bytes(
+                record[SIZE - 2 :], "little"
+            ):
+                self.damaged += 1
+                continue
+            values = RECORD.unpack_from(record)
+            if self.sequence is not None:
+                self.lost += (values[1] - self.sequence - 1) & 0xFFFF
+            self.sequence = values[1]
+            self.records += 1
+            rows.append(row(values))
+        return rows
+
+    def __str__(self) -> str:
+        return f"records {self.records} lost {self.lost} damaged {self.damaged} skipped {self.skipped}"
+
+
+class CsvSink:
+    def __init__(self, path: str) -> None:
+        self.file = sys.stdout if path == "-" else open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows: list[tuple]) -> None:
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class SqliteSink:
+    """Inserts rows into table ``stream``, one transaction per batch."""
+
+    def __init__(self, path: str) -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS stream ({', '.join(COLUMNS)})")
+        self.insert = f"INSERT INTO stream VALUES ({', '.join('?' * len(COLUMNS))})"
+
+    def write(self, rows: list[tuple]) -> None:
+        with self.connection:
+            self.connection.executemany(self.insert, rows)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def read_file(path: str, size: int = 1 << 16):
+    source = sys.stdin.buffer if path == "-" else open(path, "rb")
+    with source:
+        while chunk := source.read(size):
+            yield chunk
+
+
+def read_port(port: str, baudrate: int = 115200):
+    """Chunks from a USB CDC port until interrupted, empty chunks when idle."""
+    import serial
+
+    with serial.Serial(port=port, baudrate=baudrate, timeout=0.1) as connection:
+        while True:
+            yield connection.read(max(connection.in_waiting, 1))
+
+
+def convert(chunks, sink, flush: float = 1.0, batch: int = 5000) -> StreamDecoder:
+    """Decode chunks into sink, writing every flush seconds or batch rows."""
+    decoder = StreamDecoder()
+    pending = []
+    last_flush = time.monotonic()
+    try:
+        for chunk in chunks:
+            pending += decoder.feed(chunk)
+            if len(pending) >= batch or (pending and time.monotonic() - last_flush >= flush):
+                sink.write(pending)
+                pending = []
+                last_flush = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pending:
+            sink.write(pending)
+        sink.close()
+    return decoder
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--port", help="USB serial port of the Pico, e.g. /dev/ttyACM0")
+    source.add_argument("--file", help="captured stream, - for stdin")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--csv", metavar="FILE", default="-")
+    output.add_argument("--sqlite", metavar="FILE")
+    parser.add_argument("--flush", type=float, default=1.0, help="seconds between batch writes")
+    args = parser.parse_args()
+    sink = SqliteSink(args.sqlite) if args.sqlite else CsvSink(args.csv)
+    chunks = read_port(args.port) if args.port else read_file(args.file)
+    started = time.monotonic()
+    decoder = convert(chunks, sink, args.flush)
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(f"{decoder} ({decoder.records / elapsed:.0f} records/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
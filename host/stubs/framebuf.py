@@ -0,0 +1,108 @@
+"""CPython stand-in for MicroPython ``framebuf`` (RGB565 only).
+
+Pixels are stored little endian like on the RP2040. ``text`` draws 8x8
+placeholder glyphs derived from the character code, so output is
+deterministic but does not match the real font.
+"""
+
+MONO_VLSB = 0
+RGB565 = 1
+GS4_HMSB = 2
+MONO_HLSB = 3
+MONO_HMSB = 4
+GS2_HMSB = 5
+GS8 = 6
+
+
+def _glyph(char: str) -> bytes:
+    code = ord(char) & 0x7F
+    if code <= 32:
+        return bytes(8)
+    return bytes(((code * (row + 3) * 37) >> 1) & 0x7E for row in range(7)) + b"\x00"
+
+
+_FONT = {chr(code): _glyph(chr(code)) for code in range(128)}
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width: int, height: int, format: int, stride: int | None = None) -> None:
+        if format != RGB565:
+            raise ValueError("only RGB565 is supported on the host")
+        self._buf = memoryview(buffer).cast("B")
+        self._width = width
+        self._height = height
+        self._stride = width if stride is None else stride
+
+    def _offset(self, x: int, y: int) -> int:
+        return (y * self._stride + x) * 2
+
+    def pixel(self, x: int, y: int, c: int | None = None) -> int | None:
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            return None
+        offset = self._offset(x, y)
+        if c is None:
+            return self._buf[offset] | self._buf[offset + 1] << 8
+        self._buf[offset] = c & 0xFF
+        self._buf[offset + 1] = (c >> 8) & 0xFF
+        return None
+
+    def fill_rect(self, x: int, y: int, w: int, h: int, c: int) -> None:
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, self._width), min(y + h, self._height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        row = (c & 0xFFFF).to_bytes(2, "little") * (x1 - x0)
+        for yy in range(y0, y1):
+            start = self._offset(x0, yy)
+            self._buf[start : start + len(row)] = row
+
+    def fill(self, c: int) -> None:
+        self.fill_rect(0, 0, self._width, self._height, c)
+
+    def hline(self, x: int, y: int, w: int, c: int) -> None:
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x: int, y: int, h: int, c: int) -> None:
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x: int, y: int, w: int, h: int, c: int, f: bool = False) -> None:
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.hline(x, y, w, c)
+        self.hline(x, y + h - 1, w, c)
+        self.vline(x, y, h, c)
+        self.vline(x + w - 1, y, h, c)
+
+    def text(self, s: str, x: int, y: int, c: int = 1) -> None:
+        for char in s:
+            glyph = _FONT.get(char, _FONT["?"])
+            for row in range(8):
+                bits = glyph[row]
+                if bits:
+                    for col in range(8):
+                        if bits & (0x80 >> col):
+                            self.pixel(x + col, y + row, c)
+            x += 8
+
+    def blit(self, fbuf, x: int, y: int, key: int = -1, palette=None) -> None:
+        if isinstance(fbuf, tuple):
+            fbuf = FrameBuffer(*fbuf)
+        for sy in range(fbuf._height):
+            dy = y + sy
+            if not 0 <= dy < self._height:
+                continue
+            if key == -1:
+                sx0, sx1 = max(0, -x), min(fbuf._width, self._width - x)
+                if sx0 < sx1:
+                    src = fbuf._offset(sx0, sy)
+                    dst = self._offset(x + sx0, dy)
+                    self._buf[dst : dst + (sx1 - sx0) * 2] = fbuf._buf[src : src + (sx1 - sx0) * 2]
+                continue
+            for sx in range(fbuf._width):
+                c = fbuf.pixel(sx, sy)
+                if c != key:
+                    self.pixel(x + sx, dy, c)
+
+    def scroll(self, xstep: int, ystep: int) -> None:
+        raise NotImplementedError
@@ -0,0 +1,394 @@
+"""CPython stand-in for the MicroPython ``machine`` module (RP2040 subset).
+
+Peripherals keep class level registries so the host harness can attach
+simulated devices (Seplos BMS on a UART, DS3231 on I2C, pulse meters on pins).
+"""
+import time
+
+
+def freq(hz: int | None = None) -> int:
+    return 125_000_000
+
+
+def disable_irq() -> int:
+    return 0
+
+
+def enable_irq(state: int = 0) -> None:
+    pass
+
+
+def unique_id() -> bytes:
+    return b"\xe6\x60\x58\x38\x83\x2b\x2a\x2a"
+
+
+class Pin:
+    """GPIO pin; ``Pin.board`` maps pin id to the last created instance."""
+
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    board = {}
+    irqs = 0  # Handlers run so far, lightsleep wakes when it changes.
+
+    def __init__(self, id, mode: int = -1, pull: int = -1, value: int | None = None) -> None:
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 1 if pull == self.PULL_UP else 0
+        if value is not None:
+            self._value = 1 if value else 0
+        self.handler = None
+        self.trigger = 0
+        self.changes = 0
+        Pin.board[id] = self
+        time.host_clock.reschedule()  # Simulated devices may wait for the pin
+
+    def init(self, mode: int = -1, pull: int = -1, value: int | None = None) -> None:
+        if mode != -1:
+            self.mode = mode
+        if value is not None:
+            self.value(value)
+
+    def value(self, value: int | None = None) -> int | None:
+        if value is None:
+            return self._value
+        value = 1 if value else 0
+        if value != self._value:
+            self.changes += 1
+        self._value = value
+        return None
+
+    __call__ = value
+
+    def on(self) -> None:
+        self.value(1)
+
+    def off(self) -> None:
+        self.value(0)
+
+    def toggle(self) -> None:
+        self.value(not self._value)
+
+    def irq(self, handler=None, trigger: int = IRQ_FALLING | IRQ_RISING, hard: bool = False) -> None:
+        self.handler = handler
+        self.trigger = trigger
+
+    def drive(self, level: int) -> None:
+        """Drive an input from outside and run the IRQ handler on a matching edge."""
+        level = 1 if level else 0
+        if level == self._value:
+            return
+        self._value = level
+        edge = self.IRQ_RISING if level else self.IRQ_FALLING
+        if self.handler is not None and self.trigger & edge:
+            Pin.irqs += 1
+            self.handler(self)
+
+
+class UART:
+    """UART whose transmitted frames are answered by an attached device.
+
+    A device is any object with ``handle(frame: bytes) -> bytes | None`` and an
+    optional ``latency_ms`` attribute. Replies become readable once the device
+    latency plus the wire time at the configured baudrate has elapsed;
+    ``service`` and ``next_ms`` make their arrival an event of the host clock.
+    """
+
+    devices = {}
+    ports = {}  # Last created instance per id
+
+    def __init__(self, id: int, baudrate: int = 115200, tx=None, rx=None, **kwargs) -> None:
+        self.id = id
+        self.baudrate = baudrate
+        self.pending = []
+        self.rx = bytearray()
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+        UART.ports[id] = self
+
+    @classmethod
+    def attach(cls, id: int, device) -> None:
+        cls.devices[id] = device
+
+    @classmethod
+    def next_ms(cls, now_ms: float) -> float | None:
+        """When the next reply arrives, for the event driven host clock."""
+        due = None
+        now = time.ticks_ms()
+        for port in cls.ports.values():
+            if port.pending:
+                when = now_ms + time.ticks_diff(port.pending[0][0], now)
+                if due is None or when < due:
+                    due = when
+        return due
+
+    @classmethod
+    def service(cls, now_ms: float) -> None:
+        """Move arrived replies into the receive buffers."""
+        for port in cls.ports.values():
+            port._receive()
+
+    def init(self, baudrate: int = 115200, **kwargs) -> None:
+        self.baudrate = baudrate
+
+    def _wire_ms(self, nbytes: int) -> int:
+        return nbytes * 10 * 1000 // self.baudrate
+
+    def _receive(self) -> None:
+        now = time.ticks_ms()
+        while self.pending and time.ticks_diff(now, self.pending[0][0]) >= 0:
+            self.rx += self.pending.pop(0)[1]
+
+    def write(self, buf) -> int:
+        self.tx_bytes += len(buf)
+        device = self.devices.get(self.id)
+        reply = device.handle(bytes(buf)) if device is not None else None
+        if reply:
+            delay = getattr(device, "latency_ms", 0) + self._wire_ms(len(buf) + len(reply))
+            self.pending.append((time.ticks_add(time.ticks_ms(), delay), reply))
+            time.host_clock.reschedule()
+        return len(buf)
+
+    def any(self) -> int:
+        self._receive()
+        return len(self.rx)
+
+    def _take(self, nbytes: int) -> bytes:
+        data = bytes(self.rx[:nbytes])
+        del self.rx[:nbytes]
+        self.rx_bytes += len(data)
+        return data
+
+    def read(self, nbytes: int | None = None) -> bytes | None:
+        self._receive()
+        if not self.rx:
+            return None
+        return self._take(len(self.rx) if nbytes is None else nbytes)
+
+    def readline(self) -> bytes | None:
+        self._receive()
+        if not self.rx:
+            return None
+        end = self.rx.find(b"\n")
+        return self._take(len(self.rx) if end < 0 else end + 1)
+
+    def readinto(self, buf, nbytes: int | None = None) -> int | None:
+        self._receive()
+        if not self.rx:
+            return None
+        nbytes = min(len(buf) if nbytes is None else nbytes, len(self.rx))
+        buf[:nbytes] = self.rx[:nbytes]
+        del self.rx[:nbytes]
+        self.rx_bytes += nbytes
+        return nbytes
+
+    def flush(self) -> None:
+        pass
+
+    def txdone(self) -> bool:
+        return True
+
+
+class I2C:
+    """I2C bus; devices are attached per bus id and 7-bit address.
+
+    A device implements ``read(reg, nbytes) -> bytes`` and ``write(reg, data)``.
+    """
+
+    devices = {}
+
+    def __init__(self, id: int, scl=None, sda=None, freq: int = 400_000) -> None:
+        self.id = id
+        self.freq = freq
+        self.transactions = 0
+
+    @classmethod
+    def attach(cls, id: int, addr: int, device) -> None:
+        cls.devices[(id, addr)] = device
+
+    def _device(self, addr: int):
+        self.transactions += 1
+        try:
+            return self.devices[(self.id, addr)]
+        except KeyError:
+            raise OSError(5) from None  # EIO, nothing acknowledged
+
+    def scan(self) -> list[int]:
+        return sorted(addr for bus, addr in self.devices if bus == self.id)
+
+    def readfrom_mem(self, addr: int, memaddr: int, nbytes: int, addrsize: int = 8) -> bytes:
+        return bytes(self._device(addr).read(memaddr, nbytes))
+
+    def readfrom_mem_into(self, addr: int, memaddr: int, buf, addrsize: int = 8) -> None:
+        buf[:] = self._device(addr).read(memaddr, len(buf))
+
+    def writeto_mem(self, addr: int, memaddr: int, buf, addrsize: int = 8) -> None:
+        self._device(addr).write(memaddr, bytes(buf))
+
+
+class SPI:
+    """SPI bus recording traffic; an attached device sees every write."""
+
+    devices = {}
+
+    def __init__(self, id: int, baudrate: int = 1_000_000, polarity: int = 0, phase: int = 0, **kwargs) -> None:
+        self.id = id
+        self.baudrate = baudrate
+        self.bytes_written = 0
+        self.writes = 0
+
+    @classmethod
+    def attach(cls, id: int, device) -> None:
+        cls.devices[id] = device
+
+    def init(self, baudrate: int = 1_000_000, **kwargs) -> None:
+        self.baudrate = baudrate
+
+    def write(self, buf) -> None:
+        self.bytes_written += len(buf)
+        self.writes += 1
+        device = self.devices.get(self.id)
+        if device is not None:
+            device.write(buf)
+
+    def wire_seconds(self) -> float:
+        """Time the recorded traffic would have taken on the wire."""
+        return self.bytes_written * 8 / self.baudrate
+
+
+class Timer:
+    """Software timer serviced by the host clock while the firmware sleeps."""
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    active = []
+
+    def __init__(self, id: int = -1, **kwargs) -> None:
+        self.callback = None
+        self.period = 0
+        self.mode = self.PERIODIC
+        self.due = 0.0
+        self.calls = 0
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode: int = PERIODIC, period: int = -1, callback=None, freq: float = -1) -> None:
+        self.mode = mode
+        self.period = 1000 / freq if freq > 0 else period
+        self.callback = callback
+        self.due = time.host_clock.now() * 1000 + self.period
+        if self not in Timer.active:
+            Timer.active.append(self)
+        time.host_clock.reschedule()
+
+    def deinit(self) -> None:
+        if self in Timer.active:
+            Timer.active.remove(self)
+            time.host_clock.reschedule()
+
+    @classmethod
+    def next_ms(cls, now_ms: float) -> float | None:
+        """When the next timer is due, for the event driven host clock."""
+        due = None
+        for timer in cls.active:
+            if due is None or timer.due < due:
+                due = timer.due
+        return due
+
+    @classmethod
+    def service(cls, now_ms: float) -> None:
+        """Run callbacks of all due timers."""
+        for timer in list(cls.active):
+            if now_ms >= timer.due:
+                if timer.mode == cls.PERIODIC:
+                    timer.due += timer.period
+                else:
+                    timer.deinit()
+                timer.calls += 1
+                timer.callback(timer)
+
+
+class _Mem32:
+    """``machine.mem32`` covering the SIO GPIO output registers of the RP2040."""
+
+    GPIO_OUT = 0xD0000010
+    GPIO_OUT_SET = 0xD0000014
+    GPIO_OUT_CLR = 0xD0000018
+    GPIO_OUT_XOR = 0xD000001C
+    GPIOS = 30
+
+    def __init__(self) -> None:
+        self.writes = 0
+
+    def __getitem__(self, addr: int) -> int:
+        if addr != self.GPIO_OUT:
+            raise NotImplementedError(hex(addr))
+        value = 0
+        for gpio in range(self.GPIOS):
+            pin = Pin.board.get(gpio)
+            if pin is not None and pin.mode == Pin.OUT and pin.value():
+                value |= 1 << gpio
+        return value
+
+    def __setitem__(self, addr: int, value: int) -> None:
+        if addr not in (self.GPIO_OUT, self.GPIO_OUT_SET, self.GPIO_OUT_CLR, self.GPIO_OUT_XOR):
+            raise NotImplementedError(hex(addr))
+        self.writes += 1
+        for gpio in range(self.GPIOS):
+            pin = Pin.board.get(gpio)
+            if pin is None or pin.mode != Pin.OUT:
+                continue
+            bit = value >> gpio & 1
+            if addr == self.GPIO_OUT:
+                pin.value(bit)
+            elif not bit:
+                continue
+            elif addr == self.GPIO_OUT_SET:
+                pin.value(1)
+            elif addr == self.GPIO_OUT_CLR:
+                pin.value(0)
+            else:
+                pin.toggle()
+
+
+mem32 = _Mem32()
+
+
+class RTC:
+    """Pico RTC; holds a datetime that advances with the host clock."""
+
+    _set = None
+
+    def datetime(self, datetimetuple: tuple | None = None) -> tuple | None:
+        if datetimetuple is not None:
+            year, month, day, weekday, hours, minutes, seconds = tuple(datetimetuple)[:7]
+            RTC._set = (time.mktime((year, month, day, hours, minutes, seconds, weekday, 0)), time.time())
+            return None
+        if RTC._set is None:
+            secs = time.time()
+        else:
+            secs = RTC._set[0] + time.time() - RTC._set[1]
+        tt = time.localtime(secs)
+        return tt[0], tt[1], tt[2], tt[6], tt[3], tt[4], tt[5], 0
+
+
+def lightsleep(time_ms: int | None = None) -> None:
+    """Sleep until time_ms passes or a pin IRQ handler runs."""
+    deadline = time.ticks_add(time.ticks_ms(), time_ms or 0)
+    irqs = Pin.irqs
+    while Pin.irqs == irqs:
+        remaining = time.ticks_diff(deadline, time.ticks_ms())
+        if remaining <= 0:
+            break
+        time.sleep(min(remaining, 10) / 1000)
+
+
+def idle() -> None:
+    pass
@@ -0,0 +1,28 @@
+"""CPython stand-in for the ``micropython`` module."""
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
+
+
+def alloc_emergency_exception_buf(size: int) -> None:
+    pass
+
+
+def schedule(func, arg) -> None:
+    """Run scheduled callback immediately; the host has no hard IRQ context."""
+    func(arg)
+
+
+def mem_info(verbose: int = 0) -> None:
+    import gc
+
+    print("mem: total", gc.mem_alloc() + gc.mem_free(), "alloc", gc.mem_alloc(), "free", gc.mem_free())
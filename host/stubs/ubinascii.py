@@ -0,0 +1,2 @@
+"""CPython stand-in for MicroPython ``ubinascii``."""
+from binascii import a2b_base64, b2a_base64, crc32, hexlify, unhexlify  # noqa: F401
@@ -0,0 +1,2 @@
+"""CPython stand-in for MicroPython ``ujson``."""
+from json import dump, dumps, load, loads  # noqa: F401
@@ -0,0 +1,127 @@
+"""Low-power idle between main loop cycles.
+
+Enabled by ``main.IDLE_SLEEP``. While no BMS reply is expected the MCU
+sleeps with ``machine.lightsleep`` until the next cycle is due. A meter
+pulse IRQ or the DS3231 alarm wakes it earlier. The alarm drives the RTC
+synchronization, so there is no need to check the time every cycle.
+Wakes are counted by their cause. Wakes and idle fraction are written to
+the log and reset every report period, which also keeps the sums in small
+ints.
+"""
+import ds3231
+import machine
+import time
+
+EARLY_US = 1000  # A sleep ending this much before its timeout was cut short by an IRQ.
+
+
+class Idle:
+    """Sleeps between cycles and counts wakes by cause.
+
+    alarm is a ds3231.Alarm and alarm_pin the input wired to the open drain
+    INT output of the DS3231. Without them only the timeout and IRQs wake.
+    With light False, time.sleep_ms is used instead of lightsleep. This is
+    needed while core 1 runs, but the statistics and the alarm still work.
+    """
+
+    def __init__(
+        self,
+        alarm=None,
+        alarm_pin: machine.Pin | None = None,
+        max_ms: int = 1000,
+        report_ms: int = 600_000,
+        light: bool = True,
+    ) -> None:
+        self.alarm = alarm
+        self.max_ms = max_ms
+        self.report_ms = report_ms
+        self.light = light
+        self.alarmed = False
+        if alarm_pin is not None:
+            alarm_pin.irq(trigger=machine.Pin.IRQ_FALLING, handler=self._alarm_irq)
+        self.reset()
+
+    def reset(self) -> None:
+        self.since_ms = time.ticks_ms()
+        self.sleeps = 0
+        self.wakes_timer = 0
+        self.wakes_irq = 0
+        self.wakes_alarm = 0
+        self.idle_ms = 0
+        self.idle_us = 0  # Remainder below one millisecond
+
+    def _alarm_irq(self, _: machine.Pin) -> None:
+        self.alarmed = True
+
+    def set_daily(self, seconds: int) -> None:
+        """Alarm every day seconds after midnight, an old flag is dropped."""
+        self.alarm.clear()
+        self.alarmed = False
+        self.alarm.set(ds3231.EVERY_DAY, hr=seconds // 3600, min=seconds // 60 % 60, sec=seconds % 60)
+
+    def set_at(self, seconds: int) -> None:
+        """Alarm at time seconds since epoch, matched by day of month, within a month."""
+        tt = time.localtime(seconds)
+        self.alarm.clear()
+        self.alarmed = False
+        self.alarm.set(ds3231.EVERY_MONTH, day=tt[2], hr=tt[3], min=tt[4], sec=tt[5])
+
+    def take_alarm(self) -> bool:
+        """True once per alarm. The flag on the DS3231 is cleared, which releases INT."""
+        if not self.alarmed:
+            return False
+        self.alarmed = False
+        if self.alarm is not None:
+            self.alarm.clear()
+        return True
+
+    def sleep_ms(self, ms: int) -> None:
+        """Sleep at most ms (and max_ms), shorter if an IRQ wakes the MCU."""
+        if ms > self.max_ms:
+            ms = self.max_ms
+        alarmed = self.alarmed
+        start = time.ticks_us()
+        if self.light:
+            machine.lightsleep(ms)
+        else:
+            time.sleep_ms(ms)
+        slept = time.ticks_diff(time.ticks_us(), start)
+        self.sleeps += 1
+        if self.alarmed and not alarmed:
+            self.wakes_alarm += 1
+        elif slept < ms * 1000 - EARLY_US:
+            self.wakes_irq += 1
+        else:
+            self.wakes_timer += 1
+        self.idle_us += slept
+        self.idle_ms += self.idle_us // 1000
+        self.idle_us %= 1000
+
+    def idle_permille(self) -> int:
+        elapsed = time.ticks_diff(time.ticks_ms(), self.since_ms)
+        return self.idle_ms * 1000 // elapsed if elapsed > 0 else 0
+
+    def items(self) -> list[tuple[str, int | str]]:
+        """Logged values, in the format DataLogger.log takes."""
+        return [
+            ("stage", "idle"),
+            ("sleeps", self.sleeps),
+            ("timer", self.wakes_timer),
+            ("irq", self.wakes_irq),
+            ("alarm", self.wakes_alarm),
+            ("idle_ms", self.idle_ms),
+            ("idle_permille", self.idle_permille()),
+        ]
+
+    def poll(self, logger) -> None:
+        """Log and reset once the period is over."""
+        if time.ticks_diff(time.ticks_ms(), self.since_ms) >= self.report_ms:
+            logger.log(self)
+            self.reset()
+
+    def __str__(self) -> str:
+        permille = self.idle_permille()
+        return (
+            f"idle     sleeps {self.sleeps:6d} wakes timer {self.wakes_timer:6d} irq {self.wakes_irq:6d}"
+            f" alarm {self.wakes_alarm:3d} idle {permille // 10:3d}.{permille % 10:d} %"
+        )
@@ -30,21 +30,16 @@ class Alarm:
         self.offs = 7 if self.alno == 1 else 0x0B  # Offset into address map
         self.mask = 0
 
-    def _reg(self, offs : int, buf = bytearray(1)) -> int:  # Read a register
-        self._i2c.readfrom_mem_into(_ADDR, offs, buf)
-        return buf[0]
-
     def enable(self, run):
-        flags = self._reg(0x0E) | 4  # Disable square wave
+        flags = self._device.control | 4  # Disable square wave
         flags = (flags | self.alno) if run else (flags & ~self.alno & 0xFF)
-        self._i2c.writeto_mem(_ADDR, 0x0E, flags.to_bytes(1, "little"))
+        self._device.set_control(flags)
 
     def __call__(self):  # Return True if alarm is set
-        return bool(self._reg(0x0F) & self.alno)
+        return bool(self._device.status() & self.alno)
 
     def clear(self):
-        flags = (self._reg(0x0F) & ~self.alno) & 0xFF
-        self._i2c.writeto_mem(_ADDR, 0x0F, flags.to_bytes(1, "little"))
+        self._device.clear_flags(self.alno)
 
     def set(self, when, day=0, hr=0, min=0, sec=0):
         if when not in (0x0F, 0x0E, 0x0C, 0x80, 0x40, 0):
@@ -56,56 +51,96 @@ class Alarm:
         self.enable(True)
 
 
+def _bcd2dec(bcd):  # Strip MSB
+    return ((bcd & 0x70) >> 4) * 10 + (bcd & 0x0F)
+
+
+# Given BCD value return a binary byte. Modifier:
+# Set MSB if any of bit(1..4) or bit 7 set, set b6 if mod[6]
+def _gbyte(dec, mod=0):
+    tens, units = divmod(dec, 10)
+    n = (tens << 4) + units
+    return n | (0x80 if mod & 0x0F else mod & 0xC0)
+
+
 class DS3231:
+    # Control (0x0E) and the writable bits of status (0x0F) are shadowed, so
+    # enabling and clearing alarms needs no read. Alarm flags of the status
+    # register can only be written to 0, so clearing one leaves the other.
     def __init__(self, i2c):
         self.ds3231 = i2c
         self.alarm1 = Alarm(self, 1)
         self.alarm2 = Alarm(self, 2)
         if _ADDR not in self.ds3231.scan():
             raise RuntimeError(f"DS3231 not found on I2C bus at {_ADDR}")
-
-    def get_time(self, data=bytearray(7)):
-        def bcd2dec(bcd):  # Strip MSB
-            return ((bcd & 0x70) >> 4) * 10 + (bcd & 0x0F)
-
+        self._reg = bytearray(1)
+        self._buf = memoryview(bytearray(7))
+        self.control = self._read(0x0E)
+        self.status()
+
+    def _read(self, offs):
+        self.ds3231.readfrom_mem_into(_ADDR, offs, self._reg)
+        return self._reg[0]
+
+    def _write(self, offs, value):
+        self._reg[0] = value
+        self.ds3231.writeto_mem(_ADDR, offs, self._reg)
+
+    def set_control(self, value):  # Written only if it differs from the shadow
+        if value != self.control:
+            self._write(0x0E, value)
+            self.control = value
+
+    def status(self):  # Read status register, alarm flags in bits 0 and 1
+        status = self._read(0x0F)
+        self._status = status & 0x88  # OSF and EN32kHz
+        return status
+
+    def clear_flags(self, flags):
+        self._write(0x0F, (self._status | 3) & ~flags & 0xFF)
+
+    # Time in RTC.datetime() format (year, month, day, weekday, hours,
+    # minutes, seconds, 0), weekday 0 is Monday. A list of 8 passed as tt is
+    # filled in place, which allocates nothing.
+    def get_time(self, tt=None, data=bytearray(7)):
+        if tt is None:
+            return tuple(self.get_time([0] * 8))
         self.ds3231.readfrom_mem_into(_ADDR, 0, data)
-        ss, mm, hh, wday, DD, MM, YY = [bcd2dec(x) for x in data]
-        YY += 2000
-        # Time from DS3231 in time.localtime() format (less yday)
-        return YY, MM, DD, wday - 1, hh, mm, ss, 0
-
-    # Output time or alarm data to device
+        tt[0] = _bcd2dec(data[6]) + 2000
+        tt[1] = _bcd2dec(data[5])
+        tt[2] = _bcd2dec(data[4])
+        tt[3] = _bcd2dec(data[3]) - 1
+        tt[4] = _bcd2dec(data[2])
+        tt[5] = _bcd2dec(data[1])
+        tt[6] = _bcd2dec(data[0])
+        tt[7] = 0
+        return tt
+
+    # Output time or alarm data to device in one burst write
     # args: tt A datetime tuple. If absent uses localtime.
     # alarm: An Alarm instance or None if setting time
     def set_time(self, tt=None, alarm=None):
-        # Given BCD value return a binary byte. Modifier:
-        # Set MSB if any of bit(1..4) or bit 7 set, set b6 if mod[6]
-        def gbyte(dec, mod=0):
-            tens, units = divmod(dec, 10)
-            n = (tens << 4) + units
-            n |= 0x80 if mod & 0x0F else mod & 0xC0
-            return n.to_bytes(1, "little")
-
         YY, MM, mday, hh, mm, ss, wday, yday = time.localtime() if tt is None else tt
         mask = 0 if alarm is None else alarm.mask
         offs = 0 if alarm is None else alarm.offs
+        buf = self._buf
+        n = 0
         if alarm is None or alarm.alno == 1:  # Has a seconds register
-            self.ds3231.writeto_mem(_ADDR, offs, gbyte(ss, mask & 1))
-            offs += 1
-        self.ds3231.writeto_mem(_ADDR, offs, gbyte(mm, mask & 2))
-        offs += 1
-        self.ds3231.writeto_mem(_ADDR, offs, gbyte(hh, mask & 4))  # Sets to 24hr mode
-        offs += 1
+            buf[0] = _gbyte(ss, mask & 1)
+            n = 1
+        buf[n] = _gbyte(mm, mask & 2)
+        buf[n + 1] = _gbyte(hh, mask & 4)  # Sets to 24hr mode
+        n += 2
         if alarm is not None:  # Setting an alarm - mask holds MS 2 bits
-            self.ds3231.writeto_mem(_ADDR, offs, gbyte(mday, mask))
+            buf[n] = _gbyte(mday, mask)
+            n += 1
         else:  # Setting time
-            self.ds3231.writeto_mem(_ADDR, offs, gbyte(wday + 1))  # 1 == Monday, 7 == Sunday
-            offs += 1
-            self.ds3231.writeto_mem(_ADDR, offs, gbyte(mday))  # Day of month
-            offs += 1
-            self.ds3231.writeto_mem(_ADDR, offs, gbyte(MM, 0x80))  # Century bit (>Y2K)
-            offs += 1
-            self.ds3231.writeto_mem(_ADDR, offs, gbyte(YY - 2000))
+            buf[3] = _gbyte(wday + 1)  # 1 == Monday, 7 == Sunday
+            buf[4] = _gbyte(mday)  # Day of month
+            buf[5] = _gbyte(MM, 0x80)  # Century bit (>Y2K)
+            buf[6] = _gbyte(YY - 2000)
+            n = 7
+        self.ds3231.writeto_mem(_ADDR, offs, buf[:n])
 
     def temperature(self):
         def twos_complement(input_value: int, num_bits: int) -> int:
@@ -8,6 +8,31 @@ MOSI = 11
 SCK = 10
 CS = 9
 
+# Command streams, records of (command, data length, data...)
+INIT_STREAM = bytes((
+    0x36, 1, 0x70,
+    0x3A, 1, 0x05,
+    0xB2, 5, 0x0C, 0x0C, 0x00, 0x33, 0x33,
+    0xB7, 1, 0x35,
+    0xBB, 1, 0x19,
+    0xC0, 1, 0x2C,
+    0xC2, 1, 0x01,
+    0xC3, 1, 0x12,
+    0xC4, 1, 0x20,
+    0xC6, 1, 0x0F,
+    0xD0, 2, 0xA4, 0xA1,
+    0xE0, 14, 0xD0, 0x04, 0x0D, 0x11, 0x13, 0x2B, 0x3F, 0x54, 0x4C, 0x18, 0x0D, 0x0B, 0x1F, 0x23,
+    0xE1, 14, 0xD0, 0x04, 0x0C, 0x11, 0x13, 0x2C, 0x3F, 0x44, 0x51, 0x2F, 0x1F, 0x1F, 0x20, 0x23,
+    0x21, 0,
+    0x11, 0,
+    0x29, 0,
+))
+WINDOW_STREAM = bytes((
+    0x2A, 4, 0x00, 0x28, 0x01, 0x17,  # Columns 40 .. 279
+    0x2B, 4, 0x00, 0x35, 0x00, 0xBB,  # Rows 53 .. 187, patched for bands
+    0x2C, 0,
+))
+
 
 class LCD_1inch14(framebuf.FrameBuffer):
     def __init__(self):
@@ -24,6 +49,7 @@ class LCD_1inch14(framebuf.FrameBuffer):
         self.dc = Pin(DC, Pin.OUT)
         self.dc(1)
         self.buffer = bytearray(self.height * self.width * 2)
+        self.window = bytearray(WINDOW_STREAM)
         super().__init__(self.buffer, self.width, self.height, framebuf.RGB565)
         self.init_display()
 
@@ -48,105 +74,49 @@ class LCD_1inch14(framebuf.FrameBuffer):
         self.spi.write(bytearray([buf]))
         self.cs(1)
 
+    def write_stream(self, stream):
+        """Send command stream of records (command, data length, data...)
+
+        Every command and its data run go out in one transaction without
+        allocating per byte.
+        """
+        view = memoryview(stream)
+        index = 0
+        while index < len(stream):
+            length = stream[index + 1]
+            self.cs(1)
+            self.dc(0)
+            self.cs(0)
+            self.spi.write(view[index : index + 1])
+            if length:
+                self.dc(1)
+                self.spi.write(view[index + 2 : index + 2 + length])
+            self.cs(1)
+            index += 2 + length
+
     def init_display(self):
         """Initialize dispaly"""
         self.rst(1)
         self.rst(0)
         self.rst(1)
-
-        self.write_cmd(0x36)
-        self.write_data(0x70)
-
-        self.write_cmd(0x3A)
-        self.write_data(0x05)
-
-        self.write_cmd(0xB2)
-        self.write_data(0x0C)
-        self.write_data(0x0C)
-        self.write_data(0x00)
-        self.write_data(0x33)
-        self.write_data(0x33)
-
-        self.write_cmd(0xB7)
-        self.write_data(0x35)
-
-        self.write_cmd(0xBB)
-        self.write_data(0x19)
-
-        self.write_cmd(0xC0)
-        self.write_data(0x2C)
-
-        self.write_cmd(0xC2)
-        self.write_data(0x01)
-
-        self.write_cmd(0xC3)
-        self.write_data(0x12)
-
-        self.write_cmd(0xC4)
-        self.write_data(0x20)
-
-        self.write_cmd(0xC6)
-        self.write_data(0x0F)
-
-        self.write_cmd(0xD0)
-        self.write_data(0xA4)
-        self.write_data(0xA1)
-
-        self.write_cmd(0xE0)
-        self.write_data(0xD0)
-        self.write_data(0x04)
-        self.write_data(0x0D)
-        self.write_data(0x11)
-        self.write_data(0x13)
-        self.write_data(0x2B)
-        self.write_data(0x3F)
-        self.write_data(0x54)
-        self.write_data(0x4C)
-        self.write_data(0x18)
-        self.write_data(0x0D)
-        self.write_data(0x0B)
-        self.write_data(0x1F)
-        self.write_data(0x23)
-
-        self.write_cmd(0xE1)
-        self.write_data(0xD0)
-        self.write_data(0x04)
-        self.write_data(0x0C)
-        self.write_data(0x11)
-        self.write_data(0x13)
-        self.write_data(0x2C)
-        self.write_data(0x3F)
-        self.write_data(0x44)
-        self.write_data(0x51)
-        self.write_data(0x2F)
-        self.write_data(0x1F)
-        self.write_data(0x1F)
-        self.write_data(0x20)
-        self.write_data(0x23)
-
-        self.write_cmd(0x21)
-
-        self.write_cmd(0x11)
-
-        self.write_cmd(0x29)
+        self.write_stream(INIT_STREAM)
 
     def show(self):
-        self.write_cmd(0x2A)
-        self.write_data(0x00)
-        self.write_data(0x28)
-        self.write_data(0x01)
-        self.write_data(0x17)
-
-        self.write_cmd(0x2B)
-        self.write_data(0x00)
-        self.write_data(0x35)
-        self.write_data(0x00)
-        self.write_data(0xBB)
-
-        self.write_cmd(0x2C)
+        self.show_rows(0, self.height)
+
+    def show_rows(self, y, height):
+        """Send only band of rows y .. y + height - 1 to the display"""
+        start = 0x35 + y
+        end = start + height - 1
+        window = self.window
+        window[8] = start >> 8
+        window[9] = start & 0xFF
+        window[10] = end >> 8
+        window[11] = end & 0xFF
+        self.write_stream(window)
 
         self.cs(1)
         self.dc(1)
         self.cs(0)
-        self.spi.write(self.buffer)
+        self.spi.write(memoryview(self.buffer)[y * self.width * 2 : (y + height) * self.width * 2])
         self.cs(1)
@@ -1,9 +1,39 @@
 import models
+import history
+import profiler
+import dualcore
+import idle
+import stream
 import ds3231
 import machine
+import micropython
 import time
 import lcd_1inch14
 
+OFF_GRID_RELAY_BIT = 7  # Relay bitmask in history, lower bits are heaters.
+OVERPOWER_DEADLINE_MS = 3000  # Longest time without overpower check, even if battery is not responding.
+ASYNC_RUNTIME = False  # Run as uasyncio tasks (runtime.py) instead of the polling loop below.
+PACK_ADDRESSES = [0]  # Seplos packs in parallel on the RS485 bus.
+PACKS_PER_CYCLE = 0  # Packs read per cycle, 0 all of them back to back, 1 round robin.
+FAST_SHED = False  # Shed overpower from the meter IRQ, not only once per cycle.
+SHED_HOLD_MS = 60_000  # A phase shed by FAST_SHED gets no heater switched on for this long.
+ADAPTIVE_POLLING = True  # Poll BMS faster near thresholds and slower while stable, instead of every 2 s.
+NOMINAL_CYCLE_MS = 2000  # Period the overpower pulse limits are set for, counts are rescaled to it.
+MIN_SWITCH_MS = NOMINAL_CYCLE_MS - 200  # Heaters switch on at most once per cycle of 2 s polling, less reply jitter.
+SYNC_AFTER_S = 20 * 3600  # Daily RTC synchronization from 20:00.
+ADAPTIVE_SYNC = True  # Synchronize RTC when the measured drift reaches SYNC_TOLERANCE_S instead of daily.
+SYNC_TOLERANCE_S = 1
+PROFILE = const(0)  # Per-stage timing, 1 enables it; with 0 the compiler drops the profiling code.
+PROFILE_DUMP_MS = 600_000  # Stage statistics are written to the log and reset this often.
+DIAGNOSTICS_KEY = 15  # Key A of the LCD module toggles the diagnostics page while profiling.
+DUAL_CORE = False  # Render the LCD and send it over SPI on core 1, core 0 only hands over telemetry.
+LOG_ON_CORE1 = False  # With DUAL_CORE also write log and config on core 1.
+IDLE_SLEEP = False  # Lightsleep between cycles, RTC synchronization from the DS3231 alarm.
+RTC_ALARM_PIN = 19  # INT output of the DS3231, pulled low on alarm.
+IDLE_MAX_MS = 1000  # Longest sleep, the LCD timer does not run during lightsleep.
+IDLE_REPORT_MS = 600_000  # Wake counts and idle fraction are written to the log and reset this often.
+STREAM = False  # Write a binary telemetry record of every cycle to USB serial (stream.py).
+
 
 def init_counters() -> tuple[models.Counter, models.Counter]:
     """Inits counter objects."""
@@ -12,46 +42,65 @@ def init_counters() -> tuple[models.Counter, models.Counter]:
     return counter_l1, counter_l2
 
 
-def init_battery() -> models.Battery:
+def init_battery() -> models.Battery | models.BatteryBank:
     rs485 = machine.UART(0, baudrate=19200, tx=machine.Pin(0), rx=machine.Pin(1))
-    return models.Battery(rs485)
+    battery = models.Battery(rs485, address=PACK_ADDRESSES[0])
+    if len(PACK_ADDRESSES) == 1:
+        return battery
+    return models.BatteryBank(battery, PACK_ADDRESSES, PACKS_PER_CYCLE)
 
 
 def init_heaters() -> models.OutputHeaters:
     pin_indexes_L1 = [0, 2]
     pin_indexes_L2 = [1]
-    pins = [machine.Pin(pin, machine.Pin.OUT, value=0) for pin in [6, 7, 14]]
-    return models.OutputHeaters(pins, pin_indexes_L1, pin_indexes_L2)
+    gpios = [6, 7, 14]
+    pins = [machine.Pin(pin, machine.Pin.OUT, value=0) for pin in gpios]
+    return models.OutputHeaters(pins, pin_indexes_L1, pin_indexes_L2, gpios, MIN_SWITCH_MS)
+
+
+def init_fast_shed(
+    heaters: models.OutputHeaters,
+    counter_L1: models.Counter,
+    counter_L2: models.Counter,
+    control: models.ControlLogic,
+) -> models.FastShed | None:
+    if not FAST_SHED:
+        return None
+    micropython.alloc_emergency_exception_buf(100)
+    return models.FastShed(heaters, counter_L1, counter_L2, control.overpower_limit, hold_ms=SHED_HOLD_MS)
 
 
-def synchronization(time: list[int]) -> str | None:
-    """Synchronize Pico RTC with external clock."""
+def synchronization(time: list[int], drift: models.ClockDrift | None = None) -> str | None:
+    """Synchronize Pico RTC with external clock, drift of the Pico RTC is measured first."""
     try:
-        machine.RTC().datetime(time)
+        rtc = machine.RTC()
+        if drift is not None:
+            drift.measure(rtc.datetime(), time)
+        rtc.datetime(time)
         return None
     except BaseException:
         return "Clock synchronization"
 
 
-def init_clock() -> ds3231.DS3231:
+def init_clock(drift: models.ClockDrift | None = None) -> ds3231.DS3231:
     clock = ds3231.DS3231(machine.I2C(0, scl=machine.Pin(21), sda=machine.Pin(20)))
-    if synchronization(clock.get_time()) is not None:
+    if synchronization(clock.get_time(), drift) is not None:
         raise BaseException
     return clock
 
 
 def update_if_changed(
-    data: dict[str, int | None | str | float],
+    telemetry: models.Telemetry,
     cycles_record: dict[str, int | list[int]],
     config: models.Config,
     logger: models.DataLogger,
 ) -> dict[str, int | list[int]]:
-    number = data.get("cycles")
+    number = telemetry.cycles
     num_list = cycles_record["last_three"]
-    if all(item == number for item in num_list):
+    if num_list.count(number) == len(num_list):
         if cycles_record["count"] != number:
             config.set("cycles", number)
-            logger.log(data)
+            logger.log(telemetry)
             cycles_record["count"] = number
     else:
         num_list.pop(0)
@@ -60,53 +109,238 @@ def update_if_changed(
     return cycles_record
 
 
+def init_idle(clock: ds3231.DS3231, drift: models.ClockDrift | None) -> idle.Idle | None:
+    if not IDLE_SLEEP:
+        return None
+    alarm_pin = machine.Pin(RTC_ALARM_PIN, machine.Pin.IN, machine.Pin.PULL_UP)
+    sleeper = idle.Idle(clock.alarm1, alarm_pin, IDLE_MAX_MS, IDLE_REPORT_MS, light=not DUAL_CORE)
+    if drift is not None:
+        sleeper.set_at(drift.next_s)
+    else:
+        sleeper.set_daily(SYNC_AFTER_S)
+    return sleeper
+
+
+def init_core1(
+    lcd: models.LCD,
+    handoff: dualcore.Handoff,
+    cycles_record: dict[str, int | list[int]],
+    config: models.Config,
+    logger: models.DataLogger,
+    render=None,
+) -> dualcore.Core1:
+    """Start display (and with LOG_ON_CORE1 logging) loop on core 1."""
+    log = None
+    if LOG_ON_CORE1:
+
+        def log(snapshot: models.Telemetry) -> None:
+            update_if_changed(snapshot, cycles_record, config, logger)
+            handoff.drain(logger)
+            logger.poll()
+            config.poll()
+
+    core1 = dualcore.Core1(lcd, handoff, render, log)
+    core1.start()
+    return core1
+
+
+def sync_due(last_sync: int, now: int) -> bool:
+    """Daily synchronization is due, last_sync and now in days and seconds since epoch."""
+    return last_sync != now // 86400 and now % 86400 >= SYNC_AFTER_S
+
+
 def main() -> None:
     # Init start
     counter_L1, counter_L2 = init_counters()
     batery = init_battery()
     heaters = init_heaters()
     grid_connector = machine.Pin(22, machine.Pin.OUT, value=0)
-    data = {"enabled": False, "error": None, "soc": 0, "current": 0, "voltage": 0, "cycles": 0, "off_grid": 0}
-    lcd = models.LCD(lcd_1inch14.LCD_1inch14(), machine.Timer(), data)
-    clock = init_clock()
+    telemetry = models.Telemetry()
+    handoff = None
+    render = None
+    if DUAL_CORE:
+        # Core 1 renders its own copy, taken from the handoff.
+        handoff = dualcore.Handoff()
+        lcd = models.LCD(lcd_1inch14.LCD_1inch14(), None, models.Telemetry())
+    if PROFILE:
+        stages = profiler.Profiler(["uart", "ctrl", "sync", "hist", "log", "cfg", "lcd", "loop"], PROFILE_DUMP_MS)
+        if not DUAL_CORE:
+            lcd = models.LCD(lcd_1inch14.LCD_1inch14(), None, telemetry)
+        lcd.diagnostics = stages.lines
+        render = stages.timed("lcd", lcd._update_screen)
+        if not DUAL_CORE:
+            machine.Timer().init(mode=machine.Timer.PERIODIC, period=1000, callback=render)
+        key = machine.Pin(DIAGNOSTICS_KEY, machine.Pin.IN, machine.Pin.PULL_UP)
+        key.irq(trigger=machine.Pin.IRQ_FALLING, handler=lcd.toggle_diagnostics)
+    elif not DUAL_CORE:
+        lcd = models.LCD(lcd_1inch14.LCD_1inch14(), machine.Timer(), telemetry)
+    drift = models.ClockDrift(SYNC_TOLERANCE_S) if ADAPTIVE_SYNC else None
+    clock = init_clock(drift)
+    clock_time = [0] * 8
     config = models.Config("config.json")
-    config.load()
     logger = models.DataLogger("log.csv")
+    telemetry_history = history.History()
     cycles = config.get("cycles", 0)
     cycles_recorder = {"count": cycles, "last_three": 3 * [cycles]}
     control = models.ControlLogic()
-    send_telemetry = "7E3230303034363432453030323030464433370D"
-    last_sync = time.localtime()[2]
-    last_cycle = time.time()
+    shed = init_fast_shed(heaters, counter_L1, counter_L2, control)
+    poll = models.PollScheduler(control, normal_ms=NOMINAL_CYCLE_MS)
+    sleeper = init_idle(clock, drift)
+    telemetry_stream = stream.TelemetryStream() if STREAM else None
+    last_sync = time.time() // 86400
+    last_request = time.ticks_add(time.ticks_ms(), -NOMINAL_CYCLE_MS)
+    last_control = time.ticks_ms()
+    core1 = None
+    log_sink = logger  # Where core 0 logs profiler and idle statistics
+    if DUAL_CORE:
+        core1 = init_core1(lcd, handoff, cycles_recorder, config, logger, render)
+        if LOG_ON_CORE1:
+            log_sink = handoff
     # Init end
-    while data["error"] is None:
-        if time.time() - last_cycle >= 2:
-            actual_time = time.localtime()
-            battery_data = batery.read_battery_parameters(send_telemetry, heaters)
-            data |= battery_data | {"count_L1": counter_L1.get_count(), "count_L2": counter_L2.get_count()}
-
-            control_args_heaters = control.heaters_logic(
-                data["soc"], data["current"], data["count_L1"], data["count_L2"]
-            )
-            heaters.set_pins(*control_args_heaters)
-            data["enabled"] = control_args_heaters[0]
-
-            control_off_grid = control.off_grid_logic(data["soc"])
-            grid_connector.value(control_off_grid)
-            data["off_grid"] = control_off_grid
-
-            if last_sync != actual_time[2] and 19 < actual_time[3]:
-                data["error"] = synchronization(clock.get_time())
-                last_sync = actual_time[2]
-
-            cycles_recorder = update_if_changed(data, cycles_recorder, config, logger)
-            lcd.update_values(data)
-            last_cycle = time.time()
-        else:
-            time.sleep(0.2)
+    try:
+        while telemetry.error is None:
+            now = time.ticks_ms()
+            if not batery.busy() and poll.due(last_request, now):
+                batery.request()
+                poll.requested(now)
+                last_request = now
+                if PROFILE:
+                    stages["uart"].start()
+            if batery.step(heaters, telemetry):
+                if PROFILE:
+                    stages["uart"].stop()
+                    stages["loop"].start()
+                    stages["ctrl"].start()
+                # History, stream and log get the counts control sees, pulses per NOMINAL_CYCLE_MS
+                telemetry.count_L1 = counter_L1.scaled(counter_L1.get_count(), NOMINAL_CYCLE_MS)
+                telemetry.count_L2 = counter_L2.scaled(counter_L2.get_count(), NOMINAL_CYCLE_MS)
+                previous_relays = heaters.state() | telemetry.off_grid << OFF_GRID_RELAY_BIT
+
+                control.update(telemetry, telemetry.count_L1, telemetry.count_L2)
+                if shed is not None:
+                    shed.hold(telemetry)
+                heaters.set_pins(telemetry.enabled, telemetry.overpower_L1, telemetry.overpower_L2, telemetry.control)
+                grid_connector.value(telemetry.off_grid)
+                relays = heaters.state() | telemetry.off_grid << OFF_GRID_RELAY_BIT
+                if ADAPTIVE_POLLING:
+                    poll.update(telemetry.soc, telemetry.current, time.ticks_ms(), relays != previous_relays)
+                if PROFILE:
+                    stages["ctrl"].stop()
+
+                seconds = time.time()
+                if sleeper is not None:
+                    sync = sleeper.take_alarm()
+                elif drift is not None:
+                    sync = drift.due(seconds)
+                else:
+                    sync = sync_due(last_sync, seconds)
+                if sync:
+                    if PROFILE:
+                        stages["sync"].start()
+                    telemetry.error = synchronization(clock.get_time(clock_time), drift)
+                    last_sync = seconds // 86400
+                    if sleeper is not None and drift is not None:
+                        sleeper.set_at(drift.next_s)
+                    if PROFILE:
+                        stages["sync"].stop()
+
+                if PROFILE:
+                    stages["hist"].start()
+                telemetry_history.record(
+                    seconds,
+                    telemetry.soc,
+                    telemetry.current,
+                    telemetry.voltage,
+                    telemetry.count_L1,
+                    telemetry.count_L2,
+                    relays,
+                )
+                if PROFILE:
+                    stages["hist"].stop()
+                    stages["log"].start()
+                if core1 is None or not LOG_ON_CORE1:
+                    cycles_recorder = update_if_changed(telemetry, cycles_recorder, config, logger)
+                    logger.poll()
+                if PROFILE:
+                    stages["log"].stop()
+                    stages["cfg"].start()
+                if core1 is None or not LOG_ON_CORE1:
+                    config.poll()
+                if PROFILE:
+                    stages["cfg"].stop()
+                if core1 is None:
+                    lcd.update_values(telemetry)
+                else:
+                    handoff.publish(telemetry)
+                if PROFILE:
+                    stages["loop"].stop()
+                    stages.poll(log_sink)
+                if telemetry_stream is not None:
+                    if PROFILE:
+                        telemetry_stream.send(
+                            telemetry,
+                            relays,
+                            poll.interval_ms,
+                            stages["uart"].last_us,
+                            stages["ctrl"].last_us,
+                            stages["loop"].last_us,
+                        )
+                    else:
+                        telemetry_stream.send(telemetry, relays, poll.interval_ms)
+                if sleeper is not None:
+                    sleeper.poll(log_sink)
+                last_control = time.ticks_ms()
+            elif time.ticks_diff(time.ticks_ms(), last_control) >= OVERPOWER_DEADLINE_MS:
+                # No reading for a while (slow polling or a retrying battery read), overpower is
+                # checked anyway. Counters keep running so the pulses reach the next reading.
+                count_L1 = counter_L1.peek_scaled(NOMINAL_CYCLE_MS)
+                count_L2 = counter_L2.peek_scaled(NOMINAL_CYCLE_MS)
+                control.overpower_only(telemetry, count_L1, count_L2)
+                if shed is not None:
+                    shed.hold(telemetry)
+                heaters.set_pins(telemetry.enabled, telemetry.overpower_L1, telemetry.overpower_L2, telemetry.control)
+                last_control = time.ticks_ms()
+            elif batery.busy():
+                time.sleep(0.01)
+            else:
+                wait = poll.interval_ms - time.ticks_diff(time.ticks_ms(), last_request)
+                if sleeper is not None:
+                    # Nothing to receive, UART may stop with the clocks.
+                    sleeper.sleep_ms(max(wait, 10))
+                else:
+                    time.sleep(min(max(wait, 10), 200) / 1000)
+    finally:
+        # A core 1 thread left running would block the soft reset.
+        if core1 is not None:
+            core1.stop()
     grid_connector.value(0)
+    if log_sink is not logger:
+        handoff.drain(logger)
     heaters.set_pins(False, None, None, 0)
+    logger.flush()
+    config.flush()
+    telemetry_history.flush()
+    if core1 is not None:
+        # Error screen blinks from a timer on core 0, as without DUAL_CORE.
+        lcd.update_values(telemetry)
+        machine.Timer().init(mode=machine.Timer.PERIODIC, period=1000, callback=lcd._update_screen)
+        print(core1)
+    if shed is not None:
+        print(shed)
+    if ADAPTIVE_POLLING:
+        print(poll)
+    if sleeper is not None:
+        print(sleeper)
+    if drift is not None:
+        print(drift)
+    if PROFILE:
+        print(stages)
 
 
 if __name__ == "__main__":
-    main()
+    if ASYNC_RUNTIME:
+        import runtime
+
+        runtime.run()
+    else:
+        main()
@@ -1,88 +1,450 @@
+import os
 import time
-import ubinascii
+from array import array
 import machine
+import micropython
+import framebuf
 import ujson
 import lcd_1inch14
+import seplos
 
 
-def loop_with_condition(array, condition, func) -> None:
-    """Loop throught pins and set it based on provided function"""
-    for pin in array:
-        if condition(pin):
-            func(pin)
-            break
+SIO_GPIO_OUT_SET = 0xD0000014  # RP2040 registers setting and clearing outputs of all GPIOs at once.
+SIO_GPIO_OUT_CLR = 0xD0000018
+
+
+def last_bit(mask: int) -> int:
+    """Highest set bit of mask, the active heater with lowest priority; 0 if none."""
+    while mask & (mask - 1):
+        mask &= mask - 1
+    return mask
+
+
+class Telemetry:
+    """Values of the running cycle, one instance updated in place.
+
+    Battery, counters and ControlLogic write into it, LCD, DataLogger and
+    history read it. Battery values are kept in protocol units (0.1 %,
+    0.01 A, 0.01 V) so updating them does not allocate floats. Pulse
+    counts are rescaled to the nominal 2 s cycle.
+    """
+
+    __slots__ = (
+        "error", "soc", "current", "voltage", "cycles", "count_L1", "count_L2",
+        "enabled", "overpower_L1", "overpower_L2", "control", "off_grid",
+    )
+
+    def __init__(self) -> None:
+        self.error = None
+        self.soc = 0
+        self.current = 0
+        self.voltage = 0
+        self.cycles = 0
+        self.count_L1 = 0
+        self.count_L2 = 0
+        self.enabled = False
+        self.overpower_L1 = None
+        self.overpower_L2 = None
+        self.control = 0
+        self.off_grid = 0
 
+    def fail(self, error: str) -> None:
+        """Error reading, values as the BMS error state."""
+        self.error = error
+        self.soc = 0
+        self.current = -10000
+        self.voltage = 0
 
-def turn_off_last(pins: list) -> None:
-    """Set pin off() for first in array with lowest priority that is active."""
-    loop_with_condition(pins[::-1], lambda pin: pin.value(), lambda pin: pin.off())
+    def copy_from(self, other: "Telemetry") -> None:
+        """Take all values of other, used to hand a snapshot to the other core."""
+        self.error = other.error
+        self.soc = other.soc
+        self.current = other.current
+        self.voltage = other.voltage
+        self.cycles = other.cycles
+        self.count_L1 = other.count_L1
+        self.count_L2 = other.count_L2
+        self.enabled = other.enabled
+        self.overpower_L1 = other.overpower_L1
+        self.overpower_L2 = other.overpower_L2
+        self.control = other.control
+        self.off_grid = other.off_grid
+
+    def items(self) -> list[tuple[str, bool | float | int | str | None]]:
+        """Logged values in units, in the order of the former data dictionary."""
+        return [
+            ("enabled", self.enabled),
+            ("error", self.error),
+            ("soc", self.soc / 10),
+            ("current", self.current / 100),
+            ("voltage", self.voltage / 100),
+            ("cycles", self.cycles),
+            ("off_grid", self.off_grid),
+            ("count_L1", self.count_L1),
+            ("count_L2", self.count_L2),
+        ]
 
 
 class OutputHeaters:
-    """Pin output control class."""
+    """Pin output control class.
+
+    Relay state is a bitmask, bit n is heater n and lower bits have higher
+    priority. Phases and the heaters allowed to switch on for every overpower
+    combination are precomputed masks. With gpios (GPIO numbers of the pins)
+    all changes of a call go out in one write to the SIO clear register and
+    one to the set register, otherwise pin by pin.
+
+    Control switches a heater on at most once per min_switch_ms, however
+    often it is called. Control switching off, overpower and disabling act
+    at once.
+    """
 
-    def __init__(self, pins, indexes_L1: list[int], indexes_L2: list[int]) -> None:
+    def __init__(
+        self,
+        pins,
+        indexes_L1: list[int],
+        indexes_L2: list[int],
+        gpios: list[int] | None = None,
+        min_switch_ms: int = 0,
+    ) -> None:
         self.pins = pins
         self.indexes_L1 = indexes_L1
         self.indexes_L2 = indexes_L2
+        self.mask_L1 = 0
+        for index in indexes_L1:
+            self.mask_L1 |= 1 << index
+        self.mask_L2 = 0
+        for index in indexes_L2:
+            self.mask_L2 |= 1 << index
+        # Heaters that may be switched on, indexed by phases without overpower (bit 1 L1, bit 0 L2)
+        self.possible = (0, self.mask_L2, self.mask_L1, self.mask_L1 | self.mask_L2)
+        self.gpio_bits = None if gpios is None else array("L", [1 << gpio for gpio in gpios])
+        self.mask = 0
+        for index, pin in enumerate(pins):
+            if pin.value():
+                self.mask |= 1 << index
+        self.min_switch_ms = min_switch_ms
+        self.switched_ms = time.ticks_ms()
+        self.settling = False  # Last switch less than min_switch_ms ago
 
     def set_pins(
         self, enable: bool, overpower_L1: int | None, overpower_L2: int | None, control: int
     ) -> None:
         """Set output pins based on preset variables from ControlLogic"""
+        state = self.mask
+        on = 0
+        off = 0
         if enable:
             if overpower_L1 == -1:
-                array = [self.pins[index] for index in self.indexes_L1]
-                turn_off_last(array)
+                off |= last_bit(state & self.mask_L1)
             if overpower_L2 == -1:
-                array = [self.pins[index] for index in self.indexes_L2]
-                turn_off_last(array)
+                off |= last_bit(state & self.mask_L2)
+            state &= ~off
+            if control > 0 and self.settling:
+                if 0 <= time.ticks_diff(time.ticks_ms(), self.switched_ms) < self.min_switch_ms:
+                    control = 0
+                else:
+                    self.settling = False
             if control > 0:
-                possible_indexes = []
-                if overpower_L1 is None:
-                    possible_indexes += self.indexes_L1
-                if overpower_L2 is None:
-                    possible_indexes += self.indexes_L2
-                possible_pins = [pin for index, pin in enumerate(self.pins) if index in possible_indexes]
-                loop_with_condition(possible_pins, lambda pin: not pin.value(), lambda pin: pin.on())
+                free = self.possible[(overpower_L1 is None) << 1 | (overpower_L2 is None)] & ~state
+                on = free & -free
             elif control < 0:
-                turn_off_last(self.pins)
+                off |= last_bit(state)
         else:
-            for heater in self.pins:
-                heater.off()
+            off = state
+        self.apply(on, off)
+
+    def set_mask(self, mask: int) -> None:
+        """Switch exactly the heaters of mask on."""
+        self.apply(mask & ~self.mask, self.mask & ~mask)
+
+    def shed(self, phase_mask: int) -> bool:
+        """Switch off the lowest priority active heater of a phase, False if none."""
+        off = last_bit(self.mask & phase_mask)
+        if off:
+            self.apply(0, off)
+        return off != 0
+
+    def apply(self, on: int, off: int) -> None:
+        """Switch heaters of on mask on and of off mask off, turn offs first."""
+        if not on | off:
+            return
+        if self.gpio_bits is not None:
+            machine.mem32[SIO_GPIO_OUT_CLR] = self._gpios(off)
+            machine.mem32[SIO_GPIO_OUT_SET] = self._gpios(on)
+        else:
+            changed = on | off
+            index = 0
+            while changed:
+                if changed & 1:
+                    self.pins[index].value(on >> index & 1)
+                changed >>= 1
+                index += 1
+        # Changes only, so a shed from a scheduled callback in between is kept
+        self.mask = (self.mask & ~off) | on
+        if self.min_switch_ms:
+            self.switched_ms = time.ticks_ms()
+            self.settling = True
+
+    def _gpios(self, mask: int) -> int:
+        bits = 0
+        index = 0
+        while mask:
+            if mask & 1:
+                bits |= self.gpio_bits[index]
+            mask >>= 1
+            index += 1
+        return bits
+
+    def state(self) -> int:
+        """Bitmask of active heaters, bit n is pin n."""
+        return self.mask
+
+
+METER_IMPULSES_PER_KWH = 10000  # Impulse constant of the consumption meters.
+PULSE_TIMEOUT_US = 10_000_000  # No pulse for this long means no load.
 
 
 class Counter:
-    """Counter class with pin.irq."""
+    """Counter class with pin.irq.
 
-    def __init__(self, pin: machine.Pin):
+    Besides counting, the IRQ handler stores ticks_us of every falling edge
+    into a preallocated ring buffer, so power can be estimated from pulse
+    intervals. The handler does not allocate.
+    """
+
+    def __init__(self, pin: machine.Pin, size: int = 32, impulses_per_kwh: int = METER_IMPULSES_PER_KWH):
+        if size & (size - 1):
+            raise ValueError("Ring buffer size has to be power of two", size)
         self.pin = pin
-        self.pin.irq(trigger=machine.Pin.IRQ_FALLING, handler=self.trigger_count)
         self.counter = 0
+        self.pulses = 0
+        self.stamps = array("L", [0] * size)
+        self.mask = size - 1
+        self.energy_per_pulse = 3_600_000_000_000 // impulses_per_kwh  # W * us
+        self.shed_handler = None
+        self.shed_window = 0
+        self.shed_span_us = 0
+        self.shed_pulses = 0
+        self.read_ms = time.ticks_ms()
+        self.elapsed_ms = 0
+        self.pin.irq(trigger=machine.Pin.IRQ_FALLING, handler=self.trigger_count)
 
     def trigger_count(self, _: machine.Pin) -> None:
-        """Count up counter"""
+        """Count up counter and timestamp the pulse"""
+        stamp = time.ticks_us()
+        self.stamps[self.pulses & self.mask] = stamp
+        self.pulses = (self.pulses + 1) & 0x3FFFFFFF  # Stays small int, no allocation
         self.counter += 1
+        if self.shed_handler is not None and (self.pulses - self.shed_pulses) & 0x3FFFFFFF > self.shed_window:
+            first = self.stamps[(self.pulses - 1 - self.shed_window) & self.mask]
+            if time.ticks_diff(stamp, first) < self.shed_span_us:
+                self.shed_pulses = self.pulses
+                try:
+                    micropython.schedule(self.shed_handler, stamp)
+                except RuntimeError:
+                    pass  # Schedule queue full, next pulse tries again
+
+    def arm_shed(self, handler, limit: int, period_ms: int = 2000, window: int = 4) -> None:
+        """Schedule handler(ticks_us of pulse) when the pulse rate exceeds limit per period_ms.
+
+        Rate is taken over the last window intervals. After a shed the next
+        one needs window new pulses, measured with the reduced load.
+        """
+        if not 0 < window <= self.mask:
+            raise ValueError("Shed window has to fit the ring buffer", window)
+        self.shed_window = window
+        self.shed_span_us = window * period_ms * 1000 // limit
+        self.shed_pulses = self.pulses
+        self.shed_handler = handler
 
     def zero_counter(self) -> None:
         """Zero counter."""
         self.counter = 0
 
     def get_count(self) -> int:
-        """Get counter and zero it."""
+        """Get counter and zero it, pulses cannot be lost in between."""
+        state = machine.disable_irq()
         count = self.counter
-        self.zero_counter()
+        self.counter = 0
+        machine.enable_irq(state)
+        now = time.ticks_ms()
+        self.elapsed_ms = time.ticks_diff(now, self.read_ms)
+        self.read_ms = now
         return count
 
+    def scaled(self, count: int, period_ms: int = 2000) -> int:
+        """Count of the last get_count rescaled to period_ms, rounded."""
+        if self.elapsed_ms <= 0:
+            return count
+        return (count * period_ms + self.elapsed_ms // 2) // self.elapsed_ms
+
+    def peek_scaled(self, period_ms: int = 2000) -> int:
+        """Pulses since the last get_count rescaled to period_ms, the counter keeps running."""
+        elapsed = time.ticks_diff(time.ticks_ms(), self.read_ms)
+        count = self.counter
+        if elapsed <= 0:
+            return count
+        return (count * period_ms + elapsed // 2) // elapsed
+
+    def snapshot(self, stamps: array) -> int:
+        """Copy newest timestamps oldest first into stamps, returns how many are valid."""
+        state = machine.disable_irq()
+        pulses = self.pulses
+        valid = min(pulses, len(self.stamps), len(stamps))
+        for index in range(valid):
+            stamps[index] = self.stamps[(pulses - valid + index) & self.mask]
+        machine.enable_irq(state)
+        return valid
+
+    def watts(self, intervals: int = 4) -> int:
+        """Instantaneous power from last pulse intervals, 0 without load.
+
+        When the time since the last pulse is already longer than the average
+        interval, that time is used instead, so a load drop shows immediately.
+        """
+        state = machine.disable_irq()
+        pulses = self.pulses
+        intervals = min(intervals, pulses - 1, self.mask)
+        if intervals < 1:
+            machine.enable_irq(state)
+            return 0
+        last = self.stamps[(pulses - 1) & self.mask]
+        first = self.stamps[(pulses - 1 - intervals) & self.mask]
+        machine.enable_irq(state)
+        interval = time.ticks_diff(last, first) // intervals
+        since_last = time.ticks_diff(time.ticks_us(), last)
+        if since_last > PULSE_TIMEOUT_US:
+            return 0
+        if since_last > interval:
+            interval = since_last
+        return self.energy_per_pulse // max(interval, 1)
+
+
+class FastShed:
+    """Drops the last active heater of a phase directly from the meter IRQ.
+
+    Threshold is the overpower limit of ControlLogic, so the fast path acts
+    within a few pulse intervals instead of at the next 2 s cycle; ControlLogic
+    still reconciles the outputs afterwards. Latency is measured from the
+    pulse that crossed the threshold to the pin switched off. A shed phase is
+    held for hold_ms: hold() reports it as overpower warning, so the count of
+    the reduced load does not switch the shed heater straight back on.
+    """
+
+    def __init__(
+        self,
+        heaters: OutputHeaters,
+        counter_L1: Counter,
+        counter_L2: Counter,
+        limit: int,
+        period_ms: int = 2000,
+        window: int = 4,
+        hold_ms: int = 60_000,
+    ) -> None:
+        self.heaters = heaters
+        self.hold_ms = hold_ms
+        self.held = 0  # Phases shed within hold_ms, bit 1 L1, bit 0 L2
+        self.shed_ms_L1 = 0
+        self.shed_ms_L2 = 0
+        self.sheds = 0
+        self.latency_last_us = 0
+        self.latency_max_us = 0
+        self.latency_total_us = 0
+        counter_L1.arm_shed(self.shed_L1, limit, period_ms, window)
+        counter_L2.arm_shed(self.shed_L2, limit, period_ms, window)
+
+    def shed_L1(self, stamp: int) -> None:
+        if self.shed(self.heaters.mask_L1, stamp):
+            self.shed_ms_L1 = time.ticks_ms()
+            self.held |= 2
+
+    def shed_L2(self, stamp: int) -> None:
+        if self.shed(self.heaters.mask_L2, stamp):
+            self.shed_ms_L2 = time.ticks_ms()
+            self.held |= 1
+
+    def shed(self, phase_mask: int, stamp: int) -> bool:
+        """Switch off the lowest priority active heater of the phase, False if none."""
+        if not self.heaters.shed(phase_mask):
+            return False
+        latency = time.ticks_diff(time.ticks_us(), stamp)
+        self.sheds += 1
+        self.latency_last_us = latency
+        self.latency_total_us += latency
+        if latency > self.latency_max_us:
+            self.latency_max_us = latency
+        return True
+
+    def hold(self, telemetry: Telemetry) -> None:
+        """Report phases shed within hold_ms as overpower warning, before set_pins."""
+        if not self.held:
+            return
+        now = time.ticks_ms()
+        if self.held & 2:
+            if time.ticks_diff(now, self.shed_ms_L1) >= self.hold_ms:
+                self.held &= ~2
+            elif telemetry.enabled and telemetry.overpower_L1 is None:
+                telemetry.overpower_L1 = 0
+        if self.held & 1:
+            if time.ticks_diff(now, self.shed_ms_L2) >= self.hold_ms:
+                self.held &= ~1
+            elif telemetry.enabled and telemetry.overpower_L2 is None:
+                telemetry.overpower_L2 = 0
+
+    def __str__(self) -> str:
+        avg = self.latency_total_us // self.sheds if self.sheds else 0
+        return (
+            f"shed     count {self.sheds:5d} latency last {self.latency_last_us:6d}"
+            f" avg {avg:6d} max {self.latency_max_us:6d} us"
+        )
+
 
 class ControlLogic:
-    """Desides how to set output based on inputs."""
+    """Desides how to set output based on inputs.
 
-    def __init__(self) -> None:
+    Thresholds default to the tuned values of the installation, they can be
+    changed for backtesting. Decisions are made in protocol units (SOC in
+    0.1 %, current in 0.01 A) by update(); heaters_logic and off_grid_logic
+    take % and A.
+    """
+
+    def __init__(
+        self,
+        heaters_on: float = 90,
+        heaters_off: float = 83,
+        off_grid_on: float = 40,
+        off_grid_off: float = 30,
+        charge_current: float = 22,
+        discharge_current: float = -35,
+        idle_current: float = 6,
+        full_soc: float = 97,
+        overpower_warning: int = 12,
+        overpower_limit: int = 26,
+    ) -> None:
         self.heaters_enabled = False
         self.off_grid_enabled = False
         self.overpower_L1 = None
         self.overpower_L2 = None
+        self.heaters_on = heaters_on
+        self.heaters_off = heaters_off
+        self.off_grid_on = off_grid_on
+        self.off_grid_off = off_grid_off
+        self.charge_current = charge_current
+        self.discharge_current = discharge_current
+        self.idle_current = idle_current
+        self.full_soc = full_soc
+        self.overpower_warning = overpower_warning
+        self.overpower_limit = overpower_limit
+        self.control = 0
+        self.heaters_on_units = round(heaters_on * 10)
+        self.heaters_off_units = round(heaters_off * 10)
+        self.off_grid_on_units = round(off_grid_on * 10)
+        self.off_grid_off_units = round(off_grid_off * 10)
+        self.full_soc_units = round(full_soc * 10)
+        self.charge_current_units = round(charge_current * 100)
+        self.discharge_current_units = round(discharge_current * 100)
+        self.idle_current_units = round(idle_current * 100)
 
     @staticmethod
     def soc_enabled(enabled: bool, soc: float, enable_above: int, disable_below: int) -> bool:
@@ -93,20 +455,19 @@ class ControlLogic:
             return False
         return enabled
 
-    @staticmethod
-    def overpower_logic(count: int) -> int | None:
+    def overpower_logic(self, count: int) -> int | None:
         """Overpower on phase line logic."""
-        if count > 26:
+        if count > self.overpower_limit:
             return -1
-        if count >= 12:
+        if count >= self.overpower_warning:
             return 0
         return None
 
-    def heaters_logic(
-        self, soc: float, current: float, count_L1: int, count_L2: int
-    ) -> tuple[bool, None | int, None | int, int]:
-        """Set output variables based on provided arguments for heaters controler."""
-        self.heaters_enabled = self.soc_enabled(self.heaters_enabled, soc, 90, 83)
+    def heaters(self, soc: int, current: int, count_L1: int, count_L2: int) -> None:
+        """Heaters decision for SOC in 0.1 % and current in 0.01 A, kept in attributes."""
+        self.heaters_enabled = self.soc_enabled(
+            self.heaters_enabled, soc, self.heaters_on_units, self.heaters_off_units
+        )
         control = 0
         overpower_L1 = None
         overpower_L2 = None
@@ -114,71 +475,460 @@ class ControlLogic:
             overpower_L1 = self.overpower_logic(count_L1)
             overpower_L2 = self.overpower_logic(count_L2)
             if overpower_L1 != -1 and overpower_L2 != -1:
-                if current > 22 or (-6 <= current <= 6 and soc > 97):
+                idle = -self.idle_current_units <= current <= self.idle_current_units
+                if current > self.charge_current_units or (idle and soc > self.full_soc_units):
                     control = 1
-                elif current < -35:
+                elif current < self.discharge_current_units:
                     control = -1
-        return self.heaters_enabled, overpower_L1, overpower_L1, control
+        self.overpower_L1 = overpower_L1
+        self.overpower_L2 = overpower_L2
+        self.control = control
+
+    def off_grid(self, soc: int) -> int:
+        """Off grid decision for SOC in 0.1 %."""
+        self.off_grid_enabled = self.soc_enabled(
+            self.off_grid_enabled, soc, self.off_grid_on_units, self.off_grid_off_units
+        )
+        return 1 if self.off_grid_enabled else 0
+
+    def update(self, telemetry: Telemetry, count_L1: int, count_L2: int) -> None:
+        """Decide heaters and off grid for a reading, results are stored in telemetry.
+
+        Pulse counts are passed separately as they may be rescaled.
+        """
+        self.heaters(telemetry.soc, telemetry.current, count_L1, count_L2)
+        telemetry.enabled = self.heaters_enabled
+        telemetry.overpower_L1 = self.overpower_L1
+        telemetry.overpower_L2 = self.overpower_L2
+        telemetry.control = self.control
+        telemetry.off_grid = self.off_grid(telemetry.soc)
+
+    def heaters_logic(
+        self, soc: float, current: float, count_L1: int, count_L2: int
+    ) -> tuple[bool, None | int, None | int, int]:
+        """Set output variables based on provided arguments for heaters controler."""
+        self.heaters(round(soc * 10), round(current * 100), count_L1, count_L2)
+        return self.heaters_enabled, self.overpower_L1, self.overpower_L2, self.control
+
+    def overpower_only(self, telemetry: Telemetry, count_L1: int, count_L2: int) -> None:
+        """Only shed heaters on overpowered phase, used while battery data are pending."""
+        telemetry.control = 0
+        if not self.heaters_enabled:
+            telemetry.enabled = False
+            telemetry.overpower_L1 = None
+            telemetry.overpower_L2 = None
+            return
+        telemetry.enabled = True
+        telemetry.overpower_L1 = self.overpower_logic(count_L1)
+        telemetry.overpower_L2 = self.overpower_logic(count_L2)
 
     def off_grid_logic(self, soc: float) -> int:
         """Disconnect PV inverters from grid."""
-        self.off_grid_enabled = self.soc_enabled(self.off_grid_enabled, soc, 40, 30)
-        return 1 if self.off_grid_enabled else 0
+        return self.off_grid(round(soc * 10))
+
+
+class PollScheduler:
+    """Interval of BMS requests adapted to how fast readings change.
+
+    Polls fast while current changes quickly or current/SOC are within a
+    margin of a ControlLogic threshold that can change a decision: of the
+    heaters and off grid SOC pairs only the threshold leaving the present
+    state, current thresholds and full_soc only while heaters are enabled,
+    the idle band only near full_soc. Polls at the normal rate while outputs
+    are being switched, and doubles the interval up to slow_ms while readings
+    are stable. Achieved intervals are kept as count/min/max/total per mode.
+    Readings are in protocol units (0.1 %, 0.01 A).
+    """
+
+    FAST = 0
+    NORMAL = 1
+    SLOW = 2
+
+    def __init__(
+        self,
+        control: ControlLogic,
+        fast_ms: int = 500,
+        normal_ms: int = 2000,
+        slow_ms: int = 8000,
+        current_rate: float = 2.0,
+        current_margin: float = 3.0,
+        soc_margin: float = 0.5,
+        stable_rate: float = 0.2,
+    ) -> None:
+        self.control = control
+        self.fast_ms = fast_ms
+        self.normal_ms = normal_ms
+        self.slow_ms = slow_ms
+        self.current_rate = round(current_rate * 100)  # 0.01 A/s
+        self.current_margin = round(current_margin * 100)  # 0.01 A
+        self.soc_margin = round(soc_margin * 10)  # 0.1 %
+        self.stable_rate = round(stable_rate * 100)  # 0.01 A/s
+        # Current thresholds only matter while heaters are on, the idle band only near full SOC
+        self.current_thresholds = array("i", [control.charge_current_units, control.discharge_current_units])
+        self.idle_thresholds = array("i", [control.idle_current_units, -control.idle_current_units])
+        self.interval_ms = normal_ms
+        self.mode = PollScheduler.NORMAL
+        self.last_ms = None
+        self.current = 0
+        self.requests = 0
+        self.request_ms = 0
+        self.counts = [0, 0, 0]
+        self.interval_min = [0, 0, 0]
+        self.interval_max = [0, 0, 0]
+        self.interval_total = [0, 0, 0]
+
+    def due(self, last_request_ms: int, now_ms: int) -> bool:
+        return time.ticks_diff(now_ms, last_request_ms) >= self.interval_ms
+
+    def requested(self, now_ms: int) -> None:
+        """Record achieved interval of a request sent at now_ms."""
+        if self.requests:
+            interval = time.ticks_diff(now_ms, self.request_ms)
+            mode = self.mode
+            if not self.counts[mode] or interval < self.interval_min[mode]:
+                self.interval_min[mode] = interval
+            if interval > self.interval_max[mode]:
+                self.interval_max[mode] = interval
+            self.interval_total[mode] += interval
+            self.counts[mode] += 1
+        self.requests += 1
+        self.request_ms = now_ms
+
+    def near_threshold(self, soc: int, current: int) -> bool:
+        control = self.control
+        margin = self.soc_margin
+        # Of each hysteresis pair only the threshold that would flip the present state
+        heaters = control.heaters_off_units if control.heaters_enabled else control.heaters_on_units
+        off_grid = control.off_grid_off_units if control.off_grid_enabled else control.off_grid_on_units
+        if abs(soc - heaters) < margin or abs(soc - off_grid) < margin:
+            return True
+        if not control.heaters_enabled:
+            return False
+        for threshold in self.current_thresholds:
+            if abs(current - threshold) < self.current_margin:
+                return True
+        if soc >= control.full_soc_units - margin:
+            if abs(soc - control.full_soc_units) < margin:
+                return True
+            for threshold in self.idle_thresholds:
+                if abs(current - threshold) < self.current_margin:
+                    return True
+        return False
+
+    def update(self, soc: int, current: int, now_ms: int, switching: bool = False) -> int:
+        """New interval after a reading; switching means outputs changed on it."""
+        rate = 0
+        if self.last_ms is not None:
+            elapsed = time.ticks_diff(now_ms, self.last_ms)
+            if elapsed > 0:
+                rate = abs(current - self.current) * 1000 // elapsed
+        self.last_ms = now_ms
+        self.current = current
+        if rate >= self.current_rate or self.near_threshold(soc, current):
+            self.mode = PollScheduler.FAST
+            self.interval_ms = self.fast_ms
+        elif switching or rate > self.stable_rate:
+            self.mode = PollScheduler.NORMAL
+            self.interval_ms = self.normal_ms
+        else:
+            self.mode = PollScheduler.SLOW
+            self.interval_ms = min(max(self.interval_ms, self.normal_ms) * 2, self.slow_ms)
+        return self.interval_ms
+
+    def __str__(self) -> str:
+        lines = []
+        for mode, name in enumerate(("fast", "normal", "slow")):
+            count = self.counts[mode]
+            avg = self.interval_total[mode] // count if count else 0
+            lines.append(
+                f"poll {name:6} count {count:6d} interval min {self.interval_min[mode]:5d}"
+                f" avg {avg:5d} max {self.interval_max[mode]:5d} ms"
+            )
+        return "\n".join(lines)
+
+
+def datetime_seconds(datetime: list[int] | tuple) -> int:
+    """Seconds since epoch of a time in RTC.datetime format."""
+    return time.mktime((datetime[0], datetime[1], datetime[2], datetime[4], datetime[5], datetime[6], 0, 0))
+
+
+class ClockDrift:
+    """Drift of the Pico RTC against the DS3231, measured at every synchronization.
+
+    The offset found just before the Pico RTC is set, divided by the time
+    since the previous synchronization, is the drift rate. The next
+    synchronization is planned for when the offset is expected to reach
+    tolerance_s, within min_s and max_s. The interval doubles while no
+    offset is seen. Both clocks count whole seconds, so the rate is only
+    known well after several hours.
+    """
+
+    def __init__(self, tolerance_s: int = 1, interval_s: int = 86400, min_s: int = 3600, max_s: int = 7 * 86400) -> None:
+        self.tolerance_s = tolerance_s
+        self.interval_s = interval_s
+        self.min_s = min_s
+        self.max_s = max_s
+        self.synced_s = None
+        self.next_s = 0
+        self.syncs = 0
+        self.offset_s = 0
+        self.offset_max_s = 0
+        self.ppm = 0
+
+    def measure(self, pico: list[int] | tuple, chip: list[int] | tuple) -> int:
+        """Offset of pico against chip in seconds, plans the next synchronization."""
+        chip_s = datetime_seconds(chip)
+        offset = datetime_seconds(pico) - chip_s
+        if self.synced_s is not None and chip_s > self.synced_s:
+            elapsed = chip_s - self.synced_s
+            rate = abs(offset) * 1_000_000 // elapsed
+            self.offset_s = offset
+            self.ppm = rate if offset >= 0 else -rate
+            if abs(offset) > abs(self.offset_max_s):
+                self.offset_max_s = offset
+            if rate:
+                interval = self.tolerance_s * 1_000_000 // rate
+            else:
+                interval = self.interval_s * 2
+            self.interval_s = min(max(interval, self.min_s), self.max_s)
+        self.synced_s = chip_s
+        self.next_s = chip_s + self.interval_s
+        self.syncs += 1
+        return offset
+
+    def due(self, now_s: int) -> bool:
+        return self.synced_s is not None and now_s >= self.next_s
+
+    def __str__(self) -> str:
+        return (
+            f"clock    syncs {self.syncs:6d} offset {self.offset_s:4d} s max {self.offset_max_s:4d} s"
+            f" drift {self.ppm:5d} ppm interval {self.interval_s:7d} s"
+        )
+
+
+TEXT_HEIGHT = 8  # Height of framebuf font in pixels.
+TEXT_WIDTH = 8
+
+
+OVERFLOW = b"-OVF"
+
+
+def format_fixed(chars: bytearray, value: int, decimals: int = 0, pad: int = 32) -> None:
+    """Write value scaled by 10**decimals right aligned into chars as ASCII.
+
+    A value that does not fit, sign included, is shown as ``OVF`` or ``-OVF``.
+    """
+    negative = value < 0
+    if negative:
+        value = -value
+    index = len(chars)
+    for _ in range(decimals):
+        index -= 1
+        chars[index] = 48 + value % 10
+        value //= 10
+    if decimals:
+        index -= 1
+        chars[index] = 46
+    while index > 0:
+        index -= 1
+        chars[index] = 48 + value % 10
+        value //= 10
+        if not value:
+            break
+    if value or (negative and index == 0):
+        index = len(chars)
+        for position in range(len(OVERFLOW) - 1, 0, -1):
+            if index > 0:
+                index -= 1
+                chars[index] = OVERFLOW[position]
+        if negative and index > 0:
+            index -= 1
+            chars[index] = OVERFLOW[0]
+    elif negative:
+        index -= 1
+        chars[index] = 45
+    while index > 0:
+        index -= 1
+        chars[index] = pad
+
+
+class Glyphs:
+    """Cache of pre-rendered characters, one small RGB565 buffer per character and colour."""
+
+    def __init__(self, background: int) -> None:
+        self.background = background
+        self.cache = {}
+
+    def get(self, char: int, color: int) -> framebuf.FrameBuffer:
+        key = (color << 8) | char
+        glyph = self.cache.get(key)
+        if glyph is None:
+            glyph = framebuf.FrameBuffer(
+                bytearray(TEXT_WIDTH * TEXT_HEIGHT * 2), TEXT_WIDTH, TEXT_HEIGHT, framebuf.RGB565
+            )
+            glyph.fill(self.background)
+            glyph.text(chr(char), 0, 0, color)
+            self.cache[key] = glyph
+        return glyph
+
+
+class Field:
+    """Fixed width text cell on screen redrawn character by character."""
+
+    def __init__(self, x: int, y: int, width: int, color: int) -> None:
+        self.x = x
+        self.y = y
+        self.color = color
+        self.chars = bytearray(width)
+        self.shown = bytearray(width)
 
 
 class LCD:
-    """LCD parrent class."""
+    """LCD parrent class.
+
+    Static labels are drawn once and stay in the frame buffer, values are
+    blitted from a glyph cache only where a character changed, and only
+    rows that changed are sent to the display. A steady state update does
+    no string formatting.
+    """
 
     def __init__(
         self,
         lcd: lcd_1inch14.LCD_1inch14,
-        timer: machine.Timer,
-        data: dict[str, int | bool | float],
+        timer: machine.Timer | None,
+        telemetry: Telemetry,
     ):
         self.lcd = lcd
         self.timer = timer
-        self.timer.init(mode=machine.Timer.PERIODIC, period=1000, callback=self._update_screen)
+        if timer is not None:
+            self.timer.init(mode=machine.Timer.PERIODIC, period=1000, callback=self._update_screen)
         self.blink_error = False
-        self.data = data
+        self.telemetry = telemetry
+        self.glyphs = Glyphs(lcd.BLACK)
+        self.labels = (
+            ("Voltage:", 12, 7, lcd.BLUE),
+            ("V", 156, 7, lcd.BLUE),
+            ("Current:", 12, 27, lcd.RED),
+            ("A", 156, 27, lcd.RED),
+            ("SOC:", 12, 47, lcd.GREEN),
+            ("%", 156, 47, lcd.GREEN),
+            ("Cycles:", 12, 67, lcd.BLUE),
+            ("Heaters:", 12, 87, lcd.ORANGE),
+            ("Off grid:", 12, 107, lcd.GREEN),
+            (":", 32, 126, lcd.RED),
+            (":", 56, 126, lcd.RED),
+            (".", 160, 126, lcd.RED),
+            (".", 184, 126, lcd.RED),
+        )
+        self.voltage = Field(100, 7, 6, lcd.BLUE)
+        self.current = Field(92, 27, 7, lcd.RED)  # Summed currents of several packs reach -300.00
+        self.soc = Field(100, 47, 6, lcd.GREEN)
+        self.cycles = Field(116, 67, 4, lcd.BLUE)
+        self.heaters = Field(84, 87, 8, lcd.ORANGE)
+        self.off_grid = Field(108, 107, 5, lcd.GREEN)
+        self.hours = Field(16, 126, 2, lcd.RED)
+        self.minutes = Field(40, 126, 2, lcd.RED)
+        self.seconds = Field(64, 126, 2, lcd.RED)
+        self.day = Field(144, 126, 2, lcd.RED)
+        self.month = Field(168, 126, 2, lcd.RED)
+        self.year = Field(192, 126, 4, lcd.RED)
+        self.fields = (
+            self.voltage, self.current, self.soc, self.cycles, self.heaters, self.off_grid,
+            self.hours, self.minutes, self.seconds, self.day, self.month, self.year,
+        )
+        self.dirty = []
+        self.full_refresh = True
+        self.date_day = -1
+        self.diagnostics = None  # Callable returning lines of the diagnostics page
+        self.show_diagnostics = False
+
+    def refresh(self) -> None:
+        """Draw screen now, used when not driven by timer."""
+        self._update_screen(None)
 
     def _update_screen(self, timer: machine.Timer) -> None:
         """Draws new screen with configured style."""
-        if self.data["error"] is not None:
+        if self.telemetry.error is not None:
             self._error_loop()
+        elif self.show_diagnostics and self.diagnostics is not None:
+            self._diagnostics_page()
         else:
+            if self.full_refresh:
+                self._draw_labels()
             self._data_metrics()
             self._data_heaters()
             self._data_offgrid()
             self._add_time()
         self._display()
 
+    def _draw_labels(self) -> None:
+        """Draw static part of the screen, values are redrawn from scratch."""
+        self.lcd.fill(self.lcd.BLACK)
+        for text, x, y, color in self.labels:
+            self.lcd.text(text, x, y, color)
+        for field in self.fields:
+            field.shown[:] = bytes(len(field.shown))
+
     def _data_heaters(self) -> None:
         """Show heaters are enabled."""
-        status = " Enabled" if self.data["enabled"] == 1 else "Disabled"
-        self.lcd.text(f"Heaters: {status}", 12, 87, self.lcd.ORANGE)
+        self.heaters.chars[:] = b" Enabled" if self.telemetry.enabled == 1 else b"Disabled"
+        self._put(self.heaters)
 
     def _data_offgrid(self) -> None:
         """Show PV inverters are not connected to power grid."""
-        grid = " True" if self.data["off_grid"] == 1 else "False"
-        self.lcd.text(f"Off grid:   {grid}", 12, 107, self.lcd.GREEN)  # 0x1FF8)
+        self.off_grid.chars[:] = b" True" if self.telemetry.off_grid == 1 else b"False"
+        self._put(self.off_grid)
 
     def _data_metrics(self) -> None:
         """Show battery parameters."""
-        self.lcd.fill(self.lcd.BLACK)
-        self.lcd.text(f"Voltage:   {float(self.data["voltage"]):6.2f} V", 12, 7, self.lcd.BLUE)
-        self.lcd.text(f"Current:   {float(self.data["current"]):6.2f} A", 12, 27, self.lcd.RED)
-        self.lcd.text(f"SOC:       {float(self.data["soc"]):6.1f} %", 12, 47, self.lcd.GREEN)
-        self.lcd.text(f"Cycles:      {self.data["cycles"]:4d}", 12, 67, self.lcd.BLUE)
+        telemetry = self.telemetry
+        self._number(self.voltage, telemetry.voltage, 2)
+        self._number(self.current, telemetry.current, 2)
+        self._number(self.soc, telemetry.soc, 1)
+        self._number(self.cycles, telemetry.cycles, 0)
 
     def _add_time(self) -> None:
         """Text field with actual time and date."""
-        act = time.localtime()
-        time_str = f"  {act[3]:2d}:{act[4]:02d}:{act[5]:02d}        {act[2]:2d}.{act[1]:2d}.{act[0]:4d}"
-        self.lcd.text(time_str, 0, 126, self.lcd.RED)
+        seconds = int(time.time())
+        day = seconds // 86400
+        if day != self.date_day:
+            # localtime allocates a tuple, so the date is read once per day
+            act = time.localtime(seconds)
+            self._number(self.day, act[2], 0)
+            self._number(self.month, act[1], 0)
+            self._number(self.year, act[0], 0)
+            self.date_day = day
+        seconds -= day * 86400
+        self._number(self.hours, seconds // 3600, 0)
+        self._number(self.minutes, seconds // 60 % 60, 0, 48)
+        self._number(self.seconds, seconds % 60, 0, 48)
+
+    def _number(self, field: Field, value: int, decimals: int, pad: int = 32) -> None:
+        format_fixed(field.chars, value, decimals, pad)
+        self._put(field)
+
+    def _put(self, field: Field) -> None:
+        """Blit characters of field that differ from the ones on screen."""
+        chars = field.chars
+        shown = field.shown
+        changed = False
+        for index in range(len(chars)):
+            if chars[index] != shown[index]:
+                self.lcd.blit(self.glyphs.get(chars[index], field.color), field.x + index * TEXT_WIDTH, field.y)
+                shown[index] = chars[index]
+                changed = True
+        if changed and not self.full_refresh and field.y not in self.dirty:
+            self.dirty.append(field.y)
 
     def _display(self) -> None:
-        """Display texts from buffer."""
-        self.lcd.show()
+        """Display texts from buffer, whole screen or only changed rows."""
+        if self.full_refresh:
+            self.lcd.show()
+            self.full_refresh = False
+        else:
+            for y in self.dirty:
+                self.lcd.show_rows(y, TEXT_HEIGHT)
+        self.dirty.clear()
 
     def _error_loop(self) -> None:
         """Show error on screen in infinite loop."""
@@ -190,20 +940,43 @@ class LCD:
             text_color = self.lcd.RED
         self.lcd.fill(background_color)
         self.lcd.text("!!! ERROR !!!", 68, 63, text_color)
-        self.lcd.text(self.data["error"], 0, 83, text_color)
+        self.lcd.text(self.telemetry.error, 0, 83, text_color)
         self.blink_error ^= True
+        self.full_refresh = True
 
-    def update_values(self, data: dict[str, bool | float | int]) -> None:
-        """Update inner data structure."""
-        self.data.update(data)
+    def _diagnostics_page(self) -> None:
+        """Show lines of diagnostics instead of values, formatted on every update."""
+        self.lcd.fill(self.lcd.BLACK)
+        for index, line in enumerate(self.diagnostics()):
+            self.lcd.text(line, 0, index * 12 + 2, self.lcd.WHITE)
+        self.full_refresh = True
+
+    def toggle_diagnostics(self, pin: machine.Pin | None = None) -> None:
+        """Switch between values and diagnostics page, usable as key IRQ handler."""
+        self.show_diagnostics = not self.show_diagnostics
+
+    def update_values(self, telemetry: Telemetry) -> None:
+        """Show values of telemetry, which is read directly on every update."""
+        self.telemetry = telemetry
 
 
 class Config:
-    """Manipulate with data in json."""
+    """Manipulate with data in json.
 
-    def __init__(self, filename):
+    Changes are only marked dirty and written together by flush(), which
+    happens after max_pending changes, from poll() once the oldest unsaved
+    change is max_age_ms old, or when called explicitly. File is written to
+    a temporary file and renamed over the old one, so a power cut leaves
+    either the old or the new config.
+    """
+
+    def __init__(self, filename, max_pending=8, max_age_ms=60_000):
         self.filename = filename
+        self.max_pending = max_pending
+        self.max_age_ms = max_age_ms
         self.config = {}
+        self.pending = 0
+        self.first_ms = 0
         self.load()
 
     def load(self):
@@ -211,87 +984,323 @@ class Config:
         try:
             with open(self.filename, "r") as f:
                 self.config = ujson.load(f)
-        except OSError:
+        except (OSError, ValueError):
             pass
+        self.pending = 0
 
     def save(self):
-        """Save data to file."""
-        with open(self.filename, "w") as f:
+        """Save data to file atomically."""
+        temporary = self.filename + ".tmp"
+        with open(temporary, "w") as f:
             ujson.dump(self.config, f)
+        os.rename(temporary, self.filename)
 
     def get(self, key, default=None):
         """Get value specified by key."""
         return self.config.get(key, default)
 
     def set(self, key, value):
-        """Set value specified by key to file."""
+        """Set value specified by key, written to file later."""
+        if key in self.config and self.config[key] == value:
+            return
         self.config[key] = value
-        self.save()
+        if not self.pending:
+            self.first_ms = time.ticks_ms()
+        self.pending += 1
+        if self.pending >= self.max_pending:
+            self.flush()
+
+    def poll(self):
+        """Write changes once the oldest one is too old."""
+        if self.pending and time.ticks_diff(time.ticks_ms(), self.first_ms) >= self.max_age_ms:
+            self.flush()
+
+    def flush(self):
+        """Write changes to file now."""
+        if self.pending:
+            self.save()
+            self.pending = 0
 
 
 class DataLogger:
-    """Logs data to the file."""
+    """Logs data to the file.
+
+    Records are collected in RAM and written in blocks. When the file grows
+    over max_size it is rotated to filename.1 .. filename.<files - 1>, the
+    oldest one is dropped. Buffered records older than max_age_ms are written
+    by poll().
+    """
 
-    def __init__(self, filename: str) -> None:
+    def __init__(
+        self,
+        filename: str,
+        block_size: int = 512,
+        max_size: int = 32 * 1024,
+        files: int = 4,
+        max_age_ms: int = 60_000,
+    ) -> None:
         self.filename = filename
+        self.block_size = block_size
+        self.max_size = max_size
+        self.files = files
+        self.max_age_ms = max_age_ms
+        self.buffer = bytearray(2 * block_size)
+        self.used = 0
+        self.first_ms = 0
+        try:
+            self.size = os.stat(filename)[6]
+        except OSError:
+            self.size = 0
 
-    def log(self, values: dict[str, str]) -> None:
-        """Logs data to file separated by ; first records is date and time."""
+    def log(self, values: Telemetry | dict[str, str]) -> None:
+        """Logs data to buffer separated by ; first records is date and time."""
         timestamp = time.localtime()
         timestamp_str = "{:04d}-{:02d}-{:02d};{:02d}:{:02d}:{:02d}".format(*timestamp)
         data = ";".join([timestamp_str] + [f"{key}={str(value)}" for key, value in values.items()]) + "\n"
+        record = data.encode()
+        if self.used + len(record) > len(self.buffer):
+            self.flush()
+            if len(record) > len(self.buffer):
+                self._write(record)
+                return
+        if not self.used:
+            self.first_ms = time.ticks_ms()
+        self.buffer[self.used : self.used + len(record)] = record
+        self.used += len(record)
+        if self.used >= self.block_size:
+            self.flush()
+
+    def poll(self) -> None:
+        """Write buffered records once the oldest one is too old."""
+        if self.used and time.ticks_diff(time.ticks_ms(), self.first_ms) >= self.max_age_ms:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered records to file."""
+        if self.used:
+            self._write(memoryview(self.buffer)[: self.used])
+            self.used = 0
+
+    def _write(self, data) -> None:
         try:
-            with open(self.filename, "a") as f:
+            with open(self.filename, "ab") as f:
                 f.write(data)
+            self.size += len(data)
+            if self.size >= self.max_size:
+                self._rotate()
         except OSError as e:
             print("Error writing to file:", e)
 
+    def _rotate(self) -> None:
+        """Shift filename.N to filename.N+1 and start new file."""
+        for index in range(self.files - 1, 0, -1):
+            older = f"{self.filename}.{index}"
+            newer = self.filename if index == 1 else f"{self.filename}.{index - 1}"
+            try:
+                if index == self.files - 1:
+                    os.remove(older)
+            except OSError:
+                pass
+            try:
+                os.rename(newer, older)
+            except OSError:
+                pass
+        self.size = 0
 
-def out_of_limits(minimum: int, value: float, maxximum: int) -> float:
+
+def out_of_limits(minimum: int, value: int, maxximum: int) -> int:
     """Check value if in the limits."""
     if minimum <= value <= maxximum:
         return value
     raise ValueError(minimum, value, maxximum)
 
 
-def singed_int(hexstr: str) -> int:
-    """Convers hex to singed int."""
-    value = int(hexstr, 16)
-    if value & (1 << (16 - 1)):
-        value -= 1 << 16
-    return value
+class Battery:
+    """Gets telemtery data from Seplos BMS without blocking the main loop.
 
+    Request/response state machine stepped by the main loop: send, collect the
+    reply as it arrives, time out and retry with exponential backoff.
+    """
 
-class Battery:
-    """Gets telemtery data from Seplos BMS."""
+    IDLE = 0
+    WAITING = 1
+    BACKOFF = 2
 
-    def __init__(self, rs485: machine.UART) -> None:
+    def __init__(
+        self,
+        rs485: machine.UART,
+        timeout_ms: int = 250,
+        backoff_ms: int = 125,
+        retries: int = 4,
+        address: int = 0,
+    ) -> None:
         self.rs485 = rs485
+        self.address = address
+        self.timeout_ms = timeout_ms
+        self.backoff_ms = backoff_ms
+        self.retries = retries
         self.counter_connection_error = 0
+        self.frame = seplos.TelemetryFrame()
+        self.state = Battery.IDLE
+        self.command = b""
+        self.deadline = 0
+
+    def busy(self) -> bool:
+        """Request is outstanding."""
+        return self.state != Battery.IDLE
+
+    def request(self) -> None:
+        """Start reading telemetry data from battery pack at address."""
+        self.command = seplos.telemetry_request(self.address)
+        self.counter_connection_error = 0
+        self._send()
+
+    def _send(self) -> None:
+        """Send request, stale bytes from previous attempt are dropped."""
+        if self.rs485.any():
+            self.rs485.read()
+        self.frame.reset()
+        self.rs485.write(self.command)
+        self.state = Battery.WAITING
+        self.deadline = time.ticks_add(time.ticks_ms(), self.timeout_ms)
 
-    def read_battery_parameters(self, command: str, heaters: OutputHeaters) -> dict[str, str | None | float]:
-        """Read telemetry data from batter."""
+    def step(self, heaters: OutputHeaters, telemetry: Telemetry) -> bool:
+        """Advance the request, True once finished with telemetry written."""
+        if self.state == Battery.IDLE:
+            return False
+        now = time.ticks_ms()
+        if self.state == Battery.BACKOFF:
+            if time.ticks_diff(now, self.deadline) >= 0:
+                self._send()
+            return False
         try:
-            self.rs485.write(ubinascii.unhexlify(command))
-            time.sleep(0.125)
-            if self.rs485.any():
-                data = str(self.rs485.readline())[15:]
-                response = {
-                    "error": None,
-                    "soc": out_of_limits(0, int("0x" + data[114:118]) / 10, 100),
-                    "current": out_of_limits(-100, singed_int(data[96:100]) / 100, 100),
-                    "voltage": out_of_limits(0, int("0x" + data[100:104]) / 100, 100),
-                    "cycles": int("0x" + data[122:126]),
-                }
-            else:
+            if self.frame.receive(self.rs485):
+                self.frame.decode()
+                if self.frame.adr != self.address:
+                    raise ValueError("Reply from other pack", self.frame.adr)
+                self._response(telemetry)
+            elif time.ticks_diff(now, self.deadline) >= 0:
                 raise TypeError
+            else:
+                return False
         except (TypeError, ValueError):
-            if self.counter_connection_error < 4:
-                if self.counter_connection_error == 2:
-                    heaters.set_pins(False, None, None, 0)
-                self.counter_connection_error += 1
-                time.sleep(1)
-                return self.read_battery_parameters(command, heaters)
-            return {"error": "Battery data", "soc": 0, "current": -100, "voltage": 0}
+            return self._failed(heaters, telemetry, now)
+        self.state = Battery.IDLE
         self.counter_connection_error = 0
-        return response
+        return True
+
+    def _response(self, telemetry: Telemetry) -> None:
+        """Write decoded frame to telemetry, values stay in protocol units."""
+        frame = self.frame
+        soc = out_of_limits(0, frame.soc, 1000)
+        current = out_of_limits(-10000, frame.current, 10000)
+        voltage = out_of_limits(0, frame.voltage, 10000)
+        telemetry.error = None
+        telemetry.soc = soc
+        telemetry.current = current
+        telemetry.voltage = voltage
+        telemetry.cycles = frame.cycles
+
+    def _failed(self, heaters: OutputHeaters, telemetry: Telemetry, now: int) -> bool:
+        """Schedule retry or give up with error."""
+        if self.counter_connection_error < self.retries:
+            if self.counter_connection_error == 2:
+                heaters.set_pins(False, None, None, 0)
+            self.state = Battery.BACKOFF
+            self.deadline = time.ticks_add(now, self.backoff_ms << self.counter_connection_error)
+            self.counter_connection_error += 1
+            return False
+        self.state = Battery.IDLE
+        telemetry.fail("Battery data")
+        return True
+
+
+class BatteryBank:
+    """Parallel Seplos packs on one RS485 bus seen as one battery.
+
+    A cycle requests per_cycle packs (all by default) back to back: the next
+    request is sent as soon as the previous reply is decoded, so the bus never
+    idles within a cycle. per_cycle=1 polls round robin, one pack per cycle,
+    keeping cycle time constant however many packs there are. Interface is
+    the one of Battery; the reading is SOC weighted by pack capacity, summed
+    current, average voltage and highest cycle count of the latest readings.
+    """
+
+    def __init__(self, battery: Battery, addresses: list[int], per_cycle: int = 0) -> None:
+        self.battery = battery
+        self.addresses = addresses
+        packs = len(addresses)
+        self.per_cycle = min(per_cycle, packs) if per_cycle > 0 else packs
+        self.soc = array("H", [0] * packs)  # 0.1 %
+        self.capacity = array("H", [0] * packs)  # 0.01 Ah
+        self.current = array("i", [0] * packs)  # 0.01 A
+        self.voltage = array("H", [0] * packs)  # 0.01 V
+        self.cycles = array("H", [0] * packs)
+        self.valid = 0
+        self.next = 0
+        self.left = 0
+        self.reading = Telemetry()  # Reply of the last pack, aggregated once the cycle is done
+
+    def busy(self) -> bool:
+        return self.left > 0
+
+    def request(self) -> None:
+        """Start a cycle of per_cycle packs continuing the rotation."""
+        self.left = self.per_cycle
+        self._request()
+
+    def _request(self) -> None:
+        self.battery.address = self.addresses[self.next]
+        self.battery.request()
+
+    def step(self, heaters: OutputHeaters, telemetry: Telemetry) -> bool:
+        """Advance the cycle, True once it is finished with telemetry written."""
+        reading = self.reading
+        if not self.battery.step(heaters, reading):
+            return False
+        if reading.error is not None:
+            self.left = 0
+            telemetry.fail(reading.error)
+            return True
+        index = self.next
+        frame = self.battery.frame
+        self.soc[index] = frame.soc
+        self.capacity[index] = frame.battery_capacity
+        self.current[index] = frame.current
+        self.voltage[index] = frame.voltage
+        self.cycles[index] = frame.cycles
+        self.valid |= 1 << index
+        self.next = (index + 1) % len(self.addresses)
+        self.left -= 1
+        if self.left:
+            self._request()
+            return False
+        if self.valid != (1 << len(self.addresses)) - 1:
+            self.request()  # First round robin pass, read on until every pack is known
+            return False
+        try:
+            self._aggregate(telemetry)
+        except ValueError:
+            telemetry.fail("Battery data")
+        return True
+
+    def _aggregate(self, telemetry: Telemetry) -> None:
+        """Combine pack readings into telemetry in protocol units."""
+        packs = len(self.addresses)
+        capacity = weighted = soc = current = voltage = cycles = 0
+        for index in range(packs):
+            capacity += self.capacity[index]
+            weighted += self.soc[index] * self.capacity[index]
+            soc += self.soc[index]
+            current += self.current[index]
+            voltage += self.voltage[index]
+            if self.cycles[index] > cycles:
+                cycles = self.cycles[index]
+        soc = out_of_limits(0, weighted // capacity if capacity else soc // packs, 1000)
+        current = out_of_limits(-10000 * packs, current, 10000 * packs)
+        voltage = out_of_limits(0, voltage // packs, 10000)
+        telemetry.error = None
+        telemetry.soc = soc
+        telemetry.current = current
+        telemetry.voltage = voltage
+        telemetry.cycles = cycles
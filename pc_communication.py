@@ -1,79 +1,424 @@
-"""Script for reading data from RS485 via USB to PC"""
+"""Daemon reading telemetry from Seplos BMS via RS485 converter connected to USB.
+
+Usage::
+
+    python pc_communication.py --port /dev/ttyUSB0 --interval 0.5 --sqlite bms.db
+    python pc_communication.py --port COM7 --csv bms.csv --flush 10
+
+The status command is polled asynchronously with a reply timeout; the port is
+reopened after errors. Blocking serial I/O runs in a worker thread. Decoded
+records are written in batches to SQLite or CSV by a separate task, so a slow
+write does not delay polling; buffering is bounded so a stuck writer drops the
+oldest records instead of growing memory. Throughput and latency counters are
+printed periodically.
+"""
+import argparse
+import asyncio
+import collections
+import csv
+import os
+import sqlite3
+import sys
 import time
-from itertools import islice
-import serial
+
+import seplos
+
+chunks_status = {  # according to seplos bms protocol v2.0, number represents bytes, total 75
+    "data_flag": 1,
+    "command_group": 1,
+    "number_of_cells": 1,
+    "cells_voltage_array": 32,
+    "number_of_temperatures": 1,
+    "temperatures_array": 12,
+    "current": 2,
+    "battery_voltage": 2,
+    "residual_capacity": 2,
+    "custom_number": 1,
+    "battery_capacity": 2,
+    "SOC": 2,
+    "rated_capacity": 2,
+    "number_of_cycles": 2,
+    "SOH": 2,
+    "port_voltage": 2,
+    "reserve1": 2,
+    "reserve2": 2,
+    "reserve3": 2,
+    "reserve4": 2,
+}
+# hex to dec representers -> cell_voltage(mV), temperature(0.1 K), capacity(0.01 Ah)
+# SOH, SOC (1‰), port/battery voltage(0.01V), current (signed int, 0.01A)
+SCALES = {
+    "current": 100,
+    "battery_voltage": 100,
+    "residual_capacity": 100,
+    "battery_capacity": 100,
+    "SOC": 10,
+    "rated_capacity": 100,
+    "SOH": 10,
+    "port_voltage": 100,
+}
+CELLS = chunks_status["cells_voltage_array"] // 2
+TEMPERATURES = chunks_status["temperatures_array"] // 2
+COLUMNS = (
+    ["time", "latency_ms"]
+    + [name for name in chunks_status if not name.endswith("_array")]
+    + [f"cell_{index + 1}" for index in range(CELLS)]
+    + [f"temperature_{index + 1}" for index in range(TEMPERATURES)]
+)
+
+
+def decode_status(frame: bytes) -> dict[str, int | float]:
+    """Validate telemetry reply and decode every chunk of its INFO.
+
+    Arrays are split into ``cell_n`` [mV] and ``temperature_n`` [°C] values,
+    the others are scaled to A, V, Ah and %.
+    """
+    if len(frame) != seplos.FRAME_SIZE or frame[0] != seplos.SOI or frame[-1] != seplos.EOI:
+        raise ValueError("Frame boundaries", len(frame))
+    length = seplos.hex_int(frame, 9, 4)
+    lenid = length & 0x0FFF
+    if lenid != seplos.INFO_SIZE or length >> 12 != seplos.length_checksum(lenid):
+        raise ValueError("LENID", length)
+    if seplos.hex_int(frame, seplos.FRAME_SIZE - 5, 4) != seplos.checksum(frame, 1, seplos.FRAME_SIZE - 5):
+        raise ValueError("CHKSUM")
+    if seplos.hex_int(frame, 5, 2) != 0x46 or seplos.hex_int(frame, 7, 2) != 0:
+        raise ValueError("CID1/RTN", seplos.hex_int(frame, 5, 4))
+    record = {}
+    offset = seplos.HEADER_SIZE
+    for name, size in chunks_status.items():
+        if name == "cells_voltage_array":
+            for index in range(CELLS):
+                record[f"cell_{index + 1}"] = seplos.hex_int(frame, offset + 4 * index, 4)
+        elif name == "temperatures_array":
+            for index in range(TEMPERATURES):
+                kelvin = seplos.hex_int(frame, offset + 4 * index, 4)
+                record[f"temperature_{index + 1}"] = (kelvin - seplos.KELVIN_OFFSET) / 10
+        else:
+            value = seplos.hex_int(frame, offset, 2 * size)
+            if name == "current":
+                value = seplos.signed16(value)
+            record[name] = value / SCALES[name] if name in SCALES else value
+        offset += 2 * size
+    if record["number_of_cells"] != CELLS or record["number_of_temperatures"] != TEMPERATURES:
+        raise ValueError("Number of cells/temperatures", record["number_of_cells"], record["number_of_temperatures"])
+    return record
+
+
+class Counters:
+    """Throughput and reply latency; recent latencies in a bounded window."""
+
+    def __init__(self, window: int = 1000) -> None:
+        self.started = time.monotonic()
+        self.requests = 0
+        self.records = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.written = 0
+        self.dropped = 0
+        self.bytes_received = 0
+        self.latency_total_ms = 0.0
+        self.latency_max_ms = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def reply(self, latency_ms: float, size: int) -> None:
+        self.records += 1
+        self.bytes_received += size
+        self.latency_total_ms += latency_ms
+        if latency_ms > self.latency_max_ms:
+            self.latency_max_ms = latency_ms
+        self.recent.append(latency_ms)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def __str__(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        avg = self.latency_total_ms / self.records if self.records else 0.0
+        return (
+            f"records {self.records} ({self.records / elapsed:.2f}/s, {self.bytes_received / elapsed:.0f} B/s)"
+            f" requests {self.requests} timeouts {self.timeouts} errors {self.errors}"
+            f" reconnects {self.reconnects} written {self.written} dropped {self.dropped}"
+            f" latency avg {avg:.1f} p50 {self.percentile(0.5):.1f} p99 {self.percentile(0.99):.1f}"
+            f" max {self.latency_max_ms:.1f} ms"
+        )
+
+
+class CsvSink:
+    """Appends records to CSV, header is written to a new file."""
+
+    def __init__(self, path: str) -> None:
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="")
+        self.writer = csv.DictWriter(self.file, COLUMNS)
+        if new:
+            self.writer.writeheader()
+
+    def write(self, records: list[dict]) -> None:
+        self.writer.writerows(records)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class SqliteSink:
+    """Inserts records into table ``telemetry``, one transaction per batch."""
+
+    def __init__(self, path: str) -> None:
+        self.connection = sqlite3.connect(path, check_same_thread=False)  # Batches are written from a worker thread
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f'"{name}" REAL' for name in COLUMNS)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS telemetry ({columns})")
+        names = ", ".join(f'"{name}"' for name in COLUMNS)
+        self.insert = f"INSERT INTO telemetry ({names}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+    def write(self, records: list[dict]) -> None:
+        with self.connection:
+            self.connection.executemany(self.insert, [[record[name] for name in COLUMNS] for record in records])
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class PrintSink:
+    """Prints SOC, current and voltage like the original script."""
+
+    def write(self, records: list[dict]) -> None:
+        for record in records:
+            print("SOC:", record["SOC"], "%,CURRENT:", record["current"], "A, VOLTAGE:", record["battery_voltage"])
+
+    def close(self) -> None:
+        pass
+
+
+class BatchWriter:
+    """Collects records and writes them every flush_interval seconds or batch_size records.
+
+    run() is the writer task; add() only queues and wakes it once a batch is
+    full. Pending records are capped at max_pending; when the sink keeps
+    failing the oldest are dropped and counted.
+    """
+
+    def __init__(
+        self, sink, counters: Counters, flush_interval: float = 5.0, batch_size: int = 500, max_pending: int = 50_000
+    ) -> None:
+        self.sink = sink
+        self.counters = counters
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = collections.deque(maxlen=max_pending)
+        self.last_flush = time.monotonic()
+        self.wake = asyncio.Event()
+
+    def add(self, record: dict) -> None:
+        if len(self.pending) == self.pending.maxlen:
+            self.counters.dropped += 1
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self.wake.set()
+
+    def due(self) -> bool:
+        return len(self.pending) >= self.batch_size or (
+            bool(self.pending) and time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    async def flush(self) -> None:
+        """Write pending records in a worker thread, kept on failure."""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        batch = list(self.pending)
+        try:
+            await asyncio.to_thread(self.sink.write, batch)
+        except (OSError, sqlite3.Error) as e:
+            print("Error writing records:", e, file=sys.stderr)
+            return
+        for _ in range(len(batch)):
+            self.pending.popleft()
+        self.counters.written += len(batch)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Flush whenever due until stop is set, the final flush is left to the caller."""
+        while not stop.is_set():
+            timeout = max(self.last_flush + self.flush_interval - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            if self.due():
+                await self.flush()
+            elif not self.pending:
+                self.last_flush = time.monotonic()  # Nothing to write, next interval starts now
+
+
+def open_serial(port: str, baudrate: int):
+    """Blocking pyserial port, used from worker threads only."""
+    import serial
+
+    return serial.Serial(port=port, baudrate=baudrate, timeout=0.5, write_timeout=1)
+
+
+class StatusPoller:
+    """Polls the BMS status command over a reopened-on-error serial port."""
+
+    def __init__(
+        self,
+        port: str,
+        baudrate: int = 19200,
+        address: int = 0,
+        reply_timeout: float = 0.5,
+        reconnect_delay: float = 1.0,
+        reconnect_max: float = 30.0,
+        open_port=open_serial,
+    ) -> None:
+        self.port = port
+        self.baudrate = baudrate
+        self.command = seplos.telemetry_request(address)
+        self.reply_timeout = reply_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max = reconnect_max
+        self.open_port = open_port
+        self.serial = None
+
+    async def connect(self, counters: Counters) -> None:
+        """Open the port, retrying with exponential backoff."""
+        delay = self.reconnect_delay
+        while self.serial is None:
+            try:
+                self.serial = await asyncio.to_thread(self.open_port, self.port, self.baudrate)
+                print("Connected to:", self.port, file=sys.stderr)
+            except OSError as e:  # serial.SerialException is an OSError
+                print("Cannot open", self.port, e, file=sys.stderr)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max)
+            else:
+                counters.reconnects += 1
+
+    def close(self) -> None:
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except OSError:
+                pass
+            self.serial = None
+
+    def transfer(self) -> bytes:
+        """Send status command and read the reply up to EOI; blocking, TimeoutError when it does not come."""
+        port = self.serial
+        port.reset_input_buffer()
+        port.write(self.command)
+        port.timeout = self.reply_timeout
+        reply = port.read_until(b"\r")
+        if not reply.endswith(b"\r"):
+            raise TimeoutError
+        return reply[max(reply.rfind(b"~"), 0) :]
+
+    async def request(self) -> bytes:
+        """Request and reply in a worker thread, the event loop keeps running."""
+        return await asyncio.to_thread(self.transfer)
+
+    async def run(self, writer: BatchWriter, counters: Counters, interval: float, stop: asyncio.Event) -> None:
+        """Poll every interval seconds until stop is set."""
+        due = time.monotonic()
+        while not stop.is_set():
+            await self.connect(counters)
+            sent = time.monotonic()
+            counters.requests += 1
+            try:
+                frame = await self.request()
+                latency_ms = (time.monotonic() - sent) * 1000
+                record = {"time": round(time.time(), 3), "latency_ms": round(latency_ms, 2)}
+                record |= decode_status(frame)
+            except TimeoutError:
+                counters.timeouts += 1
+            except ValueError:
+                counters.errors += 1
+            except OSError as e:
+                counters.errors += 1
+                print("Port error:", e, file=sys.stderr)
+                self.close()
+            else:
+                counters.reply(latency_ms, len(frame))
+                writer.add(record)
+            due += interval
+            delay = due - time.monotonic()
+            if delay < 0:
+                due = time.monotonic()  # Behind schedule, skip missed polls
+                delay = 0
+            try:
+                await asyncio.wait_for(stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        writer.wake.set()  # Writer task ends without waiting for its interval
+
+
+async def report(counters: Counters, period: float, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), period)
+        except asyncio.TimeoutError:
+            print(counters, file=sys.stderr)
+
+
+async def daemon(args: argparse.Namespace, stop: asyncio.Event | None = None, open_port=open_serial) -> Counters:
+    """Poll and write until stop is set, then flush and close."""
+    stop = asyncio.Event() if stop is None else stop
+    if args.sqlite:
+        sink = SqliteSink(args.sqlite)
+    elif args.csv:
+        sink = CsvSink(args.csv)
+    else:
+        sink = PrintSink()
+    counters = Counters()
+    writer = BatchWriter(sink, counters, args.flush, args.batch, args.max_pending)
+    poller = StatusPoller(args.port, args.baudrate, args.address, args.timeout, open_port=open_port)
+    tasks = [
+        asyncio.create_task(poller.run(writer, counters, args.interval, stop)),
+        asyncio.create_task(writer.run(stop)),
+    ]
+    if args.stats:
+        tasks.append(asyncio.create_task(report(counters, args.stats, stop)))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        stop.set()
+        await writer.flush()
+        sink.close()
+        poller.close()
+    return counters
 
 
-def singed_int(hexstr: str, bits: int) -> int:
-    """Convert to singed int."""
-    value = int(hexstr, 16)
-    if value & (1 << (bits - 1)):
-        value -= 1 << bits
-    return value
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", default=os.environ.get("SEPLOS_PORT", "COM7"), help="serial port, e.g. /dev/ttyUSB0")
+    parser.add_argument("--baudrate", type=int, default=19200)
+    parser.add_argument("--address", type=lambda value: int(value, 0), default=0, help="pack address")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between requests")
+    parser.add_argument("--timeout", type=float, default=0.5, help="reply timeout in seconds")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--sqlite", metavar="FILE")
+    output.add_argument("--csv", metavar="FILE")
+    parser.add_argument("--flush", type=float, default=5.0, help="seconds between batch writes")
+    parser.add_argument("--batch", type=int, default=500, help="records forcing a batch write")
+    parser.add_argument("--max-pending", type=int, default=50_000, help="records kept while writes fail")
+    parser.add_argument("--stats", type=float, default=60.0, help="seconds between counter reports, 0 disables")
+    return parser.parse_args(argv)
 
 
 def main() -> None:
     """Main function call."""
-    port = "COM7"
-    cmd_give_status = "7E 32 30 30 30 34 36 34 32 45 30 30 32 30 30 46 44 33 37 0D"
-    info_size = 75  # bytes
-    message_start = 15  # first 15 is respone status
-    message_finished = (
-        message_start + info_size * 2
-    )  # trim out end of line, info _size * 2 -> bytes to hex
-    chunks_status = {  # according to seplos bms protocol v2.0, number represents bytes, total 75
-        "data_flag": 1,
-        "command_group": 1,
-        "number_of_cells": 1,
-        "cells_voltage_array": 32,
-        "number_of_temperatures": 1,
-        "temperatures_array": 12,
-        "current": 2,
-        "battery_voltage": 2,
-        "residual_capacity": 2,
-        "custom_number": 1,
-        "battery_capacity": 2,
-        "SOC": 2,
-        "rated_capacity": 2,
-        "number_of_cycles": 2,
-        "SOH": 2,
-        "port_voltage": 2,
-        "reserve1": 2,
-        "reserve2": 2,
-        "reserve3": 2,
-        "reserve4": 2,
-    }
-    ser = serial.Serial(port=port, baudrate=19200, timeout=0.1)
-    print("Connected to: " + ser.portstr)
-    print("Name:", ser.name)
-    print("---Writing---")
+    args = parse_args()
     try:
-        while True:
-            ser.write(bytes.fromhex(cmd_give_status))
-            received = ser.readline()
-            hex_received = str(received)[
-                message_start:message_finished
-            ]  # trim received.
-            assert len(hex_received) / 2 == sum(
-                chunks_status.values()
-            ), "Messsage has wrong lenght."
-            it = iter(str(hex_received))
-            result = ["".join(islice(it, 2 * i)) for i in chunks_status.values()]
-            output_hex = dict(zip(chunks_status.keys(), result))
-            # hex to dec representers -> cell_voltage(mV), temperature(0.1 °C), capacity(0.01 Ah)
-            # SOH, SOC (1‰), port/battery voltage(0.01V), current (signed int, 0.01A)
-            print(
-                "SOC:",
-                (int(output_hex["SOC"], base=16) / 10),
-                "%,CURRENT:",
-                singed_int(output_hex["current"], 16) / 100,
-                "A, VOLTAGE:",
-                (int(output_hex["battery_voltage"], base=16) / 100),
-            )
-            time.sleep(1)
+        counters = asyncio.run(daemon(args))
     except KeyboardInterrupt:
-        ser.close()
         print("Finished")
+    else:
+        print(counters)
 
 
 if __name__ == "__main__":
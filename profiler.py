@@ -0,0 +1,154 @@
+"""Per-stage timing and allocation statistics of the main loop.
+
+Enabled by ``main.PROFILE``. A stage is timed between start() and stop()
+with ``time.ticks_us`` and the heap is sampled with ``gc.mem_free`` at both
+ends. Durations go to a fixed log2 histogram, so recording allocates
+nothing and p99 is known within a factor of two (never above the maximum).
+Statistics are written to the log and reset every dump period, which also
+keeps the sums in small ints.
+"""
+import gc
+import time
+from array import array
+
+BUCKETS = 24  # Bucket k counts durations below 2**k us, the last one everything longer (8 s).
+
+
+def _column(value: int, width: int) -> str:
+    """Right aligned value with at least one space before it, clamped to fit."""
+    return f"{min(value, 10 ** (width - 1) - 1):{width}d}"
+
+
+class Stage:
+    """Histogram of durations and heap deltas of one stage."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.histogram = array("I", [0] * BUCKETS)
+        self.started_us = 0
+        self.last_us = 0
+        self.free = 0
+        self.reset()
+
+    def reset(self) -> None:
+        for bucket in range(BUCKETS):
+            self.histogram[bucket] = 0
+        self.count = 0
+        self.total_us = 0
+        self.min_us = 0
+        self.max_us = 0
+        self.alloc_total = 0
+        self.alloc_max = 0
+        self.collections = 0
+
+    def start(self) -> None:
+        self.free = gc.mem_free()
+        self.started_us = time.ticks_us()
+
+    def stop(self) -> None:
+        elapsed = time.ticks_diff(time.ticks_us(), self.started_us)
+        self.record(elapsed, self.free - gc.mem_free())
+
+    def record(self, elapsed_us: int, allocated: int) -> None:
+        """Add one run; negative allocation means the collector ran during it."""
+        self.last_us = elapsed_us
+        if not self.count or elapsed_us < self.min_us:
+            self.min_us = elapsed_us
+        if elapsed_us > self.max_us:
+            self.max_us = elapsed_us
+        self.count += 1
+        self.total_us += elapsed_us
+        bucket = 0
+        while elapsed_us >> bucket and bucket < BUCKETS - 1:
+            bucket += 1
+        self.histogram[bucket] += 1
+        if allocated < 0:
+            self.collections += 1
+            return
+        self.alloc_total += allocated
+        if allocated > self.alloc_max:
+            self.alloc_max = allocated
+
+    def avg_us(self) -> int:
+        return self.total_us // self.count if self.count else 0
+
+    def percentile(self, percent: int = 99) -> int:
+        """Upper bound of the histogram bucket holding the percentile, at most max."""
+        rank = (self.count * percent + 99) // 100
+        seen = 0
+        for bucket in range(BUCKETS):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return min((1 << bucket) - 1, self.max_us)
+        return self.max_us
+
+    def items(self) -> list[tuple[str, int | str]]:
+        """Logged values, in the format DataLogger.log takes."""
+        return [
+            ("stage", self.name),
+            ("count", self.count),
+            ("min_us", self.min_us),
+            ("avg_us", self.avg_us()),
+            ("p99_us", self.percentile()),
+            ("max_us", self.max_us),
+            ("alloc_avg", self.alloc_total // self.count if self.count else 0),
+            ("alloc_max", self.alloc_max),
+            ("gc", self.collections),
+        ]
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:8} runs {self.count:6d} min {self.min_us:7d} avg {self.avg_us():7d}"
+            f" p99 {self.percentile():7d} max {self.max_us:7d} us alloc max {self.alloc_max:5d} B"
+        )
+
+
+class Profiler:
+    """Stages of the main loop, dumped to the log every dump_ms."""
+
+    def __init__(self, names: list[str], dump_ms: int = 600_000) -> None:
+        self.stages = {name: Stage(name) for name in names}
+        self.dump_ms = dump_ms
+        self.since_ms = time.ticks_ms()
+
+    def __getitem__(self, name: str) -> Stage:
+        return self.stages[name]
+
+    def timed(self, name: str, func):
+        """Callback func(argument) wrapped as a stage, such as the LCD timer callback."""
+        stage = self.stages[name]
+
+        def call(argument):
+            stage.start()
+            func(argument)
+            stage.stop()
+
+        return call
+
+    def lines(self) -> list[str]:
+        """Diagnostics page, 30 characters per line."""
+        lines = ["     avg us    p99    max    B"]
+        for stage in self.stages.values():
+            lines.append(
+                f"{stage.name:4}{_column(stage.avg_us(), 7)}{_column(stage.percentile(), 7)}"
+                f"{_column(stage.max_us, 7)}{_column(stage.alloc_max, 5)}"
+            )
+        lines.append(f"free {gc.mem_free():d} B")
+        lines.append(f"since {time.ticks_diff(time.ticks_ms(), self.since_ms) // 1000:d} s")
+        return lines
+
+    def poll(self, logger) -> None:
+        """Dump and reset once the period is over."""
+        if time.ticks_diff(time.ticks_ms(), self.since_ms) >= self.dump_ms:
+            self.dump(logger)
+
+    def dump(self, logger) -> None:
+        """Write one log record per stage and start a new period."""
+        for stage in self.stages.values():
+            if stage.count:
+                logger.log(stage)
+            stage.reset()
+        self.since_ms = time.ticks_ms()
+
+    def __str__(self) -> str:
+        return "\n".join(str(stage) for stage in self.stages.values())
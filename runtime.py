@@ -0,0 +1,245 @@
+"""Cooperative runtime: BMS polling, control, clock sync, logging and display as tasks.
+
+Runs on uasyncio on the Pico and on asyncio on a PC. Every task keeps its own
+period, so slow UART or flash I/O in one task does not hold back relay
+decisions in the control task. Each task records its scheduling lag (how late
+it was woken compared to when it was due) and its run time.
+"""
+import time
+import machine
+import lcd_1inch14
+import history
+import main
+import models
+import stream
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+BMS_PERIOD_MS = 2000
+BMS_POLL_MS = 10
+CLOCK_PERIOD_MS = 60_000
+LOG_PERIOD_MS = 2000
+DISPLAY_PERIOD_MS = 1000
+REPORT_PERIOD_MS = 0  # Print task statistics this often, 0 disables printing.
+
+
+class TaskStats:
+    """Scheduling lag and run time of one task."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.runs = 0
+        self.lag_total = 0
+        self.lag_max = 0
+        self.run_max_us = 0
+
+    def record(self, lag_ms: int, run_us: int) -> None:
+        self.runs += 1
+        self.lag_total += lag_ms
+        if lag_ms > self.lag_max:
+            self.lag_max = lag_ms
+        if run_us > self.run_max_us:
+            self.run_max_us = run_us
+
+    def __str__(self) -> str:
+        avg = self.lag_total / self.runs if self.runs else 0
+        return (
+            f"{self.name:8} runs {self.runs:6d} lag avg {avg:6.1f} max {self.lag_max:5d} ms"
+            f" run max {self.run_max_us:7d} us"
+        )
+
+
+async def periodic(stats: TaskStats, period_ms: int, func) -> None:
+    """Call func every period_ms, missed periods are skipped not bunched."""
+    due = time.ticks_add(time.ticks_ms(), period_ms)
+    while True:
+        delay = time.ticks_diff(due, time.ticks_ms())
+        await asyncio.sleep(max(delay, 0) / 1000)
+        lag = time.ticks_diff(time.ticks_ms(), due)
+        start = time.ticks_us()
+        func()
+        stats.record(lag, time.ticks_diff(time.ticks_us(), start))
+        due = time.ticks_add(due, period_ms)
+        if time.ticks_diff(time.ticks_ms(), due) > 0:
+            due = time.ticks_add(time.ticks_ms(), period_ms)
+
+
+class Runtime:
+    """Tasks of the controller sharing one Telemetry record."""
+
+    def __init__(self) -> None:
+        self.counter_L1, self.counter_L2 = main.init_counters()
+        self.battery = main.init_battery()
+        self.heaters = main.init_heaters()
+        self.grid_connector = machine.Pin(22, machine.Pin.OUT, value=0)
+        self.telemetry = models.Telemetry()
+        self.lcd = models.LCD(lcd_1inch14.LCD_1inch14(), None, self.telemetry)
+        self.drift = models.ClockDrift(main.SYNC_TOLERANCE_S) if main.ADAPTIVE_SYNC else None
+        self.clock = main.init_clock(self.drift)
+        self.clock_time = [0] * 8
+        self.config = models.Config("config.json")
+        self.logger = models.DataLogger("log.csv")
+        self.history = history.History()
+        cycles = self.config.get("cycles", 0)
+        self.cycles_recorder = {"count": cycles, "last_three": 3 * [cycles]}
+        self.control = models.ControlLogic()
+        self.shed = main.init_fast_shed(self.heaters, self.counter_L1, self.counter_L2, self.control)
+        self.poll = models.PollScheduler(self.control, normal_ms=BMS_PERIOD_MS)
+        self.stream = stream.TelemetryStream() if main.STREAM else None
+        self.last_sync = time.time() // 86400
+        self.fresh = asyncio.Event()
+        self.stop = asyncio.Event()
+        self.reading_ms = 0
+        self.sequence = 0
+        self.logged_sequence = 0
+        self.stats = {name: TaskStats(name) for name in ("bms", "control", "clock", "log", "display")}
+
+    async def bms_task(self) -> None:
+        """Request telemetry every poll interval and step the reply without blocking.
+
+        Run time of this task is the time from request to finished reply.
+        """
+        stats = self.stats["bms"]
+        due = time.ticks_ms()
+        while True:
+            lag = time.ticks_diff(time.ticks_ms(), due)
+            start = time.ticks_us()
+            self.poll.requested(time.ticks_ms())
+            self.battery.request()
+            while True:
+                await asyncio.sleep(BMS_POLL_MS / 1000)
+                if self.battery.step(self.heaters, self.telemetry):
+                    break
+            stats.record(lag, time.ticks_diff(time.ticks_us(), start))
+            self.reading_ms = time.ticks_ms()
+            self.fresh.set()
+            due = time.ticks_add(due, self.poll.interval_ms)
+            await asyncio.sleep(max(time.ticks_diff(due, time.ticks_ms()), 0) / 1000)
+
+    async def control_task(self) -> None:
+        """Run control on every fresh reading, shed overpower if readings stall."""
+        stats = self.stats["control"]
+        while True:
+            waited = time.ticks_ms()
+            try:
+                await asyncio.wait_for(self.fresh.wait(), main.OVERPOWER_DEADLINE_MS / 1000)
+            except asyncio.TimeoutError:
+                lag = time.ticks_diff(time.ticks_ms(), waited) - main.OVERPOWER_DEADLINE_MS
+                start = time.ticks_us()
+                count_L1 = self.counter_L1.peek_scaled(main.NOMINAL_CYCLE_MS)
+                count_L2 = self.counter_L2.peek_scaled(main.NOMINAL_CYCLE_MS)
+                telemetry = self.telemetry
+                self.control.overpower_only(telemetry, count_L1, count_L2)
+                if self.shed is not None:
+                    self.shed.hold(telemetry)
+                self.heaters.set_pins(
+                    telemetry.enabled, telemetry.overpower_L1, telemetry.overpower_L2, telemetry.control
+                )
+                stats.record(lag, time.ticks_diff(time.ticks_us(), start))
+                continue
+            lag = time.ticks_diff(time.ticks_ms(), self.reading_ms)
+            start = time.ticks_us()
+            self.fresh.clear()
+            self.apply()
+            stats.record(lag, time.ticks_diff(time.ticks_us(), start))
+
+    def apply(self) -> None:
+        """Control step for the battery reading in telemetry."""
+        telemetry = self.telemetry
+        telemetry.count_L1 = self.counter_L1.scaled(self.counter_L1.get_count(), main.NOMINAL_CYCLE_MS)
+        telemetry.count_L2 = self.counter_L2.scaled(self.counter_L2.get_count(), main.NOMINAL_CYCLE_MS)
+        previous_relays = self.heaters.state() | telemetry.off_grid << main.OFF_GRID_RELAY_BIT
+        self.control.update(telemetry, telemetry.count_L1, telemetry.count_L2)
+        if self.shed is not None:
+            self.shed.hold(telemetry)
+        self.heaters.set_pins(telemetry.enabled, telemetry.overpower_L1, telemetry.overpower_L2, telemetry.control)
+        self.grid_connector.value(telemetry.off_grid)
+        relays = self.heaters.state() | telemetry.off_grid << main.OFF_GRID_RELAY_BIT
+        if main.ADAPTIVE_POLLING:
+            self.poll.update(telemetry.soc, telemetry.current, time.ticks_ms(), relays != previous_relays)
+        self.history.record(
+            time.time(),
+            telemetry.soc,
+            telemetry.current,
+            telemetry.voltage,
+            telemetry.count_L1,
+            telemetry.count_L2,
+            relays,
+        )
+        if self.stream is not None:
+            self.stream.send(telemetry, relays, self.poll.interval_ms)
+        self.sequence += 1
+        if telemetry.error is not None:
+            self.stop.set()
+
+    def sync_clock(self) -> None:
+        """Synchronize Pico RTC with DS3231 once drift is expected, or once a day in the evening."""
+        seconds = time.time()
+        if self.drift is not None:
+            due = self.drift.due(seconds)
+        else:
+            due = main.sync_due(self.last_sync, seconds)
+        if due:
+            self.telemetry.error = main.synchronization(self.clock.get_time(self.clock_time), self.drift)
+            self.last_sync = seconds // 86400
+            if self.telemetry.error is not None:
+                self.stop.set()
+
+    def log(self) -> None:
+        """Record cycles once per new battery reading."""
+        if self.logged_sequence != self.sequence:
+            self.logged_sequence = self.sequence
+            self.cycles_recorder = main.update_if_changed(
+                self.telemetry, self.cycles_recorder, self.config, self.logger
+            )
+        self.logger.poll()
+        self.config.poll()
+
+    def report(self) -> str:
+        """Statistics of all tasks."""
+        lines = [str(stats) for stats in self.stats.values()]
+        if self.shed is not None:
+            lines.append(str(self.shed))
+        if main.ADAPTIVE_POLLING:
+            lines.append(str(self.poll))
+        if self.drift is not None:
+            lines.append(str(self.drift))
+        return "\n".join(lines)
+
+    async def report_task(self) -> None:
+        while True:
+            await asyncio.sleep(REPORT_PERIOD_MS / 1000)
+            print(self.report())
+
+    async def run(self) -> None:
+        """Run until an error, then switch outputs off and keep showing the error."""
+        display = asyncio.create_task(periodic(self.stats["display"], DISPLAY_PERIOD_MS, self.lcd.refresh))
+        tasks = [
+            asyncio.create_task(self.bms_task()),
+            asyncio.create_task(self.control_task()),
+            asyncio.create_task(periodic(self.stats["clock"], CLOCK_PERIOD_MS, self.sync_clock)),
+            asyncio.create_task(periodic(self.stats["log"], LOG_PERIOD_MS, self.log)),
+        ]
+        if REPORT_PERIOD_MS:
+            tasks.append(asyncio.create_task(self.report_task()))
+        await self.stop.wait()
+        for task in tasks:
+            task.cancel()
+        self.grid_connector.value(0)
+        self.heaters.set_pins(False, None, None, 0)
+        self.logger.flush()
+        self.config.flush()
+        self.history.flush()
+        await display
+
+
+def run() -> None:
+    """Entry point replacing ``main.main()``."""
+    asyncio.run(Runtime().run())
+
+
+if __name__ == "__main__":
+    run()
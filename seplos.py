@@ -0,0 +1,155 @@
+"""Seplos BMS protocol v2.0 telemetry (CID2 0x42) frame decoding.
+
+Frame: SOI ``~``, VER, ADR, CID1, RTN, LENGTH (LCHKSUM + LENID), INFO, CHKSUM
+and EOI ``\\r``; everything between SOI and EOI is ASCII hex. INFO layout is
+the one in ``pc_communication.chunks_status`` (75 bytes, 150 hex chars).
+"""
+from array import array
+
+SOI = 0x7E
+EOI = 0x0D
+HEADER_SIZE = 13  # SOI + VER, ADR, CID1, RTN (2 chars each) + LENGTH (4 chars)
+INFO_SIZE = 150
+FRAME_SIZE = HEADER_SIZE + INFO_SIZE + 5  # CHKSUM (4 chars) + EOI
+CELLS = 16
+TEMPERATURES = 6
+KELVIN_OFFSET = 2731  # Temperatures are sent in 0.1 K
+
+
+def hex_digit(char: int) -> int:
+    """Value of one ASCII hex digit."""
+    if 48 <= char <= 57:
+        return char - 48
+    char |= 0x20
+    if 97 <= char <= 102:
+        return char - 87
+    raise ValueError("Not a hex digit", char)
+
+
+def hex_int(buf, start: int, digits: int) -> int:
+    """Unsigned int from ASCII hex digits in buffer, no intermediate string."""
+    value = 0
+    for index in range(start, start + digits):
+        value = (value << 4) | hex_digit(buf[index])
+    return value
+
+
+def signed16(value: int) -> int:
+    """Two's complement of 16 bit value."""
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def checksum(buf, start: int, end: int) -> int:
+    """Seplos CHKSUM over buf[start:end]."""
+    total = 0
+    for index in range(start, end):
+        total += buf[index]
+    return (~total + 1) & 0xFFFF
+
+
+def length_checksum(lenid: int) -> int:
+    """LCHKSUM nibble for LENID."""
+    return (~((lenid & 0xF) + ((lenid >> 4) & 0xF) + ((lenid >> 8) & 0xF)) + 1) & 0xF
+
+
+_REQUESTS = {}
+
+
+def request_frame(adr: int, cid2: int = 0x42, info: bytes = b"", cid1: int = 0x46, ver: int = 0x20) -> bytes:
+    """Command frame for pack address adr with LENGTH and CHKSUM filled in."""
+    body = b"%02X%02X%02X%02X" % (ver, adr, cid1, cid2)
+    lenid = len(info)
+    body += b"%04X" % ((length_checksum(lenid) << 12) | lenid) + info
+    return b"~" + body + b"%04X\r" % checksum(body, 0, len(body))
+
+
+def telemetry_request(adr: int) -> bytes:
+    """Cached telemetry (0x42) request of pack adr, INFO is the address."""
+    frame = _REQUESTS.get(adr)
+    if frame is None:
+        frame = _REQUESTS[adr] = request_frame(adr, 0x42, b"%02X" % adr)
+    return frame
+
+
+class TelemetryFrame:
+    """Preallocated receive buffer and decoded values of one telemetry frame.
+
+    Values are kept in protocol units (mV, 0.01 A, 0.01 V, 0.01 Ah, 0.1 %,
+    0.1 K) so decoding does not allocate floats.
+    """
+
+    def __init__(self) -> None:
+        self.buf = bytearray(FRAME_SIZE)
+        self.view = memoryview(self.buf)
+        self.size = 0
+        self.adr = 0
+        self.cells_mv = array("H", [0] * CELLS)
+        self.temperatures = array("H", [0] * TEMPERATURES)
+        self.current = 0
+        self.voltage = 0
+        self.residual_capacity = 0
+        self.custom_number = 0
+        self.battery_capacity = 0
+        self.soc = 0
+        self.rated_capacity = 0
+        self.cycles = 0
+        self.soh = 0
+        self.port_voltage = 0
+
+    def reset(self) -> None:
+        """Drop partially received frame."""
+        self.size = 0
+
+    def receive(self, uart) -> bool:
+        """Append pending UART bytes to the buffer, True once frame is complete.
+
+        Frame is complete at EOI or when the buffer is full; remaining bytes are
+        left in the UART.
+        """
+        while self.size < FRAME_SIZE and uart.any():
+            self.size += uart.readinto(self.view[self.size :]) or 0
+            if self.size and self.buf[self.size - 1] == EOI:
+                return True
+        return self.size == FRAME_SIZE
+
+    def decode(self) -> None:
+        """Validate framing, LENID and CHKSUM and decode INFO."""
+        buf = self.buf
+        if self.size != FRAME_SIZE or buf[0] != SOI or buf[FRAME_SIZE - 1] != EOI:
+            raise ValueError("Frame boundaries", self.size)
+        length = hex_int(buf, 9, 4)
+        lenid = length & 0x0FFF
+        if lenid != INFO_SIZE or length >> 12 != length_checksum(lenid):
+            raise ValueError("LENID", length)
+        if hex_int(buf, FRAME_SIZE - 5, 4) != checksum(buf, 1, FRAME_SIZE - 5):
+            raise ValueError("CHKSUM")
+        if hex_int(buf, 5, 2) != 0x46 or hex_int(buf, 7, 2) != 0:
+            raise ValueError("CID1/RTN", hex_int(buf, 5, 4))
+        self.adr = hex_int(buf, 3, 2)
+        offset = HEADER_SIZE + 4  # skip data flag and command group
+        if hex_int(buf, offset, 2) != CELLS:
+            raise ValueError("Number of cells")
+        offset += 2
+        for cell in range(CELLS):
+            self.cells_mv[cell] = hex_int(buf, offset, 4)
+            offset += 4
+        if hex_int(buf, offset, 2) != TEMPERATURES:
+            raise ValueError("Number of temperatures")
+        offset += 2
+        for sensor in range(TEMPERATURES):
+            self.temperatures[sensor] = hex_int(buf, offset, 4)
+            offset += 4
+        self.current = signed16(hex_int(buf, offset, 4))
+        self.voltage = hex_int(buf, offset + 4, 4)
+        self.residual_capacity = hex_int(buf, offset + 8, 4)
+        self.custom_number = hex_int(buf, offset + 12, 2)
+        self.battery_capacity = hex_int(buf, offset + 14, 4)
+        self.soc = hex_int(buf, offset + 18, 4)
+        self.rated_capacity = hex_int(buf, offset + 22, 4)
+        self.cycles = hex_int(buf, offset + 26, 4)
+        self.soh = hex_int(buf, offset + 30, 4)
+        self.port_voltage = hex_int(buf, offset + 34, 4)
+
+    def temperature(self, sensor: int) -> float:
+        """Temperature of sensor in °C."""
+        return (self.temperatures[sensor] - KELVIN_OFFSET) / 10
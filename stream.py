@@ -0,0 +1,114 @@
+"""Binary telemetry records streamed over USB serial, one per cycle.
+
+A record has a fixed size (FORMAT, little endian) and ends with a Fletcher-16
+checksum. It is packed into a preallocated buffer, COBS encoded so it holds
+no zero byte, and written to stdout (USB CDC on the Pico) followed by a zero
+byte that ends the frame. Text printed to the same port never contains a zero
+byte, so the decoder drops it as a frame of wrong length and continues at the
+next zero. Decoded on a PC by ``python -m host.stream``.
+
+Values are in protocol units: SOC [0.1 %], current [0.01 A], voltage
+[0.01 V], pulse counts per nominal 2 s cycle. Overpower None is sent as NONE. Stage timings are 0 unless
+``main.PROFILE`` is on.
+"""
+import struct
+import sys
+import time
+
+VERSION = 1
+FIELDS = (
+    "version", "sequence", "ticks_ms", "time", "soc", "current", "voltage", "cycles",
+    "count_L1", "count_L2", "relays", "control", "overpower_L1", "overpower_L2", "flags",
+    "poll_ms", "uart_us", "ctrl_us", "loop_us",
+)
+FORMAT = "<BHIIHiHHHHBbbbBHIII"
+SIZE = struct.calcsize(FORMAT) + 2  # Record with checksum
+FRAME_SIZE = SIZE + 2  # COBS code byte and the zero delimiter, records are shorter than 254 bytes
+NONE = -128  # Overpower None
+ENABLED = 1  # Bits of flags
+OFF_GRID = 2
+ERROR = 4
+
+
+def fletcher16(data, length: int) -> int:
+    first = 0
+    second = 0
+    for index in range(length):
+        first = (first + data[index]) % 255
+        second = (second + first) % 255
+    return second << 8 | first
+
+
+def cobs_encode(source, destination) -> int:
+    """Encode source into destination without zero bytes, returns the encoded length."""
+    code_index = 0
+    code = 1
+    out = 1
+    for byte in source:
+        if byte:
+            destination[out] = byte
+            out += 1
+            code += 1
+            if code == 0xFF:
+                destination[code_index] = code
+                code_index = out
+                out += 1
+                code = 1
+        else:
+            destination[code_index] = code
+            code_index = out
+            out += 1
+            code = 1
+    destination[code_index] = code
+    return out
+
+
+class TelemetryStream:
+    """Packs and writes one frame per send(); nothing is allocated per record."""
+
+    def __init__(self, out=None) -> None:
+        self.out = sys.stdout.buffer if out is None else out
+        self.record = bytearray(SIZE)
+        self.frame = bytearray(FRAME_SIZE)
+        self.sequence = 0
+        self.errors = 0
+
+    def send(self, telemetry, relays: int, poll_ms: int, uart_us: int = 0, ctrl_us: int = 0, loop_us: int = 0) -> None:
+        flags = 0
+        if telemetry.enabled:
+            flags |= ENABLED
+        if telemetry.off_grid:
+            flags |= OFF_GRID
+        if telemetry.error is not None:
+            flags |= ERROR
+        struct.pack_into(
+            FORMAT,
+            self.record,
+            0,
+            VERSION,
+            self.sequence,
+            time.ticks_ms(),
+            time.time(),
+            telemetry.soc,
+            telemetry.current,
+            telemetry.voltage,
+            telemetry.cycles,
+            telemetry.count_L1,
+            telemetry.count_L2,
+            relays,
+            telemetry.control,
+            NONE if telemetry.overpower_L1 is None else telemetry.overpower_L1,
+            NONE if telemetry.overpower_L2 is None else telemetry.overpower_L2,
+            flags,
+            poll_ms,
+            uart_us,
+            ctrl_us,
+            loop_us,
+        )
+        struct.pack_into("<H", self.record, SIZE - 2, fletcher16(self.record, SIZE - 2))
+        self.frame[cobs_encode(self.record, self.frame)] = 0
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        try:
+            self.out.write(self.frame)
+        except OSError:
+            self.errors += 1  # USB not connected, the record is lost
@@ -0,0 +1,9 @@
+"""Firmware modules are imported on CPython through the stand-ins in host/."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import host  # noqa: E402
+
+host.install()
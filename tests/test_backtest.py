@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from host import backtest  # noqa: E402
+
+
+def synthetic(samples: int = 3000, seed: int = 1) -> backtest.Telemetry:
+    """SOC swinging across all SOC thresholds, current and counts across the others."""
+    rng = np.random.default_rng(seed)
+    soc = 50 + 49 * np.sin(np.linspace(0, 8 * np.pi, samples)) + rng.normal(0, 0.6, samples)
+    current = np.where(rng.random(samples) < 0.3, rng.uniform(-8, 8, samples), rng.uniform(-50, 40, samples))
+    return backtest.Telemetry(
+        time=np.arange(samples, dtype=np.int64) * 2,
+        soc=np.round(np.clip(soc, 0, 100), 1),
+        current=np.round(current, 2),
+        voltage=np.full(samples, 53.2),
+        count_L1=rng.integers(0, 40, samples),
+        count_L2=rng.integers(0, 40, samples),
+    )
+
+
+@pytest.mark.parametrize(
+    "thresholds",
+    [
+        backtest.Thresholds(),
+        backtest.Thresholds(heaters_on=60, heaters_off=55, full_soc=70, idle_current=2),
+        backtest.Thresholds(charge_current=5, discharge_current=-5, overpower_warning=5, overpower_limit=30),
+    ],
+)
+def test_vectorised_engine_matches_scalar_replay(thresholds):
+    telemetry = synthetic()
+    states, off_grid = backtest.replay_scalar(telemetry, thresholds)
+    codes = backtest.decision_code(*(array.astype(np.int64) for array in backtest.decisions(telemetry, thresholds)))
+    assert np.array_equal(backtest.relay_states(codes), states)
+    assert np.array_equal(backtest.hysteresis(telemetry.soc, thresholds.off_grid_on, thresholds.off_grid_off), off_grid)
+    assert len(np.unique(states)) > 2  # Heaters were switched in several combinations
+    assert 0 < off_grid.sum() < len(off_grid)
@@ -0,0 +1,73 @@
+import time
+
+import machine
+import models
+import pytest
+import seplos
+from host.clock import VirtualClock
+from host.devices import SeplosBMS
+
+FAILURES = ("garbage", "truncated", "badsum", "silent")
+
+
+def run(script: list[str]):
+    """One Battery.request stepped to the end against a scripted BMS, heaters all on."""
+    machine.Pin.board.clear()
+    machine.Timer.active.clear()
+    machine.UART.ports.clear()
+    clock = VirtualClock(epoch=0).install()
+    clock.pollers.append(machine.UART.service)
+    bms = SeplosBMS(script=script)
+    machine.UART.attach(0, bms)
+    battery = models.Battery(machine.UART(0, 19200))
+    pins = [machine.Pin(gpio, machine.Pin.OUT, value=0) for gpio in (6, 7, 14)]
+    heaters = models.OutputHeaters(pins, [0, 2], [1], min_switch_ms=0)
+    heaters.set_mask(0b111)
+    telemetry = models.Telemetry()
+    battery.request()
+    while not battery.step(heaters, telemetry):
+        time.sleep(0.01)
+    return bms, heaters, telemetry
+
+
+@pytest.mark.parametrize("mode", FAILURES)
+def test_failed_reply_is_retried(mode):
+    bms, heaters, telemetry = run([mode, mode])
+    assert bms.requests == 3
+    assert telemetry.error is None
+    assert telemetry.soc == 900
+    assert heaters.state() == 0b111  # Heaters stay on for two failures
+
+
+@pytest.mark.parametrize("mode", FAILURES)
+def test_third_failure_switches_heaters_off(mode):
+    bms, heaters, telemetry = run([mode] * 3)
+    assert bms.requests == 4
+    assert telemetry.error is None
+    assert heaters.state() == 0
+
+
+@pytest.mark.parametrize("mode", FAILURES)
+def test_gives_up_after_retries(mode):
+    bms, heaters, telemetry = run([mode] * 5)
+    assert bms.requests == 5
+    assert telemetry.error == "Battery data"
+    assert (telemetry.soc, telemetry.current, telemetry.voltage) == (0, -10000, 0)
+    assert heaters.state() == 0
+
+
+def test_empty_read_does_not_see_stale_eoi():
+    class EmptyUART:
+        pending = 1  # any() counted a byte that readinto does not deliver
+
+        def any(self) -> int:
+            pending, self.pending = self.pending, 0
+            return pending
+
+        def readinto(self, buf) -> int:
+            return 0
+
+    frame = seplos.TelemetryFrame()
+    frame.buf[-1] = seplos.EOI  # Left over from the previous frame
+    assert not frame.receive(EmptyUART())
+    assert frame.size == 0
@@ -0,0 +1,11 @@
+import pytest
+
+from host import bench
+
+
+def test_allocations_within_baseline():
+    baseline = bench.load_baseline()
+    if baseline is None:
+        pytest.skip(f"no bench baseline for Python {bench.version()}")
+    results = bench.run(["main_cycle", *bench.BENCHMARKS])
+    assert bench.compare(results, baseline, 0.0, 32, timings=False) == []
@@ -0,0 +1,61 @@
+import time
+
+import machine
+from host.clock import VirtualClock
+from host.devices import PulseMeter, SeplosBMS, seplos_frame
+
+
+class Recorder:
+    def __init__(self, every_ms: float) -> None:
+        self.every_ms = every_ms
+        self.calls = []
+        self.lookups = 0
+
+    def __getattr__(self, name):
+        if name == "next_ms":
+            self.lookups += 1
+            return self._next_ms
+        raise AttributeError(name)
+
+    def _next_ms(self, now_ms: float) -> float:
+        return (now_ms // self.every_ms + 1) * self.every_ms
+
+    def __call__(self, now_ms: float) -> None:
+        self.calls.append(now_ms)
+
+
+def install() -> VirtualClock:
+    machine.Pin.board.clear()
+    machine.Timer.active.clear()
+    machine.UART.ports.clear()
+    return VirtualClock(epoch=0).install()
+
+
+def test_pollers_run_only_when_due():
+    clock = install()
+    recorder = Recorder(250)
+    clock.pollers.append(recorder)
+    for _ in range(100):
+        time.sleep(0.01)
+    assert recorder.calls == [250, 500, 750, 1000]
+    assert recorder.lookups == 1
+    assert clock.events == 4
+
+
+def test_uart_reply_and_meter_load_are_events():
+    clock = install()
+    bms = SeplosBMS(latency_ms=20)
+    meter = PulseMeter(26)
+    machine.UART.attach(0, bms)
+    uart = machine.UART(0, 19200)
+    machine.Pin(26, machine.Pin.IN)
+    clock.pollers += [machine.Timer.service, machine.UART.service, meter]
+    time.sleep(1)
+    assert clock.events == 0
+    uart.write(seplos_frame(0, 0x46, 0x42, b"00"))
+    time.sleep(1)
+    assert clock.events == 1
+    assert uart.rx.endswith(b"\r")
+    meter.watts = 3600  # One pulse per 100 ms
+    time.sleep(1)
+    assert meter.pulses == 9  # The first event arms the meter, pulses follow every 100 ms
@@ -0,0 +1,24 @@
+import machine
+import models
+
+
+def test_l2_overpower_sheds_l2_heater_after_a_reading():
+    machine.Pin.board.clear()
+    pins = [machine.Pin(gpio, machine.Pin.OUT, value=0) for gpio in (6, 7, 14)]
+    heaters = models.OutputHeaters(pins, [0, 2], [1])
+    heaters.set_mask(0b111)
+    control = models.ControlLogic()
+    telemetry = models.Telemetry()
+    telemetry.soc = 950
+    telemetry.current = 0
+    control.update(telemetry, 0, 30)
+    assert telemetry.overpower_L1 is None
+    assert telemetry.overpower_L2 == -1
+    heaters.set_pins(telemetry.enabled, telemetry.overpower_L1, telemetry.overpower_L2, telemetry.control)
+    assert heaters.state() == 0b101
+
+
+def test_heaters_logic_returns_both_phases():
+    control = models.ControlLogic()
+    assert control.heaters_logic(95.0, 0.0, 15, 0) == (True, 0, None, 0)
+    assert control.heaters_logic(95.0, 0.0, 0, 15) == (True, None, 0, 0)
@@ -0,0 +1,29 @@
+import time
+
+import machine
+import models
+from host.clock import HostClock
+from host.devices import PulseMeter
+
+
+def setup(watts: float):
+    machine.Pin.board.clear()
+    clock = HostClock(fast=True).install()
+    meter = PulseMeter(26, watts)
+    clock.pollers.append(meter)
+    counter = models.Counter(machine.Pin(26, machine.Pin.IN))
+    return meter, counter
+
+
+def test_peek_keeps_pulses_for_the_reading():
+    meter, counter = setup(1000)
+    peeked = []
+    for _ in range(2):
+        time.sleep(3)  # OVERPOWER_DEADLINE_MS passes during an 8 s slow poll
+        peeked.append(counter.peek_scaled(2000))
+    time.sleep(2)
+    count = counter.get_count()
+    assert count == meter.pulses > 0
+    assert all(5 <= count <= 6 for count in peeked)  # 1000 W at 10 000 pulses/kWh are 5.6 per 2 s
+    assert 5 <= counter.scaled(count, 2000) <= 6
+
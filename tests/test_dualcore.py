@@ -0,0 +1,39 @@
+import dualcore
+import models
+import profiler
+from host.harness import scratch_dir
+
+
+def read_log() -> list[str]:
+    with open("log.csv") as file:
+        return file.read().splitlines()
+
+
+def test_queued_records_are_logged_by_drain():
+    handoff = dualcore.Handoff()
+    stages = profiler.Profiler(["uart"], 0)
+    stages["uart"].start()
+    stages["uart"].stop()
+    with scratch_dir():
+        logger = models.DataLogger("log.csv")
+        stages.dump(handoff)  # Resets the stage right after logging it
+        assert stages["uart"].count == 0
+        handoff.drain(logger)
+        logger.flush()
+        lines = read_log()
+    assert len(lines) == 1
+    assert "stage=uart;count=1;" in lines[0]
+
+
+def test_full_queue_drops():
+    handoff = dualcore.Handoff(queue_size=2)
+    for index in range(3):
+        handoff.log({"index": index})
+    assert handoff.dropped == 1
+    with scratch_dir():
+        logger = models.DataLogger("log.csv")
+        handoff.drain(logger)
+        logger.flush()
+        lines = read_log()
+    assert [line.split(";")[-1] for line in lines] == ["index=0", "index=1"]
+    assert not handoff.records
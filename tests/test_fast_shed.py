@@ -0,0 +1,61 @@
+import time
+
+import machine
+import models
+
+
+def setup(hold_ms: int = 60_000):
+    machine.Pin.board.clear()
+    pins = [machine.Pin(gpio, machine.Pin.OUT, value=0) for gpio in (6, 7, 14)]
+    heaters = models.OutputHeaters(pins, [0, 2], [1])
+    counter_L1 = models.Counter(machine.Pin(26, machine.Pin.IN))
+    counter_L2 = models.Counter(machine.Pin(27, machine.Pin.IN))
+    shed = models.FastShed(heaters, counter_L1, counter_L2, 26, hold_ms=hold_ms)
+    telemetry = models.Telemetry()
+    telemetry.enabled = True
+    return heaters, shed, telemetry
+
+
+def control(heaters, shed, telemetry, value: int = 1) -> None:
+    telemetry.overpower_L1 = None
+    telemetry.overpower_L2 = None
+    shed.hold(telemetry)
+    heaters.set_pins(telemetry.enabled, telemetry.overpower_L1, telemetry.overpower_L2, value)
+
+
+def test_shed_phase_is_held():
+    heaters, shed, telemetry = setup()
+    heaters.set_mask(0b111)
+    shed.shed_L1(time.ticks_us())
+    assert heaters.state() == 0b011
+    assert telemetry.overpower_L2 is None
+    for _ in range(10):
+        control(heaters, shed, telemetry)
+        assert heaters.state() == 0b011
+        assert telemetry.overpower_L1 == 0
+
+
+def test_other_phase_still_switches_on():
+    heaters, shed, telemetry = setup()
+    heaters.set_mask(0b101)
+    shed.shed_L1(time.ticks_us())
+    control(heaters, shed, telemetry)
+    assert heaters.state() == 0b011
+
+
+def test_hold_expires():
+    heaters, shed, telemetry = setup(hold_ms=50)
+    heaters.set_mask(0b111)
+    shed.shed_L1(time.ticks_us())
+    time.sleep_ms(50)
+    control(heaters, shed, telemetry)
+    assert heaters.state() == 0b111
+    assert shed.held == 0
+
+
+def test_nothing_held_without_shed():
+    heaters, shed, telemetry = setup()
+    shed.shed_L2(time.ticks_us())
+    assert shed.held == 0
+    control(heaters, shed, telemetry)
+    assert heaters.state() == 0b001
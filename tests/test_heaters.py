@@ -0,0 +1,107 @@
+import itertools
+
+import machine
+import models
+import pytest
+from host.clock import HostClock
+
+
+def setup(min_switch_ms: int):
+    machine.Pin.board.clear()
+    clock = HostClock(fast=True).install()
+    pins = [machine.Pin(gpio, machine.Pin.OUT, value=0) for gpio in (6, 7, 14)]
+    return clock, models.OutputHeaters(pins, [0, 2], [1], min_switch_ms=min_switch_ms)
+
+
+def test_switching_on_waits_for_min_switch_interval():
+    clock, heaters = setup(1800)
+    heaters.set_pins(True, None, None, 1)
+    assert heaters.state() == 0b001
+    for _ in range(3):
+        clock.sleep(0.5)  # Fast polling
+        heaters.set_pins(True, None, None, 1)
+        assert heaters.state() == 0b001
+    clock.sleep(0.5)
+    heaters.set_pins(True, None, None, 1)
+    assert heaters.state() == 0b011
+
+
+def test_switching_off_acts_at_once():
+    clock, heaters = setup(1800)
+    heaters.set_pins(True, None, None, 1)
+    clock.sleep(0.5)
+    heaters.set_pins(True, None, None, -1)
+    assert heaters.state() == 0
+    heaters.set_mask(0b111)
+    clock.sleep(0.5)
+    heaters.set_pins(True, -1, None, 0)
+    assert heaters.state() == 0b011
+    heaters.set_pins(False, None, None, 0)
+    assert heaters.state() == 0
+
+
+def test_without_interval_every_call_switches():
+    _, heaters = setup(0)
+    for expected in (0b001, 0b011, 0b111):
+        heaters.set_pins(True, None, None, 1)
+        assert heaters.state() == expected
+
+
+def turn_off_last(pins: list) -> None:
+    for pin in reversed(pins):
+        if pin.value():
+            pin.off()
+            return
+
+
+def turn_on_first(pins: list) -> None:
+    for pin in pins:
+        if not pin.value():
+            pin.on()
+            return
+
+
+def reference_set_pins(pins, indexes_L1, indexes_L2, enable, overpower_L1, overpower_L2, control) -> None:
+    """List based set_pins the bitmask version replaced."""
+    if not enable:
+        for pin in pins:
+            pin.off()
+        return
+    if overpower_L1 == -1:
+        turn_off_last([pins[index] for index in indexes_L1])
+    if overpower_L2 == -1:
+        turn_off_last([pins[index] for index in indexes_L2])
+    free = (overpower_L1 is None) << 1 | (overpower_L2 is None)
+    if control > 0:
+        turn_on_first(
+            [pin for index, pin in enumerate(pins) if (index in indexes_L1 and free & 2) or (index in indexes_L2 and free & 1)]
+        )
+    elif control < 0:
+        turn_off_last(pins)
+
+
+@pytest.mark.parametrize(
+    "gpios, indexes_L1, indexes_L2",
+    [([6, 7, 14], [0, 2], [1]), ([2, 3, 4, 5, 8], [0, 2, 4], [1, 3])],
+)
+@pytest.mark.parametrize("sio", [False, True])
+def test_set_pins_matches_list_based_version(gpios, indexes_L1, indexes_L2, sio):
+    machine.Pin.board.clear()
+    HostClock(fast=True).install()
+    pins = [machine.Pin(gpio, machine.Pin.OUT, value=0) for gpio in gpios]
+    reference = [machine.Pin(100 + index, machine.Pin.OUT, value=0) for index in range(len(gpios))]
+    heaters = models.OutputHeaters(pins, indexes_L1, indexes_L2, gpios if sio else None)
+    writes = machine.mem32.writes
+    for state in range(1 << len(pins)):
+        for enable, overpower_L1, overpower_L2, control in itertools.product(
+            (False, True), (-1, 0, None), (-1, 0, None), (-1, 0, 1)
+        ):
+            heaters.set_mask(state)
+            for index, pin in enumerate(reference):
+                pin.value(state >> index & 1)
+            heaters.set_pins(enable, overpower_L1, overpower_L2, control)
+            reference_set_pins(reference, indexes_L1, indexes_L2, enable, overpower_L1, overpower_L2, control)
+            expected = [pin.value() for pin in reference]
+            assert [pin.value() for pin in pins] == expected, (state, enable, overpower_L1, overpower_L2, control)
+            assert heaters.state() == sum(value << index for index, value in enumerate(expected))
+    assert (machine.mem32.writes > writes) == sio
@@ -0,0 +1,66 @@
+import history
+from host.history import read_archive
+
+DAY = 19_865 * 86400  # 2024-05-22
+
+
+def record(samples, directory) -> history.History:
+    telemetry_history = history.History(capacity=16, minutes=4, directory=str(directory))
+    for sample in samples:
+        telemetry_history.record(*sample)
+    telemetry_history.flush()
+    return telemetry_history
+
+
+def test_summed_current_beyond_16_bits(tmp_path):
+    samples = [
+        (DAY + 2 * index, 500, current, 5320, 3, 4, 1)
+        for index, current in enumerate((45_000, -45_000, 32_768, -32_769, 100))
+    ]
+    telemetry_history = record(samples, tmp_path)
+    ring = telemetry_history.ring
+    assert [ring.get(age, 2) for age in range(4, -1, -1)] == [45_000, -45_000, 32_768, -32_769, 100]
+    minutes = telemetry_history.minutes
+    assert minutes.minimum[1][0] == -45_000
+    assert minutes.maximum[1][0] == 45_000
+    (path,) = tmp_path.iterdir()
+    assert [sample[2] for sample in read_archive(str(path))] == [45_000, -45_000, 32_768, -32_769, 100]
+
+
+def test_archive_round_trip(tmp_path):
+    samples = [(DAY + 2 * index, 900 - index // 10, -1500 + index, 5300, index % 3, 0, index // 50) for index in range(200)]
+    record(samples, tmp_path)
+    (path,) = tmp_path.iterdir()
+    assert list(read_archive(str(path))) == samples
+
+
+def test_full_flash_drops_samples_and_recovers(tmp_path, monkeypatch):
+    full = True
+    real_open = open
+
+    def flaky_open(name, *args, **kwargs):
+        if full and str(name).endswith(".tlm"):
+            raise OSError(28, "ENOSPC")
+        return real_open(name, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", flaky_open)
+    telemetry_history = history.History(capacity=16, minutes=4, directory=str(tmp_path))
+    for index in range(2000):
+        telemetry_history.record(DAY + 2 * index, 500 + index % 7, index, 5320, 3, 4, 1)
+    assert telemetry_history.archive.dropped > 0
+    assert telemetry_history.archive.used <= telemetry_history.archive.block_size
+    full = False
+    later = [(DAY + 4000 + 2 * index, 600, -index, 5300, 1, 2, 0) for index in range(300)]
+    for sample in later:
+        telemetry_history.record(*sample)
+    telemetry_history.flush()
+    (path,) = tmp_path.iterdir()
+    assert list(read_archive(str(path)))[-300:] == later
+
+
+def test_only_newest_days_are_kept(tmp_path):
+    telemetry_history = history.History(capacity=16, minutes=4, directory=str(tmp_path), days=3)
+    for day in range(6):
+        telemetry_history.record(DAY + day * 86400 + 43200, 500, 0, 5320, 0, 0, 0)
+    telemetry_history.flush()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["20240525.tlm", "20240526.tlm", "20240527.tlm"]
@@ -0,0 +1,38 @@
+import lcd_1inch14
+import models
+import pytest
+
+
+def formatted(value: int, width: int, decimals: int = 2) -> str:
+    chars = bytearray(width)
+    models.format_fixed(chars, value, decimals)
+    return chars.decode()
+
+
+@pytest.mark.parametrize(
+    "value, text",
+    [(-10000, "-100.00"), (-10001, "-100.01"), (-30000, "-300.00"), (-99999, "-999.99"), (-512, "  -5.12"), (1234, "  12.34")],
+)
+def test_current_fits_field_with_sign(value, text):
+    assert formatted(value, 7) == text
+
+
+@pytest.mark.parametrize("value, text", [(-10000, "  -OVF"), (-100000, "  -OVF"), (100000, "   OVF")])
+def test_overflow_is_shown(value, text):
+    assert formatted(value, 6) == text
+
+
+def test_overflow_keeps_sign_in_current_field():
+    assert formatted(-100000, 7) == "   -OVF"
+    assert formatted(-100000000, 7) == "   -OVF"
+
+
+def test_lcd_shows_negative_current():
+    telemetry = models.Telemetry()
+    lcd = models.LCD(lcd_1inch14.LCD_1inch14(), None, telemetry)
+    telemetry.current = -10000
+    lcd.refresh()
+    assert lcd.current.shown == b"-100.00"
+    telemetry.current = -12000
+    lcd.refresh()
+    assert lcd.current.shown == b"-120.00"
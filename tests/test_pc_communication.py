@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+import pc_communication
+import pytest
+from host.devices import SeplosBMS, seplos_frame
+
+
+class FakePort:
+    """Blocking serial port answered by a simulated BMS."""
+
+    def __init__(self, bms: SeplosBMS) -> None:
+        self.bms = bms
+        self.timeout = 0.5
+        self.reply = b""
+        self.threads = set()
+
+    def reset_input_buffer(self) -> None:
+        self.reply = b""
+
+    def write(self, data: bytes) -> None:
+        self.threads.add(threading.get_ident())
+        self.reply = self.bms.handle(data) or b""
+
+    def read_until(self, expected: bytes = b"\n") -> bytes:
+        time.sleep(0.002)
+        reply, self.reply = self.reply, b""
+        return reply
+
+    def close(self) -> None:
+        pass
+
+
+class SlowSink:
+    def __init__(self) -> None:
+        self.records = []
+
+    def write(self, records: list[dict]) -> None:
+        time.sleep(0.3)
+        self.records += records
+
+    def close(self) -> None:
+        pass
+
+
+def test_decode_status():
+    record = pc_communication.decode_status(SeplosBMS().frame())
+    assert record["SOC"] == 90.0
+    assert record["cell_16"] == 3325
+
+
+def test_decode_rejects_other_cid1():
+    frame = seplos_frame(0, 0x47, 0x00, SeplosBMS().info())
+    with pytest.raises(ValueError):
+        pc_communication.decode_status(frame)
+
+
+def test_slow_writes_do_not_stop_polling():
+    port = FakePort(SeplosBMS())
+    counters = pc_communication.Counters()
+    writer = pc_communication.BatchWriter(SlowSink(), counters, flush_interval=0.05, batch_size=2)
+    poller = pc_communication.StatusPoller("fake", open_port=lambda *_: port)
+
+    async def session():
+        stop = asyncio.Event()
+        tasks = [
+            asyncio.create_task(poller.run(writer, counters, 0.02, stop)),
+            asyncio.create_task(writer.run(stop)),
+        ]
+        await asyncio.sleep(1.0)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(session())
+    assert counters.records >= 25  # About 40 polls, writes take 0.3 s each
+    assert counters.written > 0
+    assert threading.get_ident() not in port.threads
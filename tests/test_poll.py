@@ -0,0 +1,41 @@
+import models
+
+
+def scheduler() -> models.PollScheduler:
+    return models.PollScheduler(models.ControlLogic())
+
+
+def run(poll: models.PollScheduler, soc: int, current: int, readings: int = 10) -> int:
+    now = 0
+    for _ in range(readings):
+        poll.control.heaters(soc, current, 0, 0)
+        poll.update(soc, current, now)
+        now += poll.interval_ms
+    return poll.mode
+
+
+def test_steady_night_current_ends_slow():
+    poll = scheduler()
+    assert run(poll, 430, -560) == models.PollScheduler.SLOW
+    assert poll.interval_ms == 8000
+
+
+def test_idle_band_is_fast_near_full_soc():
+    poll = scheduler()
+    assert run(poll, 975, -560) == models.PollScheduler.FAST
+
+
+def test_charge_threshold_is_fast_only_with_heaters_enabled():
+    assert run(scheduler(), 500, 2100) == models.PollScheduler.SLOW
+    assert run(scheduler(), 920, 2100) == models.PollScheduler.FAST
+
+
+def test_soc_threshold_is_fast():
+    assert run(scheduler(), 398, -560) == models.PollScheduler.FAST
+
+
+def test_soc_threshold_counts_only_towards_a_change():
+    poll = scheduler()
+    assert run(poll, 300, 0) == models.PollScheduler.SLOW  # Parked at off_grid_off while on grid
+    poll.control.off_grid_enabled = True
+    assert run(poll, 300, 0) == models.PollScheduler.FAST
@@ -0,0 +1,20 @@
+import main
+import pytest
+from host.devices import SeplosBMS, SeplosBus
+from host.harness import World, run_runtime
+
+
+@pytest.mark.parametrize("per_cycle", [0, 1])
+def test_several_packs(monkeypatch, per_cycle):
+    monkeypatch.setattr(main, "PACK_ADDRESSES", [0, 1, 2, 3])
+    monkeypatch.setattr(main, "PACKS_PER_CYCLE", per_cycle)
+    packs = [SeplosBMS(adr=adr, latency_ms=5) for adr in (0, 1, 2, 3)]
+    for pack in packs:
+        pack.current = 90.0  # Summed current beyond 327.67 A
+    world = World(fast=False, bms=SeplosBus(packs))
+    tasks = run_runtime(2.5, world)
+    assert tasks.telemetry.error is None
+    assert tasks.stats["bms"].runs >= 2
+    assert tasks.stats["control"].runs >= 2
+    assert tasks.telemetry.current == 36000
+    assert all(pack.requests >= 1 for pack in packs)